@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from qgis.PyQt.QtCore import (
+    QObject,
+    QUrl,
+    pyqtSignal
+)
+from qgis.core import (
+    QgsApplication,
+    QgsSettings
+)
+
+from .store import (
+    RequestRecord
+)
+
+# get the logger for this QgisNetworkLogger plugin
+import logging
+from . import LOGGER_NAME
+log = logging.getLogger(LOGGER_NAME)
+
+"""
+Prefix of the QgsSettings keys in which the archive settings are kept
+"""
+SETTINGS_KEY = 'qgisnetworklogger/archive/'
+
+"""
+Name of the default archive database, in the QGIS profile directory
+"""
+DATABASE_NAME = 'networklogger.sqlite'
+
+"""
+The writer thread writes at most WRITE_BATCH requests in one transaction,
+and waits at most WRITE_DELAY seconds for more requests to fill a batch
+"""
+WRITE_BATCH = 500
+WRITE_DELAY = 0.5
+
+"""
+Number of archived requests read at once when paging through the archive
+"""
+PAGE_SIZE = 500
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS requests (
+        session REAL,
+        id INTEGER,
+        start_time REAL,
+        duration INTEGER,
+        operation TEXT,
+        url TEXT,
+        host TEXT,
+        status TEXT,
+        http_status INTEGER,
+        content_type TEXT,
+        received INTEGER,
+        total INTEGER,
+        replies INTEGER,
+        from_cache INTEGER,
+        initiator TEXT,
+        initiator_id TEXT,
+        thread TEXT,
+        error_code INTEGER,
+        error_string TEXT,
+        ssl_errors TEXT,
+        request_headers BLOB,
+        request_data BLOB,
+        reply_headers BLOB
+    )''',
+    'CREATE INDEX IF NOT EXISTS requests_start_time ON requests (start_time)',
+    'CREATE INDEX IF NOT EXISTS requests_host ON requests (host)',
+    'CREATE INDEX IF NOT EXISTS requests_status ON requests (status)',
+    'CREATE INDEX IF NOT EXISTS requests_duration ON requests (duration)'
+)
+
+COLUMNS = ('session', 'id', 'start_time', 'duration', 'operation', 'url', 'host', 'status', 'http_status',
+           'content_type', 'received', 'total', 'replies', 'from_cache', 'initiator', 'initiator_id', 'thread',
+           'error_code', 'error_string', 'ssl_errors', 'request_headers', 'request_data', 'reply_headers')
+
+INSERT = 'INSERT INTO requests ({}) VALUES ({})'.format(', '.join(COLUMNS), ', '.join('?' * len(COLUMNS)))
+
+SELECT = 'SELECT rowid, {} FROM requests'.format(', '.join(COLUMNS))
+
+
+def default_path():
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), DATABASE_NAME)
+
+
+def join_headers(raw_headers):
+    """
+    :param raw_headers: tuple of raw (header, value) tuples
+    :return: bytes, one 'header: value' line per header
+    """
+    return b'\n'.join(header + b': ' + value for header, value in raw_headers)
+
+
+def split_headers(blob):
+    """
+    :param blob: bytes from join_headers
+    :return: tuple of raw (header, value) tuples
+    """
+    if not blob:
+        return ()
+    return tuple(tuple(line.split(b': ', 1)) for line in blob.split(b'\n') if b': ' in line)
+
+
+def record_row(session, record):
+    """
+    Create the database row of a (finished) Request
+
+    :param session: float start time of the archive session
+    :param record: RequestRecord
+    :return: tuple with the values of COLUMNS
+    """
+    received, total = record.progress if record.progress else (0, 0)
+    return (session, record.id, record.start_time, record.time if record.end_ns is not None else None,
+            record.operation, record.url.url(), record.lower_host(), record.status,
+            record.http_status if isinstance(record.http_status, int) else None, record.content_type,
+            received, total, record.replies, 1 if record.from_cache else 0, record.initiator,
+            str(record.initiator_id) if record.initiator_id is not None else None, record.thread,
+            int(record.error_code), record.error_string,
+            '\n'.join(record.ssl_errors) if record.ssl_errors else None,
+            join_headers(record.raw_headers), record.raw_data, join_headers(record.raw_reply_headers))
+
+
+def row_record(row):
+    """
+    Recreate a (read only) RequestRecord from a database row, to be shown in
+    the same views as the captured Requests
+
+    :param row: tuple with the rowid and the values of COLUMNS
+    :return: RequestRecord
+    """
+    record = RequestRecord.__new__(RequestRecord)
+    for name in RequestRecord.__slots__:
+        if name != '__weakref__':
+            setattr(record, name, None)
+    (_, _, record.id, record.start_time, duration, record.operation, url, _, record.status, record.http_status,
+     record.content_type, received, total, record.replies, from_cache, record.initiator, record.initiator_id,
+     record.thread, record.error_code, record.error_string, ssl_errors, request_headers, record.raw_data,
+     reply_headers) = row
+    record.url = QUrl(url)
+    record.start_ns = 0
+    if duration is not None:
+        record.end_ns = duration * 1000000
+        record.time = duration
+    else:
+        record.time = record.start_time
+    record.progress = (received, total) if record.replies else None
+    record.from_cache = bool(from_cache)
+    record.ssl_errors = ssl_errors.split('\n') if ssl_errors else False
+    record.raw_headers = split_headers(request_headers)
+    record.raw_reply_headers = split_headers(reply_headers)
+    record.raw_data = record.raw_data or b''
+    record.size = 0
+    record.replied = True
+    return record
+
+
+class ArchiveSettings(object):
+    """
+    Whether finished Requests are archived, and in which database. Persisted
+    in the QgsSettings.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = ''
+        self.load()
+
+    def load(self):
+        settings = QgsSettings()
+        self.enabled = settings.value(SETTINGS_KEY + 'enabled', False, type=bool)
+        self.path = settings.value(SETTINGS_KEY + 'path', '', type=str) or default_path()
+
+    def save(self):
+        settings = QgsSettings()
+        settings.setValue(SETTINGS_KEY + 'enabled', self.enabled)
+        settings.setValue(SETTINGS_KEY + 'path', self.path)
+
+
+class SessionArchive(QObject):
+    """
+    SQLite database in which all finished Requests are archived, so they
+    survive clearing the store and closing QGIS, without being kept in memory.
+
+    The rows are created on the GUI thread (a cheap copy of the record) and
+    put in a queue. A background writer thread writes them in batched
+    transactions (of at most WRITE_BATCH rows), so the GUI never waits for the
+    disk. The database is in WAL mode, so it can be read (paged, newest
+    first, see read_page) on the GUI thread while the writer is busy.
+
+    When the database cannot be opened, the archive is closed (nothing is
+    queued anymore) and failed is emitted.
+    """
+
+    # signal with the path and the error message, emitted (from the writer
+    # thread) when the database could not be opened
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        # all Requests archived by this QGIS session get the same session
+        # value, as the Request ids start again for every session
+        self.session = time.time()
+        self.queue = queue.Queue()
+        self.reader = None
+        # set when the archive is closed, or could not be opened: add() does
+        # not queue rows anymore
+        self.closed = False
+        # the writer creates the database (schema) before it writes anything,
+        # so the GUI thread does not wait for it
+        self.writer = threading.Thread(target=self.write_loop, name='NetworkLoggerArchive', daemon=True)
+        self.writer.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def write_loop(self):
+        """
+        The writer thread: write the queued rows in batches, until the None
+        row (see close) is queued
+        """
+        try:
+            connection = self.connect()
+            with connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+        except sqlite3.Error as e:
+            log.warning('Could not open the archive {}: {}'.format(self.path, e))
+            self.closed = True
+            # forget what is queued already
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.failed.emit(self.path, str(e))
+            return
+
+        running = True
+        while running:
+            row = self.queue.get()
+            if row is None:
+                break
+            batch = [row]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    row = self.queue.get(timeout=WRITE_DELAY)
+                except queue.Empty:
+                    break
+                if row is None:
+                    running = False
+                    break
+                batch.append(row)
+            try:
+                with connection:
+                    connection.executemany(INSERT, batch)
+            except sqlite3.Error as e:
+                log.warning('Could not archive {} requests: {}'.format(len(batch), e))
+        connection.close()
+
+    def add(self, record):
+        """
+        Archive a (finished) Request, in the background
+
+        :param record: RequestRecord
+        """
+        if not self.closed:
+            self.queue.put(record_row(self.session, record))
+
+    def read_page(self, before=None, limit=PAGE_SIZE):
+        """
+        Read (on the GUI thread) a page of archived Requests, newest first
+
+        :param before: (start_time, rowid) key of the last Request of the
+        previous page, or None for the first page
+        :param limit: int maximum number of Requests to read
+        :return: list of (key, RequestRecord) tuples
+        """
+        try:
+            if self.reader is None:
+                self.reader = self.connect()
+            if before is None:
+                rows = self.reader.execute(SELECT + ' ORDER BY start_time DESC, rowid DESC LIMIT ?', (limit,))
+            else:
+                start_time, rowid = before
+                # a row value comparison, so SQLite searches the start_time
+                # index instead of scanning it
+                rows = self.reader.execute(SELECT + ' WHERE (start_time, rowid) < (?, ?) '
+                                           'ORDER BY start_time DESC, rowid DESC LIMIT ?',
+                                           (start_time, rowid, limit))
+            return [((row[3], row[0]), row_record(row)) for row in rows]
+        except sqlite3.Error as e:
+            log.warning('Could not read the archive {}: {}'.format(self.path, e))
+            return []
+
+    def close(self):
+        """
+        Write what is still queued and close the database
+        """
+        self.closed = True
+        self.queue.put(None)
+        self.writer.join(10)
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+import threading
+
+# NumPy is optional: without it, there is just no ColumnStore
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+The columns: name and numpy type
+"""
+COLUMNS = (
+    ('id', 'int64'),
+    ('start_ns', 'int64'),
+    # 0 while pending
+    ('end_ns', 'int64'),
+    # 0 without download progress (yet)
+    ('first_progress_ns', 'int64'),
+    # http status code, 0 when there is none (yet)
+    ('http_status', 'int16'),
+    ('bytes', 'int64'),
+    ('host_id', 'int32'),
+    ('method_id', 'int8'),
+    ('from_cache', 'bool')
+)
+
+
+class ColumnStore(object):
+    """
+    Columnar ring buffer of the (numeric) facts of the last 'capacity'
+    Requests, in NumPy arrays allocated at once (about 48 bytes per Request),
+    independent of the retention of the RequestRecord's. Filters, histograms
+    and percentiles over all these Requests are vectorized (see
+    ColumnSnapshot), instead of walking Python objects.
+
+    A Request is appended from the capture slot (on any thread), and gets
+    its absolute position in the ring (column_row of the record). Its row is
+    updated upon its reply and progress, as long as it is not overwritten.
+    Hosts and methods are stored as ids, see host_names and method_names.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.arrays = {name: numpy.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS}
+        # number of Requests appended ever (the next absolute position), and
+        # the absolute position of the first Request after the last clear
+        self.appended = 0
+        self.first = 0
+        self.host_ids = {}
+        self.host_names = []
+        self.method_ids = {}
+        self.method_names = []
+
+    @staticmethod
+    def available():
+        """
+        :return: True if NumPy is installed
+        """
+        return numpy is not None
+
+    def intern(self, value, ids, names):
+        value_id = ids.get(value)
+        if value_id is None:
+            value_id = ids[value] = len(names)
+            names.append(value)
+        return value_id
+
+    def append(self, record):
+        """
+        Append a new Request, can be called from any thread
+
+        :param record: RequestRecord, its column_row is set
+        """
+        with self.lock:
+            position = self.appended
+            row = position % self.capacity
+            arrays = self.arrays
+            arrays['id'][row] = record.id
+            arrays['start_ns'][row] = record.start_ns
+            arrays['end_ns'][row] = 0
+            arrays['first_progress_ns'][row] = 0
+            arrays['http_status'][row] = 0
+            arrays['bytes'][row] = 0
+            arrays['host_id'][row] = self.intern(record.url.host(), self.host_ids, self.host_names)
+            arrays['method_id'][row] = self.intern(record.operation, self.method_ids, self.method_names)
+            arrays['from_cache'][row] = False
+            # only now the row is part of the snapshots
+            self.appended += 1
+        record.column_row = position
+
+    def row(self, record):
+        """
+        :param record: RequestRecord
+        :return: int row of this Request in the arrays, or None when it was
+        overwritten (or never appended)
+        """
+        position = record.column_row
+        if position is None or position < self.span()[0]:
+            return None
+        return position % self.capacity
+
+    def update(self, record):
+        """
+        Update the row of a Request after its reply or download progress
+
+        :param record: RequestRecord
+        """
+        row = self.row(record)
+        if row is None:
+            return
+        arrays = self.arrays
+        if record.end_ns is not None:
+            arrays['end_ns'][row] = record.end_ns
+        if record.first_progress_ns is not None:
+            arrays['first_progress_ns'][row] = record.first_progress_ns
+        if isinstance(record.http_status, int) and record.http_status > 0:
+            arrays['http_status'][row] = record.http_status
+        arrays['bytes'][row] = record.received_bytes()
+        arrays['from_cache'][row] = bool(record.from_cache)
+
+    def clear(self):
+        """
+        Forget all Requests. The positions keep counting, so a Request
+        appended before can never update a row of a new one.
+        """
+        with self.lock:
+            self.first = self.appended
+
+    def span(self):
+        """
+        :return: (first, end) tuple with the absolute positions of the oldest
+        Request kept, and of the next Request
+        """
+        appended = self.appended
+        return max(self.first, appended - self.capacity), appended
+
+    def snapshot(self):
+        """
+        Take the columns of all kept Requests at once, so they have the same
+        length while new Requests are appended (by the capture threads)
+
+        :return: ColumnSnapshot
+        """
+        first, end = self.span()
+        start = first % self.capacity
+        stop = start + end - first
+        columns = {}
+        for name, array in self.arrays.items():
+            if stop <= self.capacity:
+                columns[name] = array[start:stop]
+            else:
+                # the kept rows wrap around the end of the ring
+                columns[name] = numpy.concatenate((array[start:], array[:stop - self.capacity]))
+        return ColumnSnapshot(columns, dict(self.host_ids), dict(self.method_ids))
+
+
+class ColumnSnapshot(object):
+    """
+    The columns (numpy arrays, oldest Request first) of the Requests in a
+    ColumnStore at one moment, with the vectorized filters and statistics
+    over them
+    """
+
+    def __init__(self, columns, host_ids, method_ids):
+        self.columns = columns
+        self.host_ids = host_ids
+        self.method_ids = method_ids
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def mask(self, host=None, method=None, min_status=None, max_status=None, finished=False):
+        """
+        Create the (vectorized) filter mask of the Requests
+
+        :param host: string host, or None for all
+        :param method: string http method, or None for all
+        :param min_status: int minimum http status code, or None
+        :param max_status: int maximum http status code, or None
+        :param finished: bool only the finished Requests
+        :return: numpy boolean array
+        """
+        mask = numpy.ones(len(self), dtype=bool)
+        if host is not None:
+            mask &= self['host_id'] == self.host_ids.get(host, -1)
+        if method is not None:
+            mask &= self['method_id'] == self.method_ids.get(method, -1)
+        if min_status is not None:
+            mask &= self['http_status'] >= min_status
+        if max_status is not None:
+            mask &= self['http_status'] <= max_status
+        if finished:
+            mask &= self['end_ns'] > 0
+        return mask
+
+    def durations_ms(self, mask=None):
+        """
+        :param mask: numpy boolean array from mask(), or None for all
+        :return: numpy float array with the durations (msec) of the finished
+        Requests in the mask
+        """
+        finished = self['end_ns'] > 0
+        if mask is not None:
+            finished &= mask
+        return (self['end_ns'][finished] - self['start_ns'][finished]) / 1e6
+
+    def phases_ms(self, mask=None):
+        """
+        :param mask: numpy boolean array from mask(), or None for all
+        :return: (wait, transfer) tuple of numpy float arrays with the server
+        wait and the transfer time (msec) of the finished Requests in the
+        mask which received bytes
+        """
+        transferred = (self['end_ns'] > 0) & (self['first_progress_ns'] > 0)
+        if mask is not None:
+            transferred &= mask
+        first_progress_ns = self['first_progress_ns'][transferred]
+        return ((first_progress_ns - self['start_ns'][transferred]) / 1e6,
+                (self['end_ns'][transferred] - first_progress_ns) / 1e6)
+
+    def percentiles(self, percentiles, mask=None):
+        """
+        :param percentiles: list of float percentiles (0 - 100)
+        :param mask: numpy boolean array from mask(), or None for all
+        :return: numpy array with the duration (msec) per percentile, or None
+        when there are no finished Requests
+        """
+        durations = self.durations_ms(mask)
+        if len(durations) == 0:
+            return None
+        return numpy.percentile(durations, percentiles)
+
+    def histogram(self, bins=50, mask=None):
+        """
+        :param bins: int number of bins, or a sequence of bin edges (msec)
+        :param mask: numpy boolean array from mask(), or None for all
+        :return: (counts, bin edges) tuple of numpy arrays of the durations
+        """
+        return numpy.histogram(self.durations_ms(mask), bins=bins)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+import json
+from datetime import datetime, timezone
+
+from qgis.PyQt.QtCore import (
+    QObject,
+    QTimer,
+    QUrl,
+    QUrlQuery,
+    pyqtSignal
+)
+from qgis.utils import (
+    pluginMetadata
+)
+
+"""
+Number of entries written per step of the export, after every step the
+GUI gets the chance to handle its events
+"""
+EXPORT_BATCH = 200
+
+
+def har_headers(raw_headers):
+    """
+    :param raw_headers: tuple of raw (header, value) tuples
+    :return: list of HAR header objects
+    """
+    return [{'name': header.decode('utf-8', errors='replace'), 'value': value.decode('utf-8', errors='replace')}
+            for header, value in raw_headers]
+
+
+def har_entry(record):
+    """
+    Create the HAR (1.2) entry of a Request
+
+    :param record: RequestRecord
+    :return: dictionary
+    """
+    started = datetime.fromtimestamp(record.start_time, timezone.utc).isoformat()
+    duration = record.time if record.end_ns is not None else -1
+    # without download progress, the whole duration is waiting
+    wait = record.wait_ms()
+    if wait is None or duration < 0:
+        wait = max(duration, 0)
+    receive = max(duration, 0) - wait if duration >= 0 else 0
+    received = record.received_bytes()
+    query = QUrlQuery(record.url).queryItems(QUrl.FullyDecoded)
+
+    request = {
+        'method': record.operation,
+        'url': record.url.url(),
+        'httpVersion': 'HTTP/1.1',
+        'cookies': [],
+        'headers': har_headers(record.raw_headers),
+        'queryString': [{'name': name, 'value': value} for name, value in query],
+        'headersSize': -1,
+        'bodySize': len(record.raw_data)
+    }
+    if record.raw_data:
+        mime_type = ''
+        for header, value in record.raw_headers:
+            if header.lower() == b'content-type':
+                mime_type = value.decode('utf-8', errors='replace')
+        request['postData'] = {
+            'mimeType': mime_type,
+            'text': record.raw_data.decode('utf-8', errors='replace')
+        }
+
+    http_status = record.http_status if isinstance(record.http_status, int) and record.http_status > 0 else 0
+    response = {
+        'status': http_status,
+        'statusText': record.error_string or '',
+        'httpVersion': 'HTTP/1.1',
+        'cookies': [],
+        'headers': har_headers(record.raw_reply_headers),
+        'content': {
+            'size': received,
+            'mimeType': record.content_type or ''
+        },
+        'redirectURL': '',
+        'headersSize': -1,
+        'bodySize': received if record.progress else -1
+    }
+
+    return {
+        'startedDateTime': started,
+        'time': max(duration, 0),
+        'request': request,
+        'response': response,
+        'cache': {},
+        'timings': {
+            'send': 0,
+            'wait': wait,
+            'receive': max(receive, 0)
+        },
+        '_id': record.id,
+        '_status': record.status,
+        '_fromCache': bool(record.from_cache),
+        '_initiator': record.initiator or '',
+        '_thread': record.thread or ''
+    }
+
+
+class HarExporter(QObject):
+    """
+    Exports Requests to a HAR (1.2) file, to be analysed in the standard HAR
+    tooling.
+
+    The file is streamed: the entries are created and written EXPORT_BATCH
+    at a time, from a (0 msec) timer, so the GUI keeps responding and the
+    whole JSON document is never in memory.
+    """
+
+    # signal with the number of written entries, and the total
+    progress = pyqtSignal(int, int)
+    # signal with an error message, empty when the export succeeded
+    finished = pyqtSignal(str)
+
+    def __init__(self, records, path, parent=None):
+        """
+        :param records: list of RequestRecord's to export
+        :param path: string path of the HAR file
+        """
+        super().__init__(parent)
+        self.records = records
+        self.path = path
+        self.file = None
+        self.written = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.write_batch)
+
+    def start(self):
+        try:
+            self.file = open(self.path, 'w', encoding='utf-8')
+            creator = {
+                'name': 'QGIS Network Logger',
+                'version': pluginMetadata(__name__.split('.')[0], 'version')
+            }
+            self.file.write('{{"log": {{"version": "1.2", "creator": {}, "pages": [], "entries": [\n'
+                            .format(json.dumps(creator)))
+        except OSError as e:
+            self.stop(str(e))
+            return
+        self.timer.start()
+
+    def write_batch(self):
+        """
+        Write the next EXPORT_BATCH entries, and close the file after the last
+        """
+        try:
+            for record in self.records[self.written:self.written + EXPORT_BATCH]:
+                if self.written > 0:
+                    self.file.write(',\n')
+                self.file.write(json.dumps(har_entry(record)))
+                self.written += 1
+            self.progress.emit(self.written, len(self.records))
+            if self.written >= len(self.records):
+                self.file.write('\n]}}\n')
+                self.stop('')
+        except OSError as e:
+            self.stop(str(e))
+
+    def cancel(self):
+        if self.timer.isActive():
+            self.stop('Export canceled')
+
+    def stop(self, message):
+        self.timer.stop()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.records = []
+        self.finished.emit(message)
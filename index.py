@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+import re
+import time
+from bisect import bisect_left
+from collections import deque
+from urllib.parse import unquote_plus
+
+from qgis.PyQt.QtCore import (
+    QObject,
+    QTimer,
+    pyqtSignal
+)
+
+"""
+A token is a (lowercase) word of letters, digits and underscores, tokens
+shorter than MIN_TOKEN_LENGTH are not indexed
+"""
+TOKEN = re.compile(r'\w+')
+MIN_TOKEN_LENGTH = 2
+
+"""
+Only the first MAX_CONTENT_BYTES of the (POST) content of a Request are
+indexed, to not spend too much time and memory on big uploads
+"""
+MAX_CONTENT_BYTES = 256 * 1024
+
+"""
+Maximum number of searched texts of which the results are kept (and kept
+up to date), the oldest are forgotten
+"""
+MAX_CACHED_SEARCHES = 32
+
+"""
+New and removed tokens are merged into the sorted tokens (at once) when
+there are more than MAX_PENDING_TOKENS of them, instead of inserting or
+deleting every token in a long list
+"""
+MAX_PENDING_TOKENS = 4096
+
+"""
+The index is built in steps of (about) BUILD_SLICE msec, between which the
+GUI thread handles its events
+"""
+BUILD_SLICE = 20
+
+
+def tokenize(text):
+    """
+    Split a text in its (lowercase) tokens
+
+    :param text: string
+    :return: set of strings
+    """
+    return {token for token in TOKEN.findall(text.lower()) if len(token) >= MIN_TOKEN_LENGTH}
+
+
+def decode(raw):
+    return raw.decode('utf-8', errors='replace')
+
+
+class SearchIndex(QObject):
+    """
+    Inverted index of the text of all retained Requests of a CaptureStore:
+    the (decoded) url with its query items, the request and reply headers and
+    the POST content. It maps every token to the set of ids of the Requests
+    having it, and keeps all tokens sorted, so the tokens starting with a
+    word are found with a binary search. New and removed tokens are merged
+    into the sorted tokens in batches, see MAX_PENDING_TOKENS.
+
+    Tokenizing costs time, so the index is only built upon the first search,
+    from the retained Requests, in steps of BUILD_SLICE msec on a timer, so
+    the GUI does not freeze. Until it is built a search has no results,
+    indexBuilt is emitted when it is. Meanwhile, and from then on, it is
+    maintained incrementally by the CaptureStore: Requests are added when
+    created, their Reply headers when finished, and they are removed again
+    upon eviction. The tokens of a Request are not kept, they are just
+    calculated again when it is removed.
+
+    A search looks for tokens starting with the searched words, so it also
+    works while the user is still typing. As a filter searches the same text
+    for every Request, the results of the last MAX_CACHED_SEARCHES texts are
+    cached, and updated for every added or removed Request (instead of
+    searching again).
+    """
+
+    # emitted when the index is built, the searches before had no results
+    indexBuilt = pyqtSignal()
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.built = False
+        # the RequestRecord's still to be indexed while building, or None
+        self.unindexed = None
+        self.build_timer = QTimer(self)
+        self.build_timer.setSingleShot(True)
+        self.build_timer.timeout.connect(self.build_step)
+        # token -> set of Request ids, and all tokens, sorted. The tokens
+        # that are not merged into the sorted tokens yet are in new_tokens,
+        # and the removed tokens still in the sorted tokens in removed_tokens
+        self.postings = {}
+        self.tokens = []
+        self.new_tokens = set()
+        self.removed_tokens = set()
+        # searched word -> set of ids of the Requests with a token starting
+        # with it, and searched text -> (words, set of ids or None)
+        self.word_ids = {}
+        self.cache = {}
+
+    def request_tokens(self, record):
+        """
+        :param record: RequestRecord
+        :return: set of tokens of the url, headers and content of the Request
+        """
+        tokens = tokenize(unquote_plus(record.url.url()))
+        for header, value in record.raw_headers:
+            tokens |= tokenize(decode(header))
+            tokens |= tokenize(decode(value))
+        if record.raw_data:
+            tokens |= tokenize(decode(record.raw_data[:MAX_CONTENT_BYTES]))
+        return tokens
+
+    def reply_tokens(self, record):
+        """
+        :param record: RequestRecord
+        :return: set of tokens of the reply headers of the Request
+        """
+        tokens = set()
+        for header, value in record.raw_reply_headers:
+            tokens |= tokenize(decode(header))
+            tokens |= tokenize(decode(value))
+        return tokens
+
+    def is_building(self):
+        return self.unindexed is not None
+
+    def build(self):
+        """
+        Start indexing all retained Requests of the store, see build_step
+        """
+        if self.built or self.is_building():
+            return
+        self.unindexed = deque(self.store.records.values())
+        self.build_timer.start(0)
+
+    def build_step(self):
+        """
+        Index the next retained Requests, for about BUILD_SLICE msec. When
+        all are indexed, sort the tokens and emit indexBuilt
+        """
+        deadline = time.perf_counter() + BUILD_SLICE / 1000
+        postings = self.postings
+        records = self.store.records
+        unindexed = self.unindexed
+        while unindexed and time.perf_counter() < deadline:
+            for _ in range(min(100, len(unindexed))):
+                record = unindexed.popleft()
+                if records.get(record.id) is not record:
+                    # evicted meanwhile
+                    continue
+                for token in self.request_tokens(record) | self.reply_tokens(record):
+                    ids = postings.get(token)
+                    if ids is None:
+                        postings[token] = {record.id}
+                    else:
+                        ids.add(record.id)
+        if unindexed:
+            self.build_timer.start(0)
+            return
+        self.unindexed = None
+        self.built = True
+        # sort once, instead of inserting every token in order. This includes
+        # the tokens of the Requests added while building
+        self.tokens = sorted(postings)
+        self.new_tokens = set()
+        self.removed_tokens = set()
+        self.indexBuilt.emit()
+
+    def add_tokens(self, tokens, request_id):
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                self.postings[token] = {request_id}
+                if token in self.removed_tokens:
+                    # still in the sorted tokens
+                    self.removed_tokens.discard(token)
+                else:
+                    self.new_tokens.add(token)
+            else:
+                ids.add(request_id)
+        self.merge_tokens()
+        # update the cached results this Request now matches
+        for word, ids in self.word_ids.items():
+            if request_id not in ids and any(token.startswith(word) for token in tokens):
+                ids.add(request_id)
+        for words, ids in self.cache.values():
+            if ids is not None and request_id not in ids and \
+                    all(request_id in self.word_ids[word] for word in words):
+                ids.add(request_id)
+
+    def add_request(self, record):
+        """
+        Index a new Request
+
+        :param record: RequestRecord
+        """
+        if self.built or self.is_building():
+            self.add_tokens(self.request_tokens(record), record.id)
+
+    def add_reply(self, record):
+        """
+        Index the Reply of a (finished) Request
+
+        :param record: RequestRecord
+        """
+        if self.built or self.is_building():
+            self.add_tokens(self.reply_tokens(record), record.id)
+
+    def remove(self, records):
+        """
+        Remove (evicted) Requests from the index
+
+        :param records: list of RequestRecord's
+        """
+        if not self.built and not self.is_building():
+            return
+        for record in records:
+            for token in self.request_tokens(record) | self.reply_tokens(record):
+                ids = self.postings.get(token)
+                if ids is None:
+                    continue
+                ids.discard(record.id)
+                if not ids:
+                    del self.postings[token]
+                    if token in self.new_tokens:
+                        self.new_tokens.discard(token)
+                    else:
+                        self.removed_tokens.add(token)
+            for ids in self.word_ids.values():
+                ids.discard(record.id)
+            for _, ids in self.cache.values():
+                if ids is not None:
+                    ids.discard(record.id)
+        self.merge_tokens()
+
+    def merge_tokens(self):
+        """
+        Merge the new and removed tokens into the sorted tokens, when there
+        are more than MAX_PENDING_TOKENS of them
+        """
+        if len(self.new_tokens) + len(self.removed_tokens) <= MAX_PENDING_TOKENS:
+            return
+        removed_tokens = self.removed_tokens
+        tokens = [token for token in self.tokens if token not in removed_tokens]
+        tokens.extend(self.new_tokens)
+        # one sorted run and a short unsorted one: (about) linear
+        tokens.sort()
+        self.tokens = tokens
+        self.new_tokens = set()
+        self.removed_tokens = set()
+
+    def clear(self):
+        if self.unindexed is not None:
+            # the build finishes with the next step
+            self.unindexed.clear()
+        self.postings = {}
+        self.tokens = []
+        self.new_tokens = set()
+        self.removed_tokens = set()
+        self.word_ids = {}
+        self.cache = {}
+
+    def close(self):
+        """
+        Stop building
+        """
+        self.build_timer.stop()
+        self.unindexed = None
+
+    def search_token(self, word):
+        """
+        :param word: string (lowercase) token or beginning of a token
+        :return: set of ids of the Requests having a token starting with word
+        """
+        ids = set()
+        tokens = self.tokens
+        position = bisect_left(tokens, word)
+        while position < len(tokens) and tokens[position].startswith(word):
+            # None for a removed token
+            token_ids = self.postings.get(tokens[position])
+            if token_ids is not None:
+                ids |= token_ids
+            position += 1
+        for token in self.new_tokens:
+            if token.startswith(word):
+                ids |= self.postings[token]
+        return ids
+
+    def search(self, text):
+        """
+        Return the ids of the Requests having all words of this text (or
+        tokens starting with them)
+
+        :param text: string
+        :return: set of Request ids (empty while the index is not built yet),
+        or None when the text has no words
+        """
+        cached = self.cache.get(text)
+        if cached is not None:
+            return cached[1]
+        if not self.built:
+            self.build()
+            return set() if TOKEN.search(text) else None
+        words = TOKEN.findall(text.lower())
+        ids = None
+        for word in words:
+            word_ids = self.word_ids.get(word)
+            if word_ids is None:
+                word_ids = self.word_ids[word] = self.search_token(word)
+            ids = set(word_ids) if ids is None else ids & word_ids
+        if len(self.cache) >= MAX_CACHED_SEARCHES:
+            # forget the oldest search, and the words only it used
+            del self.cache[next(iter(self.cache))]
+            used = {word for cached_words, _ in self.cache.values() for word in cached_words}
+            self.word_ids = {word: ids for word, ids in self.word_ids.items() if word in used or word in words}
+        self.cache[text] = (words, ids)
+        return ids
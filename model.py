@@ -12,18 +12,20 @@
 # https://doc.qt.io/qt-5/qtwidgets-itemviews-editabletreemodel-example.html#design
 
 
-import time
+import weakref
 
 from qgis.PyQt.QtCore import (
     QAbstractItemModel,
+    QAbstractTableModel,
     QSortFilterProxyModel,
     QModelIndex,
     Qt,
-    QUrlQuery
+    QTimer,
+    QUrlQuery,
+    pyqtSignal
 )
 from qgis.PyQt.QtWidgets import (
-    QApplication,
-    QAction
+    QApplication
 )
 from qgis.PyQt.QtGui import (
     QBrush,
@@ -32,14 +34,20 @@ from qgis.PyQt.QtGui import (
     QDesktopServices
 )
 from qgis.PyQt.QtNetwork import (
-    QNetworkAccessManager,
     QNetworkRequest,
     QNetworkReply
 )
-from qgis.core import (
-    QgsNetworkAccessManager,
-    QgsNetworkReplyContent,
-    QgsNetworkRequestParameters
+
+from .store import (
+    PENDING,
+    COMPLETE,
+    ERROR,
+    TIMEOUT,
+    CANCELED
+)
+from .query import (
+    compile_query,
+    QueryError
 )
 
 # get the logger for this QgisNetworkLogger plugin
@@ -53,19 +61,196 @@ Custom role to be able to keep the Status in the model data
 STATUS_ROLE = Qt.UserRole + 1
 
 """
-Constants for the different 'Statuses' a NetworkRequest can be in.
+Custom role with the (typed) key to sort a column on, see COLUMNS
+"""
+SORT_ROLE = Qt.UserRole + 2
+
+"""
+Style of items which (or whose Request) had SSL errors, next to the Statuses
 """
-PENDING = 'PENDING'
-COMPLETE = 'COMPLETE'
-ERROR = 'ERROR'
-TIMEOUT = 'TIMEOUT'
-CANCELED = 'CANCELED'
+SSL_ERRORS = 'SSL_ERRORS'
 
 """
-Constant for the amount of nodes to keep available, to be able to limit
-the number of nodes to retain and paint in the Views
+Interval (in msec) during which download progress updates are collected
+before the views are notified about them in one dataChanged signal
+"""
+PROGRESS_INTERVAL = 100
+
+"""
+Interval (in msec) during which new requests are collected before they are
+inserted in the model as one block of rows
+"""
+INSERT_INTERVAL = 50
+
 """
-NODES2RETAIN = 45  # put in some settings dialog?
+Maximum number of rows renumbered after one batch of Requests is removed
+from the middle (see ActivityTreeItem.remove_children), so eviction takes
+about the same time for any number of retained Requests. The rows which
+are not renumbered yet are found with a binary search.
+"""
+RENUMBER_BATCH = 5000
+
+"""
+Interval (in msec) the filter string has to be unchanged before the
+requests are filtered with it
+"""
+FILTER_DELAY = 200
+
+
+def duration(record):
+    # msec, -1 for Requests without a reply (yet)
+    return record.time if record.end_ns is not None else -1
+
+
+def phase_sort_key(value):
+    # -1 for Requests without download progress (yet)
+    return value if value is not None else -1
+
+
+def format_msec(value):
+    return '{:.0f} msec'.format(value) if value is not None else ''
+
+
+def format_rate(rate):
+    """
+    :param rate: float bytes per second, or None
+    :return: string rate in kB/s
+    """
+    return '{:.1f} kB/s'.format(rate / 1024) if rate is not None else ''
+
+
+def cache_source(record):
+    if not record.replied:
+        return ''
+    return 'cache' if record.from_cache else 'network'
+
+
+def http_status(record):
+    # -1 for Requests without (a reply with) a http status
+    return record.http_status if isinstance(record.http_status, int) else -1
+
+
+def create_brushes():
+    """
+    Create the brushes to paint Requests with, per style (a Status or
+    SSL_ERRORS)
+
+    :return: dictionary
+    """
+    return {
+        SSL_ERRORS: QBrush(QColor(180, 65, 210)),
+        PENDING: QBrush(QColor(0, 0, 0, 100)),
+        CANCELED: QBrush(QColor(0, 0, 0, 100)),
+        ERROR: QBrush(QColor(235, 10, 10)),
+        TIMEOUT: QBrush(QColor(235, 10, 10)),
+        COMPLETE: QBrush(QColor(0, 0, 0))
+    }
+
+
+def record_style(record):
+    """
+    Return the key of the brush to paint a Request with, a Status or
+    SSL_ERRORS
+    """
+    return SSL_ERRORS if record.ssl_errors else record.status
+
+
+def record_tooltip(record):
+    """
+    Return the (html) tooltip of a Request, with a summary of its reply
+
+    :param record: RequestRecord
+    :return: string
+    """
+    bytes = 'unknown'
+    if record.progress:
+        rec, tot = record.progress
+        if rec > 0 and rec < tot:
+            bytes = '{}/{}'.format(rec, tot)
+        elif rec > 0 and rec == tot:
+            bytes = '{}'.format(tot)
+    # ?? adding <br/> instead of \n after (very long) url seems to break url up
+    # COMPLETE, Status: 200 - text/xml; charset=utf-8 - 2334 bytes - 657 milliseconds
+    tooltip = "{}<br/>{} - Status: {} - {} - {} bytes - {} msec - {} replies" \
+        .format(record.url.url(), record.status, record.http_status, record.content_type, bytes, record.time,
+                record.replies)
+    wait_ms = record.wait_ms()
+    if wait_ms is not None:
+        # tells a slow server (wait) apart from a slow connection (transfer)
+        tooltip += "<br/>Wait: {} - Transfer: {} - {}".format(format_msec(wait_ms), format_msec(record.transfer_ms()),
+                                                            format_rate(record.download_rate()) or 'rate unknown')
+    return tooltip
+
+
+def open_url(record):
+    """Open (GET) the url of this Request in the default browser of the user
+
+    :param record: RequestRecord
+    """
+    QDesktopServices.openUrl(record.url)
+
+
+def copy_as_curl(record):
+    """Get url + headers + data of this Request and create a full curl
+    command. Copy that to clipboard
+
+    :param record: RequestRecord
+    """
+    curl_headers = ''
+    for header, value in record.headers:
+        curl_headers += "-H '{}: {}' ".format(header, value)
+    curl_data = ''
+    if record.operation in ('POST', 'PUT'):
+        curl_data = "--data '{}' ".format(record.data)
+    curl_cmd = "curl '{}' {} {}--compressed".format(record.url.url(), curl_headers, curl_data)
+    QApplication.clipboard().setText(curl_cmd)
+
+
+def row_ranges(rows):
+    """
+    Group rows in contiguous ranges, to remove them with one beginRemoveRows
+    per range. The last range comes first, so removing a range does not move
+    the rows of the ranges still to be removed.
+
+    :param rows: list of int (ascending) rows
+    :return: list of [first, last] ranges of rows, the last range first
+    """
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+    ranges.reverse()
+    return ranges
+
+
+"""
+The columns of the column mode of the ActivityModel: a (header, text
+function, sort key function) tuple per column. The functions get the
+RequestRecord of a Request. Every column has sort keys of one type, so the
+ActivityProxyModel sorts numbers numerically (SORT_ROLE).
+"""
+COLUMNS = (
+    ('Id', lambda record: str(record.id), lambda record: record.id),
+    ('Method', lambda record: record.operation, lambda record: record.operation),
+    ('Host', lambda record: record.url.host(), lambda record: record.lower_host()),
+    ('Path', lambda record: record.url.path(), lambda record: record.url.path()),
+    ('Status', lambda record: str(record.http_status) if http_status(record) > 0 else record.status,
+     http_status),
+    ('Content type', lambda record: record.content_type or '', lambda record: record.content_type or ''),
+    ('Bytes', lambda record: str(record.received_bytes()) if record.progress else '',
+     lambda record: record.received_bytes()),
+    ('Duration', lambda record: '{} msec'.format(record.time) if record.end_ns is not None else '',
+     duration),
+    ('Wait', lambda record: format_msec(record.wait_ms()), lambda record: phase_sort_key(record.wait_ms())),
+    ('Transfer', lambda record: format_msec(record.transfer_ms()),
+     lambda record: phase_sort_key(record.transfer_ms())),
+    ('Rate', lambda record: format_rate(record.download_rate()),
+     lambda record: phase_sort_key(record.download_rate())),
+    ('Cache', cache_source, cache_source),
+    ('Initiator', lambda record: record.initiator or '', lambda record: record.initiator or '')
+)
 
 
 class ActivityModel(QAbstractItemModel):
@@ -74,14 +259,14 @@ class ActivityModel(QAbstractItemModel):
     and Responses.
 
     Is responsible for:
-    - connecting to current QgsNetworkAccessManager, which creates all
-    kind of signals to which we connect to be able to show information
-    about it in the Treeview
+    - following the (headless) CaptureStore, which connects to the current
+    QgsNetworkAccessManager and keeps a RequestRecord per Request, to be
+    able to show information about them in the Treeview
 
     Upon every network event (like a request to be created, finished etc),
-    an ActivityTreeItem (an QAbstractItem) is created to get the data
-    needed to be returned upon request of the View which uses this model.
-    In our case a QTreeview in a DockWidget
+    the store emits a signal, upon which an ActivityTreeItem (an QAbstractItem)
+    is created or updated to get the data needed to be returned upon request
+    of the View which uses this model. In our case a QTreeview in a DockWidget
 
     The model when being used looks more or less like this:
 
@@ -92,106 +277,232 @@ class ActivityModel(QAbstractItemModel):
                 |__ RequestQueryItems ('Query' holding query info)
                       |__ RequestDetailsItem (key-value pairs with info)
                 |__ RequestHeadersItem ('Headers')
-                      |__ RequestDetailsItem (key-value pairs with info)
+                      |__ HeaderDetailsItem (key-value pairs with info)
                 |__ PostContentItem (showing Data in case of POST)
                       |__ PostDetailsItem (key-value pairs with info)
            |__ReplyItem (holding Reply details)
+                |__ ReplyDetailsItem (key-value pairs with info)
                 |__ ReplyHeadersItem ('Headers')
-                      |__ ReplyDetailsItem (key-value pairs with info)
+                      |__ HeaderDetailsItem (key-value pairs with info)
         ...
       |__RequestParentItem (showing id, type (GET etc) url)
         ...
 
+    A RequestParentItem only refers to the RequestRecord holding the compact
+    raw capture of its request and reply. All children below it are only
+    created when the node is expanded for the first time (see canFetchMore
+    and fetchMore), as most requests are never looked at in detail.
+
+    In column mode, the Requests are shown in the COLUMNS (id, method, host,
+    path...) instead of in one text. Every column has typed (and cached) sort
+    keys in the SORT_ROLE, for the ActivityProxyModel to sort on.
+
     """
-    def __init__(self, parent=None):
+    def __init__(self, store, parent=None):
         super().__init__(parent)
         self.root_item = RootItem()
 
-        self.is_paused = False
-
-        # nam = NAM = NetworkAccessManager is a singleton who is responsible
-        # for all network requests, use of proxy etc etc
-        self.nam = QgsNetworkAccessManager.instance()
+        # the CaptureStore with all RequestRecord's, this model only follows it
+        self.store = store
 
         # dictionary with all Requests (actually RequestParentItem's)
-        # the requestId() of a QgsNetworkRequestParameters is the name/key in
-        # this dictionary. This requestId is just an unique counter from the
-        # NAM
+        # the id of their RequestRecord (the requestId() of the
+        # QgsNetworkRequestParameters) is the name/key in this dictionary.
+        # This requestId is just an unique counter from the NAM
         self.requests_items = {}
 
-        # let us connect to all signals the NAM is throwing so we can react:
-        self.nam.requestAboutToBeCreated[QgsNetworkRequestParameters]\
-            .connect(self.request_about_to_be_created)
-        self.nam.finished[QgsNetworkReplyContent].connect(self.request_finished)
-        self.nam.requestTimedOut[QgsNetworkRequestParameters]\
-            .connect(self.request_timed_out)
-        self.nam.downloadProgress.connect(self.download_progress)
-        self.nam.requestEncounteredSslErrors.connect(self.ssl_errors)
-
-    # slot for nam.requestAboutToBeCreated[QgsNetworkRequestParameters]
-    def request_about_to_be_created(self, request_params):
+        # download progress is recorded on the records immediately, but the
+        # views are only notified once per progress_interval msec, for all
+        # items that changed in that interval at once
+        self.progress_interval = PROGRESS_INTERVAL
+        self.progress_items = set()
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setSingleShot(True)
+        self.progress_timer.timeout.connect(self.flush_progress)
+
+        # new requests are queued in pending_items, and inserted as one
+        # contiguous block of rows every insert_interval msec
+        self.insert_interval = INSERT_INTERVAL
+        self.pending_items = []
+        self.insert_timer = QTimer(self)
+        self.insert_timer.setSingleShot(True)
+        self.insert_timer.timeout.connect(self.flush_inserts)
+
+        # brushes and fonts are created once and shared by all items, per
+        # style (see ActivityTreeItem.style), as data() is called for every
+        # visible row on every repaint
+        self.brushes = create_brushes()
+        self.font = QFont()
+        self.canceled_font = QFont()
+        self.canceled_font.setStrikeOut(True)
+
+        # one column with all information in one text, or all COLUMNS
+        self.column_mode = False
+
+        # let us connect to all signals the store is throwing so we can react:
+        self.store.requestAdded.connect(self.request_added)
+        self.store.requestFinished.connect(self.request_finished)
+        self.store.requestTimedOut.connect(self.request_timed_out)
+        self.store.requestProgress.connect(self.download_progress)
+        self.store.requestSslErrors.connect(self.ssl_errors)
+        self.store.requestsEvicted.connect(self.requests_evicted)
+        self.store.cleared.connect(self.store_cleared)
+
+        # and show the Requests captured before this model was attached
+        for record in self.store.records.values():
+            self.request_added(record)
+        self.flush_inserts()
+
+    # slot for store.requestAdded
+    def request_added(self, record):
+        request_item = RequestParentItem(record)
+        self.requests_items[record.id] = request_item
+        self.pending_items.append(request_item)
+        if not self.insert_timer.isActive():
+            self.insert_timer.start(self.insert_interval)
+
+    def flush_inserts(self):
+        """
+        Insert all Requests which were created since the last flush in the
+        model, as one block of rows
+        """
+        if not self.pending_items:
+            return
         child_count = len(self.root_item.children)
-        self.beginInsertRows(QModelIndex(), child_count, child_count)
-        self.requests_items[request_params.requestId()] = \
-            RequestParentItem(request_params, self.root_item)
+        self.beginInsertRows(QModelIndex(), child_count, child_count + len(self.pending_items) - 1)
+        for request_item in self.pending_items:
+            self.root_item.append_child(request_item)
+        self.pending_items = []
         self.endInsertRows()
 
-        if child_count > (NODES2RETAIN*1.2):  # 20% more as buffer
-            self.pop_nodes(child_count-NODES2RETAIN)
+    def tree_item(self, record):
+        """
+        Return the RequestParentItem of this record if it is in the tree,
+        else None (not inserted yet, or already evicted)
 
-    # slot for nam.finished[QgsNetworkReplyContent]
-    def request_finished(self, reply):
-        if not reply.requestId() in self.requests_items:
+        :param record: RequestRecord
+        :return: RequestParentItem or None
+        """
+        request_item = self.requests_items.get(record.id)
+        if request_item is None or request_item.parent is not self.root_item:
+            return None
+        return request_item
+
+    def record_index(self, record):
+        """
+        :param record: RequestRecord
+        :return: QModelIndex of the Request of this record, invalid if it is
+        not in the tree
+        """
+        request_item = self.tree_item(record)
+        if request_item is None:
+            return QModelIndex()
+        return self.createIndex(request_item.position(), 0, request_item)
+
+    # slot for store.requestFinished
+    def request_finished(self, record):
+        request_item = self.tree_item(record)
+        if request_item is None:
             return
-        request_item = self.requests_items[reply.requestId()]
         # find the row: the position of the RequestParentItem in the rootNode
         request_index = self.createIndex(request_item.position(), 0, request_item)
-        self.beginInsertRows(request_index, len(request_item.children), len(request_item.children))
-        request_item.set_reply(reply)
-        self.endInsertRows()
+        if request_item.can_add_reply():
+            self.beginInsertRows(request_index, len(request_item.children), len(request_item.children))
+            request_item.add_reply()
+            self.endInsertRows()
 
-        self.dataChanged.emit(request_index, request_index)
+        self.request_changed(request_item)
 
-    # slot for nam.requestTimedOut[QgsNetworkRequestParameters]
-    def request_timed_out(self, reply):
-        if not reply.requestId() in self.requests_items:
+    # slot for store.requestTimedOut
+    def request_timed_out(self, record):
+        request_item = self.tree_item(record)
+        if request_item is None:
             return
-        request_item = self.requests_items[reply.requestId()]
-        request_index = self.createIndex(request_item.position(), 0, request_item)
-        request_item.set_timed_out()
-
-        self.dataChanged.emit(request_index, request_index)
+        self.request_changed(request_item)
 
-    # slot for nam.requestEncounteredSslErrors
-    def ssl_errors(self, requestId, errors):
-        if not requestId in self.requests_items:
+    # slot for store.requestSslErrors
+    def ssl_errors(self, record):
+        request_item = self.tree_item(record)
+        if request_item is None:
             return
-        request_item = self.requests_items[requestId]
         request_index = self.createIndex(request_item.position(), 0, request_item)
-        self.beginInsertRows(request_index, len(request_item.children), len(request_item.children))
-        request_item.set_ssl_errors(errors)
-        self.endInsertRows()
+        if request_item.can_add_ssl_errors():
+            self.beginInsertRows(request_index, len(request_item.children), len(request_item.children))
+            request_item.add_ssl_errors()
+            self.endInsertRows()
 
-        self.dataChanged.emit(request_index, request_index)
+        self.request_changed(request_item)
+
+    def request_changed(self, request_item):
+        """
+        Let the views know the data of this (top level) Request changed, in
+        all columns
 
-    # slot for nam.downloadProgress
-    def download_progress(self, requestId, received, total):
-        if not requestId in self.requests_items:
+        :param request_item: RequestParentItem in the tree
+        """
+        request_item.sort_keys = None
+        row = request_item.position()
+        self.dataChanged.emit(self.createIndex(row, 0, request_item),
+                              self.createIndex(row, self.columnCount(QModelIndex()) - 1, request_item))
+
+    # slot for store.requestProgress
+    def download_progress(self, record):
+        request_item = self.tree_item(record)
+        if request_item is None:
             return
-        request_item = self.requests_items[requestId]
-        request_index = self.createIndex(request_item.position(), 0, request_item)
-        request_item.set_progress(received, total)
 
-        self.dataChanged.emit(request_index, request_index, [Qt.ToolTipRole])
+        request_item.sort_keys = None
+        self.progress_items.add(request_item)
+        if not self.progress_timer.isActive():
+            self.progress_timer.start(self.progress_interval)
+
+    def flush_progress(self):
+        """
+        Notify the views about all download progress recorded since the last
+        flush, with one dataChanged signal spanning all changed rows
+        """
+        # skip items which were removed (evicted or cleared) in the meantime
+        rows = [item.position() for item in self.progress_items if item.parent is self.root_item]
+        self.progress_items = set()
+        if not rows:
+            return
+        first = min(rows)
+        last = max(rows)
+        roles = [Qt.ToolTipRole]
+        if self.column_mode:
+            roles += [Qt.DisplayRole, SORT_ROLE]
+        self.dataChanged.emit(self.createIndex(first, 0, self.root_item.children[first]),
+                              self.createIndex(last, self.columnCount(QModelIndex()) - 1,
+                                               self.root_item.children[last]),
+                              roles)
+
+    # slot for store.requestsEvicted
+    def requests_evicted(self, records):
+        rows = []
+        pending = set()
+        for record in records:
+            request_item = self.requests_items.get(record.id)
+            if request_item is None:
+                continue
+            if request_item.parent is self.root_item:
+                rows.append(request_item.position())
+            else:
+                pending.add(request_item)
+        if pending:
+            self.pending_items = [item for item in self.pending_items if item not in pending]
+            self.release_items(pending)
+        if rows:
+            self.remove_rows(sorted(rows))
 
     def columnCount(self, parent):
         """
         QAbstractItemModel interface: return the number of columns in the model
-        for given parent. In this case: A QTreeView with just one column
+        for given parent. In this case: A QTreeView with just one column, or
+        all COLUMNS in column mode
         :param parent:
         :return: int column count
         """
-        return 1
+        return len(COLUMNS) if self.column_mode else 1
 
     def rowCount(self, parent):
         """
@@ -205,6 +516,47 @@ class ActivityModel(QAbstractItemModel):
         parent_item = self.root_item if not parent.isValid() else parent.internalPointer()
         return len(parent_item.children)
 
+    def hasChildren(self, parent):
+        """
+        Return whether this parent node has (or will have after fetchMore)
+        children, so the view can show an expand indicator for Requests of
+        which the details are not created yet
+
+        :param parent:
+        :return: bool
+        """
+        if parent.column() > 0:
+            return False
+        parent_item = self.root_item if not parent.isValid() else parent.internalPointer()
+        return parent_item.has_children()
+
+    def canFetchMore(self, parent):
+        """
+        Return True if the children of this parent node are not created yet
+
+        :param parent:
+        :return: bool
+        """
+        if not parent.isValid():
+            return False
+        return parent.internalPointer().can_fetch_more()
+
+    def fetchMore(self, parent):
+        """
+        Create the (detail) children of this parent node from its raw capture
+
+        :param parent:
+        """
+        if not parent.isValid():
+            return
+        parent_item = parent.internalPointer()
+        if not parent_item.can_fetch_more():
+            return
+        count = parent_item.fetch_count()
+        self.beginInsertRows(parent, len(parent_item.children), len(parent_item.children) + count - 1)
+        parent_item.fetch_more()
+        self.endInsertRows()
+
     def data(self, index, role):
         """
         Return the data of this node, used to style the items
@@ -217,32 +569,20 @@ class ActivityModel(QAbstractItemModel):
             return
 
         item = index.internalPointer()
-        if role == Qt.DisplayRole:
+        if role == SORT_ROLE:
+            return item.sort_key(index.column())
+        elif role == Qt.DisplayRole:
+            if self.column_mode:
+                return item.column_text(index.column())
             return item.text(index.column())
         elif role == Qt.ToolTipRole:
             return item.tooltip(index.column())
         elif role == STATUS_ROLE:
             return item.status
         elif role == Qt.ForegroundRole:
-            if isinstance(item, RequestParentItem) and item.ssl_errors \
-                    or isinstance(item, SslErrorsItem) \
-                    or isinstance(index.parent().internalPointer(), SslErrorsItem):
-                color = QColor(180, 65, 210)
-            elif item.status in (PENDING, CANCELED):
-                color = QColor(0, 0, 0, 100)
-            elif item.status == ERROR:
-                color = QColor(235, 10, 10)
-            elif item.status == TIMEOUT:
-                color = QColor(235, 10, 10)
-            else:
-                color = QColor(0, 0, 0)
-            return QBrush(color)
-
+            return self.brushes[item.style()]
         elif role == Qt.FontRole:
-            f = QFont()
-            if item.status == CANCELED:
-                f.setStrikeOut(True)
-            return f
+            return self.canceled_font if item.status == CANCELED else self.font
 
     # not sure why this raises exceptions but commenting for now
     # is it used?
@@ -282,75 +622,433 @@ class ActivityModel(QAbstractItemModel):
         if parent_item.parent is None:
             return QModelIndex()
 
-        parent_index_in_grandparent = parent_item.parent.children.index(parent_item)
-        return self.createIndex(parent_index_in_grandparent, 0, parent_item)
+        return self.createIndex(parent_item.position(), 0, parent_item)
 
     def headerData(self, section, orientation, role):
-        if section == 0 and orientation == Qt.Horizontal and role == Qt.DisplayRole:
-            return "Requests"
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            if self.column_mode:
+                return COLUMNS[section][0]
+            elif section == 0:
+                return "Requests"
+
+    def set_column_mode(self, column_mode):
+        """
+        Show the Requests in all COLUMNS, or in one column with one text
+
+        :param column_mode: bool
+        """
+        if column_mode == self.column_mode:
+            return
+        self.beginResetModel()
+        self.column_mode = column_mode
+        self.endResetModel()
 
     def clear(self):
         """
-        Clear current model with Requests so we can start with a clean sheet.
+        Clear the store (and with that this model) so we can start with a
+        clean sheet.
 
         """
+        self.store.clear()
+
+    # slot for store.cleared
+    def store_cleared(self):
         self.beginResetModel()
+        # dropping the root (and our references) frees the whole tree
         self.root_item = RootItem()
         self.requests_items = {}
+        self.progress_items = set()
+        self.pending_items = []
         self.endResetModel()
 
     def pause(self, state):
         """
-        Toggle the logging by temporary (dis)connecting the
-        requestAboutToBeCreated signal from our
-        request_about_to_be_created slot
+        Toggle the logging of the store
         :param state:
         """
-        if state == self.is_paused:
+        self.store.pause(state)
+
+    def record(self, row):
+        """
+        :param row: int row of a (top level) Request
+        :return: RequestRecord of that Request
+        """
+        return self.root_item.children[row].record
+
+    def remove_rows(self, rows):
+        """
+        Remove the Request nodes at the given rows, to be able to retain a
+        limited number of items. The rows are removed per contiguous range,
+        the last range first. The remaining rows are renumbered once (see
+        RENUMBER_BATCH).
+
+        :param rows: list of int (ascending) rows to remove
+        """
+        log.debug('Removing {} Request nodes.'.format(len(rows)))
+        for first, last in row_ranges(rows):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            evicted = self.root_item.remove_children(first, last - first + 1)
+            self.endRemoveRows()
+            self.release_items(evicted)
+        self.root_item.renumber()
+
+    def release_items(self, request_items):
+        """
+        Release everything the model keeps for these (removed) Requests, so
+        memory is bound to the retained Requests and not to the total traffic
+
+        :param request_items: list of RequestParentItem's
+        """
+        for request_item in request_items:
+            self.requests_items.pop(request_item.record.id, None)
+            self.progress_items.discard(request_item)
+
+
+
+
+class RecordTableModel(QAbstractTableModel):
+    """
+    Base of the flat (table) models with one row, with all COLUMNS, per
+    RequestRecord in the list 'records'
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = []
+        self.brushes = create_brushes()
+        self.font = QFont()
+        self.canceled_font = QFont()
+        self.canceled_font.setStrikeOut(True)
+
+    def record(self, row):
+        """
+        :param row: int row of a Request
+        :return: RequestRecord of that Request
+        """
+        return self.records[row]
+
+    def rowCount(self, parent):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role):
+        if not index.isValid():
+            return
+        record = self.records[index.row()]
+        if role == Qt.DisplayRole:
+            return COLUMNS[index.column()][1](record)
+        elif role == SORT_ROLE:
+            return COLUMNS[index.column()][2](record)
+        elif role == Qt.ToolTipRole:
+            return record_tooltip(record)
+        elif role == STATUS_ROLE:
+            return record.status
+        elif role == Qt.ForegroundRole:
+            return self.brushes[record_style(record)]
+        elif role == Qt.FontRole:
+            return self.canceled_font if record.status == CANCELED else self.font
+
+    def headerData(self, section, orientation, role):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return COLUMNS[section][0]
+
+
+class RequestListModel(RecordTableModel):
+    """
+    Flat (table) model with one row, with all COLUMNS, per Request in the
+    CaptureStore, without the details of the Requests. This is the model of
+    the flat RequestListView, which shows the details of the selected Request
+    in a separate pane, so scrolling stays smooth with a lot of Requests.
+
+    Like the ActivityModel it follows the store: new Requests are inserted as
+    one block of rows every INSERT_INTERVAL msec, download progress is
+    notified every PROGRESS_INTERVAL msec, and the row of a Request is found
+    in constant time.
+    """
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+
+        # the RequestRecord's in the model (self.records) are oldest first.
+        # the row a record got when it was appended, by record id, and the
+        # number of records removed from the front since: together they give
+        # the current row (see row()). After removing records from the middle,
+        # the rows from renumber_from on are outdated (but still ascending)
+        # until renumber()
+        self.rows = {}
+        self.row_offset = 0
+        self.renumber_from = None
+
+        self.pending_records = []
+        self.insert_timer = QTimer(self)
+        self.insert_timer.setSingleShot(True)
+        self.insert_timer.timeout.connect(self.flush_inserts)
+
+        self.progress_records = set()
+        self.progress_timer = QTimer(self)
+        self.progress_timer.setSingleShot(True)
+        self.progress_timer.timeout.connect(self.flush_progress)
+
+        self.store.requestAdded.connect(self.request_added)
+        self.store.requestFinished.connect(self.request_changed)
+        self.store.requestTimedOut.connect(self.request_changed)
+        self.store.requestSslErrors.connect(self.request_changed)
+        self.store.requestProgress.connect(self.download_progress)
+        self.store.requestsEvicted.connect(self.requests_evicted)
+        self.store.cleared.connect(self.store_cleared)
+
+        for record in self.store.records.values():
+            self.request_added(record)
+        self.flush_inserts()
+
+    # slot for store.requestAdded
+    def request_added(self, record):
+        self.pending_records.append(record)
+        if not self.insert_timer.isActive():
+            self.insert_timer.start(INSERT_INTERVAL)
+
+    def flush_inserts(self):
+        """
+        Insert all Requests which were created since the last flush in the
+        model, as one block of rows
+        """
+        if not self.pending_records:
             return
+        count = len(self.records)
+        self.beginInsertRows(QModelIndex(), count, count + len(self.pending_records) - 1)
+        # one more than the last row, which can be outdated: rows stay ascending
+        row = self.rows[self.records[-1].id] + 1 if self.records else self.row_offset
+        for record in self.pending_records:
+            self.rows[record.id] = row
+            self.records.append(record)
+            row += 1
+        self.pending_records = []
+        self.endInsertRows()
 
-        self.is_paused = state
-        if self.is_paused:
-            QgsNetworkAccessManager.instance().requestAboutToBeCreated[QgsNetworkRequestParameters].disconnect(
-                self.request_about_to_be_created)
-        else:
-            QgsNetworkAccessManager.instance().requestAboutToBeCreated[QgsNetworkRequestParameters].connect(
-                self.request_about_to_be_created)
+    def row(self, record):
+        """
+        :param record: RequestRecord
+        :return: int current row of this record, or None if not in the model
+        """
+        absolute_row = self.rows.get(record.id)
+        if absolute_row is None:
+            return None
+        row = absolute_row - self.row_offset
+        if self.renumber_from is None or row < self.renumber_from:
+            return row
+        # an outdated row: the rows are still ascending, search it
+        low = self.renumber_from
+        high = min(row, len(self.records) - 1)
+        while low < high:
+            middle = (low + high) // 2
+            if self.rows[self.records[middle].id] < absolute_row:
+                low = middle + 1
+            else:
+                high = middle
+        return low
 
-    def pop_nodes(self, count):
+    def renumber(self, limit=RENUMBER_BATCH):
         """
-        Pop 'count' nodes from the list, to be able to retain a fixed size
-        of items.
+        Give (at most 'limit' of) the records after removed ones (see
+        requests_evicted) their actual row again
 
-        :param count: int number of nodes to remove/pop
+        :param limit: int maximum number of records to renumber
         """
-        log.debug('Removing {} Request nodes.'.format(count))
-        self.beginRemoveRows(QModelIndex(), 0, count-1)
-        if len(self.root_item.children) > 0:
-            self.root_item.children = self.root_item.children[count:]
-        self.endRemoveRows()
+        if self.renumber_from is None:
+            return
+        start = self.renumber_from
+        end = min(start + limit, len(self.records))
+        for row, record in enumerate(self.records[start:end], self.row_offset + start):
+            self.rows[record.id] = row
+        self.renumber_from = end if end < len(self.records) else None
 
+    def record_index(self, record):
+        """
+        :param record: RequestRecord
+        :return: QModelIndex of the row of this record, invalid if it is not
+        in the model
+        """
+        row = self.row(record)
+        return QModelIndex() if row is None else self.index(row, 0)
 
+    # slot for store.requestFinished, requestTimedOut and requestSslErrors
+    def request_changed(self, record):
+        row = self.row(record)
+        if row is None:
+            return
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+
+    # slot for store.requestProgress
+    def download_progress(self, record):
+        self.progress_records.add(record)
+        if not self.progress_timer.isActive():
+            self.progress_timer.start(PROGRESS_INTERVAL)
+
+    def flush_progress(self):
+        """
+        Notify the views about all download progress recorded since the last
+        flush, with one dataChanged signal spanning all changed rows
+        """
+        rows = [self.row(record) for record in self.progress_records]
+        self.progress_records = set()
+        rows = [row for row in rows if row is not None]
+        if not rows:
+            return
+        self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), len(COLUMNS) - 1),
+                              [Qt.DisplayRole, Qt.ToolTipRole, SORT_ROLE])
+
+    # slot for store.requestsEvicted
+    def requests_evicted(self, records):
+        evicted = set()
+        rows = []
+        for record in records:
+            evicted.add(record)
+            row = self.row(record)
+            if row is not None:
+                rows.append(row)
+        self.pending_records = [record for record in self.pending_records if record not in evicted]
+        self.progress_records -= evicted
+        if not rows:
+            return
+        rows.sort()
+        for first, last in row_ranges(rows):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            for record in self.records[first:last + 1]:
+                del self.rows[record.id]
+            del self.records[first:last + 1]
+            if first == 0:
+                self.row_offset += last + 1
+                if self.renumber_from is not None:
+                    self.renumber_from = max(self.renumber_from - last - 1, 0)
+            elif self.renumber_from is None or first < self.renumber_from:
+                # renumbered (in part) once, after all ranges are removed
+                self.renumber_from = first
+            self.endRemoveRows()
+        self.renumber()
+
+    # slot for store.cleared
+    def store_cleared(self):
+        self.beginResetModel()
+        self.records = []
+        self.rows = {}
+        self.row_offset = 0
+        self.renumber_from = None
+        self.pending_records = []
+        self.progress_records = set()
+        self.endResetModel()
+
+
+class ArchiveModel(RecordTableModel):
+    """
+    Flat (table) model of the Requests archived in a SessionArchive, newest
+    first. The Requests are read one page at a time, when the view scrolls
+    down to them (see canFetchMore and fetchMore), so only the pages looked
+    at are in memory.
+    """
+
+    def __init__(self, archive, parent=None):
+        super().__init__(parent)
+        self.archive = archive
+        # key of the last read Request, to read the next page from
+        self.last_key = None
+        self.exhausted = False
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent):
+        if parent.isValid() or self.exhausted:
+            return
+        page = self.archive.read_page(self.last_key)
+        if not page:
+            self.exhausted = True
+            return
+        self.last_key = page[-1][0]
+        count = len(self.records)
+        self.beginInsertRows(QModelIndex(), count, count + len(page) - 1)
+        self.records.extend(record for _, record in page)
+        self.endInsertRows()
 
 
 class ActivityProxyModel(QSortFilterProxyModel):
     """
     The ActivityProxyModel is a QSortFilterProxyModel so we can make our
-    QAbstractItemModel sortable / searchable
-
+    QAbstractItemModel sortable / searchable. The source model is an
+    ActivityModel or a RequestListModel, both give the RequestRecord of a
+    (top level) row with record(row).
+
+    Sorting is done on the typed keys of the SORT_ROLE, so numeric columns
+    (like the duration) sort numerically.
+
+    The filter string is a query (see query.py), compiled once per change.
+    Changes of the filter string are debounced (FILTER_DELAY). The Requests
+    rejected by the query are remembered, so when the query only narrows
+    (the user types on), only the Requests which passed the previous query
+    have to be checked again.
+    An invalid query is reported with filterError, the previous query is then
+    kept. The SearchIndex (for text: terms) is built upon the first search,
+    the Requests are filtered again when it is built.
     """
+
+    # signal with the error message of an invalid filter string, or an
+    # empty string when the filter string is valid (again)
+    filterError = pyqtSignal(str)
+
     def __init__(self, source_model, parent=None):
         super().__init__(parent)
         self.source_model = source_model
         self.setSourceModel(self.source_model)
+        self.setSortRole(SORT_ROLE)
         self.filter_string = ''
+        self.query = compile_query('', source_model.store.index)
         self.show_successful = True
         self.show_timeouts = True
 
+        # RequestRecord's rejected by the current query, weak so
+        # evicted items do not linger in here
+        self.rejected = weakref.WeakSet()
+
+        self.pending_filter_string = ''
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DELAY)
+        self.filter_timer.timeout.connect(self.apply_filter_string)
+
+        source_model.store.index.indexBuilt.connect(self.index_built)
+
     def set_filter_string(self, string):
+        self.pending_filter_string = string
+        self.filter_timer.start()
+
+    def apply_filter_string(self):
+        string = self.pending_filter_string
+        try:
+            query = compile_query(string, self.source_model.store.index)
+        except QueryError as e:
+            self.filterError.emit(str(e))
+            return
+        # also when the string is the current one again, after an invalid one
+        self.filterError.emit('')
+        if string == self.filter_string:
+            return
+        if not query.narrows(self.query):
+            # the query did not just narrow, so previously rejected
+            # Requests may pass now
+            self.rejected = weakref.WeakSet()
         self.filter_string = string
+        self.query = query
         self.invalidateFilter()
 
+    # slot for store.index.indexBuilt
+    def index_built(self):
+        # text: terms did not match any Request while the index was built
+        if any(term.key == 'text' for term in self.query.terms):
+            self.rejected = weakref.WeakSet()
+            self.invalidateFilter()
+
     def set_show_successful(self, show):
         self.show_successful = show
         self.invalidateFilter()
@@ -360,16 +1058,24 @@ class ActivityProxyModel(QSortFilterProxyModel):
         self.invalidateFilter()
 
     def filterAcceptsRow(self, sourceRow, sourceParent):
-        item = self.source_model.index(sourceRow, 0, sourceParent).internalPointer()
-        if isinstance(item, RequestParentItem):
-            if item.status in (COMPLETE, CANCELED) and not self.show_successful:
-                return False
-            elif item.status == TIMEOUT and not self.show_timeouts:
-                return False
-
-            return self.filter_string.lower() in item.url.url().lower()
-        else:
+        if sourceParent.isValid():
+            # only Requests are filtered, not their details
+            return True
+        record = self.source_model.record(sourceRow)
+        if record.status in (COMPLETE, CANCELED) and not self.show_successful:
+            return False
+        elif record.status == TIMEOUT and not self.show_timeouts:
+            return False
+
+        if record in self.rejected:
+            return False
+        if self.query.matches(record):
             return True
+        if record.replied:
+            # only remember finished Requests, a pending one may still match
+            # on its reply (status, time, size, reply headers...)
+            self.rejected.add(record)
+        return False
 
 
 
@@ -378,46 +1084,150 @@ class ActivityTreeItem(object):
     Parent class of all ActivityTreeItems sub classes.
     An ActivityTreeItems is kept in the ActivityModel and able to keep the
     information of it's NetworkActivity counter part
+
+    All items use __slots__, as there can be a lot of them.
+
+    An item only keeps a weak reference to its parent, so the tree has no
+    reference cycles: a removed (evicted or cleared) subtree is freed right
+    away by reference counting instead of by the cyclic garbage collector.
     """
 
+    __slots__ = ('parent_ref', 'children', 'row', 'row_offset', 'renumber_from', '__weakref__')
+
+    status = COMPLETE
+
     def __init__(self, parent=None):
         self.parent = parent
         self.children = []
+        # the row this item got when it was appended to its parent, and the
+        # number of children that have been removed from the front of our own
+        # children list. Together they make position() constant time.
+        self.row = 0
+        self.row_offset = 0
+        # the first of our children whose row is outdated after removing
+        # children from the middle, or None. See remove_children
+        self.renumber_from = None
         if parent:
-           parent.children.append(self)
+            parent.append_child(self)
 
-        self.status = COMPLETE
+    @property
+    def parent(self):
+        return self.parent_ref() if self.parent_ref is not None else None
+
+    @parent.setter
+    def parent(self, parent):
+        self.parent_ref = weakref.ref(parent) if parent is not None else None
+
+    def append_child(self, child):
+        """
+        Append child to the children of this item, remembering its row
+        :param child: ActivityTreeItem
+        """
+        child.parent = self
+        # one more than the last row, which can be outdated: rows stay ascending
+        child.row = self.children[-1].row + 1 if self.children else self.row_offset
+        self.children.append(child)
+
+    def remove_children(self, first, count):
+        """
+        Remove 'count' children of this item, starting at row 'first'. When
+        removing from the front, instead of renumbering all remaining children,
+        the row offset is raised. Otherwise the children after the removed
+        ones keep their (now too high, but still ascending) rows until
+        renumber() is called, so removing several ranges costs one (bounded)
+        renumbering instead of one per range. Meanwhile child_row() finds
+        their rows with a binary search.
+        :param first: int row of the first child to remove
+        :param count: int number of children to remove
+        :return: list of removed children
+        """
+        removed = self.children[first:first + count]
+        for child in removed:
+            child.parent = None
+        del self.children[first:first + count]
+        if first == 0:
+            self.row_offset += count
+            if self.renumber_from is not None:
+                self.renumber_from = max(self.renumber_from - count, 0)
+        elif self.renumber_from is None or first < self.renumber_from:
+            self.renumber_from = first
+        return removed
+
+    def renumber(self, limit=RENUMBER_BATCH):
+        """
+        Give (at most 'limit' of) the children after removed ones (see
+        remove_children) their actual row again
+
+        :param limit: int maximum number of children to renumber
+        """
+        if self.renumber_from is None:
+            return
+        start = self.renumber_from
+        end = min(start + limit, len(self.children))
+        for row, child in enumerate(self.children[start:end], self.row_offset + start):
+            child.row = row
+        self.renumber_from = end if end < len(self.children) else None
+
+    def child_row(self, child):
+        """
+        :param child: ActivityTreeItem, one of our children
+        :return: int the row of child in our children
+        """
+        row = child.row - self.row_offset
+        if self.renumber_from is None or row < self.renumber_from:
+            return row
+        # an outdated row: the rows are still ascending, search it
+        children = self.children
+        low = self.renumber_from
+        high = min(row, len(children) - 1)
+        while low < high:
+            middle = (low + high) // 2
+            if children[middle].row < child.row:
+                low = middle + 1
+            else:
+                high = middle
+        return low
 
     def text(self, column):
         return ''
 
+    def column_text(self, column):
+        """
+        Return the text of this item in the given column, in column mode
+        """
+        return self.text(column)
+
+    def sort_key(self, column):
+        """
+        Return the key to sort this item on in the given column. The details
+        all have the same key, so (stable) sorting keeps them in order.
+        """
+        return 0
+
     def tooltip(self, column):
         return self.text(column)
 
-    def createWidget(self):
-        return None
+    def style(self):
+        """
+        Return the key of the brush to paint this item with, a Status
+        or SSL_ERRORS
+        """
+        return self.status
 
-    def actions(self):
-        return []
+    def has_children(self):
+        return len(self.children) > 0
 
-    def operation2string(self, operation):
-        """ Create http-operation String from Operation
+    def can_fetch_more(self):
+        return False
 
-        :param operation: QNetworkAccessManager.Operation
-        :return: string
-        """
-        op = "Custom"
-        if operation == QNetworkAccessManager.HeadOperation:
-            op = "HEAD"
-        elif operation == QNetworkAccessManager.GetOperation:
-            op = "GET"
-        elif operation == QNetworkAccessManager.PutOperation:
-            op = "PUT"
-        elif operation == QNetworkAccessManager.PostOperation:
-            op = "POST"
-        elif operation == QNetworkAccessManager.DeleteOperation:
-            op = "DELETE"
-        return op
+    def fetch_count(self):
+        return 0
+
+    def fetch_more(self):
+        pass
+
+    def createWidget(self):
+        return None
 
     def position(self):
         """
@@ -426,8 +1236,9 @@ class ActivityTreeItem(object):
         :return: int
         """
         # (this to be able to let the model know my 'row')
-        if self.parent and self in self.parent.children:
-            return self.parent.children.index(self)
+        parent = self.parent
+        if parent:
+            return parent.child_row(self)
         return 0
 
 
@@ -435,6 +1246,9 @@ class RootItem(ActivityTreeItem):
     """
     'Invisible' root of the QTreeView
     """
+
+    __slots__ = ()
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
@@ -446,123 +1260,113 @@ class RequestParentItem(ActivityTreeItem):
     acts as the parent of all information (both request AND later response) of
     this Request
     """
-    def __init__(self, request, parent=None):
+
+    __slots__ = ('record', 'populated', 'reply_added', 'ssl_errors_added', 'display_text', 'sort_keys')
+
+    def __init__(self, record, parent=None):
         super().__init__(parent)
-        self.url = request.request().url()
-        self.id = request.requestId()
-        self.operation = self.operation2string(request.operation())
-        self.time = time.time()
-        self.http_status = -1
-        self.content_type = ''
-        self.progress = None
-        self.headers = []
-        self.replies = 0
-        self.data = request.content().data().decode('utf-8')
-        for header in request.request().rawHeaderList():
-            self.headers.append(
-                (header.data().decode('utf-8'),
-                 request.request().rawHeader(header).data().decode('utf-8')))
-
-        RequestItem(request, self)
-
-        self.status = PENDING
-        self.ssl_errors = False
-
-        self.open_url_action = QAction('Open URL')
-        self.open_url_action.triggered.connect(self.open_url)
-
-        self.copy_as_curl_action = QAction('Copy as cURL')
-        self.copy_as_curl_action.triggered.connect(self.copy_as_curl)
+        # the RequestRecord holds the compact (raw) capture of the request and
+        # reply, the RequestItem/ReplyItem children are created in fetch_more()
+        self.record = record
+        self.populated = False
+        self.reply_added = False
+        self.ssl_errors_added = False
+        self.display_text = None
+        # the sort keys of all COLUMNS, created when sorting, and reset by
+        # the model when the record changes
+        self.sort_keys = None
+
+    @property
+    def status(self):
+        return self.record.status
+
+    def style(self):
+        return record_style(self.record)
 
     def text(self, column):
         if column == 0:
-            # id is the NAM id
-            return '{} {} {}'.format(self.id, self.operation, self.url.url())
+            # id is the NAM id, id, operation and url never change: format once
+            if self.display_text is None:
+                self.display_text = '{} {} {}'.format(self.record.id, self.record.operation, self.record.url.url())
+            return self.display_text
         return ''
 
-    def open_url(self):
-        """Open (GET) the url of this RequestParentItem in the default browser
-        of the user"""
-        QDesktopServices.openUrl(self.url)
+    def column_text(self, column):
+        return COLUMNS[column][1](self.record)
 
-    def copy_as_curl(self):
-        """Get url + headers + data and create a full curl command
-        Copy that to clipboard
-        """
-        curl_headers = ''
-        for header, value in self.headers:
-            curl_headers += "-H '{}: {}' ".format(header, value)
-        curl_data = ''
-        if self.operation in ('POST', 'PUT'):
-            curl_data = "--data '{}' ".format(self.data)
-        curl_cmd = "curl '{}' {} {}--compressed".format(self.url.url(), curl_headers, curl_data)
-        QApplication.clipboard().setText(curl_cmd)
-
-    def set_reply(self, reply):
-        if reply.error() == QNetworkReply.OperationCanceledError:
-            self.status = CANCELED
-        elif reply.error() != QNetworkReply.NoError:
-            self.status = ERROR
-        else:
-            self.status = COMPLETE
-        self.time = int((time.time() - self.time) * 1000)
-        self.http_status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
-        self.content_type = reply.rawHeader(b'Content-Type').data().decode('utf-8')
-        ReplyItem(reply, self)
+    def sort_key(self, column):
+        if self.sort_keys is None:
+            self.sort_keys = tuple(key(self.record) for _, _, key in COLUMNS)
+        return self.sort_keys[column]
+
+    def has_children(self):
+        return True
+
+    def can_fetch_more(self):
+        return not self.populated
 
-    def set_timed_out(self):
-        self.status = TIMEOUT
+    def fetch_count(self):
+        return 1 + (1 if self.record.ssl_errors else 0) + (1 if self.record.replied else 0)
 
-    def set_progress(self, received, total):
-        self.replies += 1
-        self.progress = (received, total)
+    def fetch_more(self):
+        self.populated = True
+        RequestItem(self.record, self)
+        if self.record.ssl_errors:
+            self.add_ssl_errors()
+        if self.record.replied:
+            self.add_reply()
 
-    def set_ssl_errors(self, errors):
-        self.ssl_errors = errors
-        SslErrorsItem(errors, self)
+    def can_add_reply(self):
+        return self.populated and not self.reply_added
 
-    def actions(self):
-        return [self.open_url_action, self.copy_as_curl_action]
+    def add_reply(self):
+        self.reply_added = True
+        ReplyItem(self.record, self)
+
+    def can_add_ssl_errors(self):
+        return self.populated and not self.ssl_errors_added
+
+    def add_ssl_errors(self):
+        self.ssl_errors_added = True
+        SslErrorsItem(self.record.ssl_errors, self)
+
+    def open_url(self):
+        open_url(self.record)
+
+    def copy_as_curl(self):
+        copy_as_curl(self.record)
 
     def tooltip(self, column):
-        bytes = 'unknown'
-        if self.progress:
-            rec, tot = self.progress
-            if rec > 0 and rec < tot:
-                bytes = '{}/{}'.format(rec, tot)
-            elif rec > 0 and rec == tot:
-                bytes = '{}'.format(tot)
-        # ?? adding <br/> instead of \n after (very long) url seems to break url up
-        # COMPLETE, Status: 200 - text/xml; charset=utf-8 - 2334 bytes - 657 milliseconds
-        return "{}<br/>{} - Status: {} - {} - {} bytes - {} msec - {} replies" \
-            .format(self.url.url(), self.status, self.http_status, self.content_type, bytes, self.time, self.replies)
+        return record_tooltip(self.record)
 
 
 class RequestItem(ActivityTreeItem):
+    # request = RequestRecord holding the raw capture
+
+    __slots__ = ('url', 'operation')
+
     def __init__(self, request, parent=None):
         super().__init__(parent)
 
-        self.url = request.request().url()
-        self.operation = self.operation2string(request.operation())
+        self.url = request.url
+        self.operation = request.operation
         query = QUrlQuery(self.url)
         RequestDetailsItem('Operation', self.operation, self)
-        RequestDetailsItem('Thread', request.originatingThreadId(), self)
-        RequestDetailsItem('Initiator', request.initiatorClassName() if request.initiatorClassName() else 'unknown',
-                           self)
-        if request.initiatorRequestId():
-            RequestDetailsItem('ID', str(request.initiatorRequestId()), self)
+        RequestDetailsItem('Thread', request.thread, self)
+        RequestDetailsItem('Initiator', request.initiator if request.initiator else 'unknown', self)
+        if request.initiator_id:
+            RequestDetailsItem('ID', str(request.initiator_id), self)
 
-        RequestDetailsItem('Cache (control)', self.cache_control_to_string(
-            request.request().attribute(QNetworkRequest.CacheLoadControlAttribute)), self)
-        RequestDetailsItem('Cache (save)', 'Can store result in cache' if request.request().attribute(
-            QNetworkRequest.CacheSaveControlAttribute) else 'Result cannot be stored in cache', self)
+        RequestDetailsItem('Cache (control)', self.cache_control_to_string(request.cache_load_control), self)
+        RequestDetailsItem('Cache (save)', 'Can store result in cache' if request.cache_save_control
+                           else 'Result cannot be stored in cache', self)
 
         query_items = query.queryItems()
         if query_items:
             RequestQueryItems(query_items, self)
-        RequestHeadersItem(request, self)
+        RequestHeadersItem(request.raw_headers, self)
         if self.operation in ('POST', 'PUT'):
-            PostContentItem(request, self)
+            PostContentItem(request.data, self)
 
     @staticmethod
     def cache_control_to_string(cache_control_attribute):
@@ -581,6 +1385,9 @@ class RequestItem(ActivityTreeItem):
 
 
 class RequestDetailsItem(ActivityTreeItem):
+
+    __slots__ = ('description', 'value')
+
     def __init__(self, description, value, parent=None):
         super().__init__(parent)
 
@@ -596,12 +1403,15 @@ class RequestDetailsItem(ActivityTreeItem):
 
 
 class RequestHeadersItem(ActivityTreeItem):
-    def __init__(self, request, parent=None):
+
+    __slots__ = ()
+
+    # headers = list of raw (header, value) tuples of the RequestRecord
+    def __init__(self, headers, parent=None):
         super().__init__(parent)
 
-        for header in request.request().rawHeaderList():
-            RequestDetailsItem(header.data().decode('utf-8'),
-                               request.request().rawHeader(header).data().decode('utf-8'), self)
+        for index in range(len(headers)):
+            HeaderDetailsItem(headers, index, self)
 
     def text(self, column):
         if column == 0:
@@ -611,6 +1421,9 @@ class RequestHeadersItem(ActivityTreeItem):
 
 
 class RequestQueryItems(ActivityTreeItem):
+
+    __slots__ = ()
+
     def __init__(self, query_items, parent=None):
         super().__init__(parent)
 
@@ -625,15 +1438,17 @@ class RequestQueryItems(ActivityTreeItem):
 
 
 class PostContentItem(ActivityTreeItem):
-    # request = QgsNetworkRequestParameters
-    def __init__(self, request, parent=None):
+    # data = decoded content of the request
+
+    __slots__ = ()
+
+    def __init__(self, data, parent=None):
         super().__init__(parent)
 
         # maybe should be &amp?
-        # for p in request.content().data().decode('utf-8').split('&'):
+        # for p in data.split('&'):
         #    PostDetailsItem(p, self)
 
-        data = request.content().data().decode('utf-8')
         PostDetailsItem(data, self)
 
     def text(self, column):
@@ -644,6 +1459,9 @@ class PostContentItem(ActivityTreeItem):
 
 
 class PostDetailsItem(ActivityTreeItem):
+
+    __slots__ = ('data',)
+
     def __init__(self, part, parent=None):
         super().__init__(parent)
 
@@ -659,29 +1477,40 @@ class PostDetailsItem(ActivityTreeItem):
 
 
 class ReplyItem(ActivityTreeItem):
-    def __init__(self, reply, parent=None):
+    # request = RequestRecord holding the raw capture of the reply
+
+    __slots__ = ()
+
+    def __init__(self, request, parent=None):
         super().__init__(parent)
-        ReplyDetailsItem('Status', reply.attribute(QNetworkRequest.HttpStatusCodeAttribute), self)
-        if reply.error() != QNetworkReply.NoError:
-            ReplyDetailsItem('Error Code', reply.error(), self)
-            ReplyDetailsItem('Error', reply.errorString(), self)
+        ReplyDetailsItem('Status', request.http_status, self)
+        if request.error_code != QNetworkReply.NoError:
+            ReplyDetailsItem('Error Code', request.error_code, self)
+            ReplyDetailsItem('Error', request.error_string, self)
 
-        RequestDetailsItem('Cache (result)', 'Used entry from cache' if reply.attribute(
-            QNetworkRequest.SourceIsFromCacheAttribute) else 'Read from network', self)
+        RequestDetailsItem('Cache (result)', 'Used entry from cache' if request.from_cache
+                           else 'Read from network', self)
+        if request.first_progress_ns is not None:
+            ReplyDetailsItem('Wait (first byte)', format_msec(request.wait_ms()), self)
+            ReplyDetailsItem('Transfer', format_msec(request.transfer_ms()), self)
+            ReplyDetailsItem('Download rate', format_rate(request.download_rate()), self)
 
-        ReplyHeadersItem(reply, self)
+        ReplyHeadersItem(request.raw_reply_headers, self)
 
     def text(self, column):
         return 'Reply' if column == 0 else ''
 
 
 class ReplyHeadersItem(ActivityTreeItem):
-    def __init__(self, reply, parent=None):
+
+    __slots__ = ()
+
+    # headers = list of raw (header, value) tuples of the RequestRecord
+    def __init__(self, headers, parent=None):
         super().__init__(parent)
 
-        for header in reply.rawHeaderList():
-            ReplyDetailsItem(header.data().decode('utf-8'),
-                             reply.rawHeader(header).data().decode('utf-8'), self)
+        for index in range(len(headers)):
+            HeaderDetailsItem(headers, index, self)
 
     def text(self, column):
         if column == 0:
@@ -691,6 +1520,9 @@ class ReplyHeadersItem(ActivityTreeItem):
 
 
 class ReplyDetailsItem(ActivityTreeItem):
+
+    __slots__ = ('description', 'value')
+
     def __init__(self, description, value, parent=None):
         super().__init__(parent)
 
@@ -705,15 +1537,50 @@ class ReplyDetailsItem(ActivityTreeItem):
             return self.value
 
 
+class HeaderDetailsItem(ActivityTreeItem):
+    """
+    Shows one (request or reply) header. Instead of keeping a decoded copy,
+    it refers to the raw headers of the RequestRecord, and decodes on demand.
+    """
+
+    __slots__ = ('headers', 'index')
+
+    def __init__(self, headers, index, parent=None):
+        super().__init__(parent)
+
+        self.headers = headers
+        self.index = index
+
+    def text(self, column):
+        header, value = self.headers[self.index]
+        if column == 0:
+            return '{:30}: {}'.format(header.decode('utf-8'), value.decode('utf-8'))
+        else:
+            return value.decode('utf-8')
+
+
 class SslErrorsItem(ActivityTreeItem):
+
+    __slots__ = ()
+
     def __init__(self, errors, parent=None):
         super().__init__(parent)
         for error in errors:
-            ReplyDetailsItem('Error',
-                             error.errorString(), self)
+            SslErrorDetailsItem('Error', error, self)
+
+    def style(self):
+        return SSL_ERRORS
 
     def text(self, column):
         if column == 0:
             return 'SSL errors'
         else:
             return ''
+
+
+class SslErrorDetailsItem(ReplyDetailsItem):
+
+    __slots__ = ()
+
+    def style(self):
+        return SSL_ERRORS
@@ -25,8 +25,12 @@ from qgis.PyQt.QtWidgets import (
     QShortcut
 )
 
-from .ui import NetworkActivityDock
+from .ui import NetworkActivityDock, StatsDock
 from .model import ActivityModel
+from .store import CaptureStore
+from .archive import ArchiveSettings, SessionArchive
+from .waterfall import WaterfallDock
+from .stats import StatsEngine
 
 import os
 
@@ -45,8 +49,17 @@ class QgisNetworkLogger:
         self.iface = iface
 
         # don't wait for GUI to start logging...
-        self.logger = ActivityModel()
+        self.store = CaptureStore()
+        # the statistics are gathered from the start as well
+        self.stats = StatsEngine(self.store)
+        # ... but only create the (Qt) model when the dock is shown
+        self.logger = None
         self.dock = None
+        self.waterfall_dock = None
+        self.stats_dock = None
+        # optional database in which all finished requests are archived
+        self.archive = None
+        self.archive_changed()
 
     def initGui(self):
         # Create action that will start the plugin
@@ -74,13 +87,81 @@ class QgisNetworkLogger:
 
         if self.dock:
             self.iface.removeDockWidget(self.dock)
+        if self.waterfall_dock:
+            self.iface.removeDockWidget(self.waterfall_dock)
+        if self.stats_dock:
+            self.iface.removeDockWidget(self.stats_dock)
+
+        self.close_archive()
+        # the NAM outlives the plugin: stop capturing
+        self.store.close()
 
     def toggle_dock(self):
         # show/hide the dock with the Treeview
         if not self.dock:
+            self.logger = ActivityModel(self.store)
             self.dock = NetworkActivityDock(self.logger)
             self.dock.setObjectName('NetworkActivityDock')
+            self.dock.set_archive(self.archive)
+            self.dock.archiveSettingsChanged.connect(self.archive_changed)
+            self.dock.waterfall_action.toggled.connect(self.toggle_waterfall)
+            self.dock.stats_action.toggled.connect(self.toggle_stats)
             self.iface.addDockWidget(Qt.RightDockWidgetArea, self.dock)
         else:
             self.dock.toggleUserVisible()
 
+    def toggle_waterfall(self, show):
+        # show/hide the dock with the waterfall, next to the dock
+        if not self.waterfall_dock:
+            if not show:
+                return
+            self.waterfall_dock = WaterfallDock(self.store)
+            self.waterfall_dock.setObjectName('NetworkWaterfallDock')
+            self.waterfall_dock.view.requestSelected.connect(self.dock.select_record)
+            self.waterfall_dock.openedStateChanged.connect(self.dock.waterfall_action.setChecked)
+            self.iface.addDockWidget(Qt.BottomDockWidgetArea, self.waterfall_dock)
+        else:
+            self.waterfall_dock.setUserVisible(show)
+
+    def toggle_stats(self, show):
+        # show/hide the dock with the statistics, next to the dock
+        if not self.stats_dock:
+            if not show:
+                return
+            self.stats_dock = StatsDock(self.stats)
+            self.stats_dock.setObjectName('NetworkStatisticsDock')
+            self.stats_dock.openedStateChanged.connect(self.dock.stats_action.setChecked)
+            self.iface.addDockWidget(Qt.BottomDockWidgetArea, self.stats_dock)
+        else:
+            self.stats_dock.setUserVisible(show)
+
+    def archive_changed(self):
+        """
+        (Re)open or close the archive of finished requests, according to the
+        ArchiveSettings
+        """
+        settings = ArchiveSettings()
+        if self.archive is not None and settings.enabled and settings.path == self.archive.path:
+            return
+        self.close_archive()
+        if settings.enabled:
+            self.archive = SessionArchive(settings.path)
+            self.archive.failed.connect(self.archive_failed)
+            self.store.requestFinished.connect(self.archive.add)
+        if self.dock:
+            self.dock.set_archive(self.archive)
+
+    # slot for archive.failed
+    def archive_failed(self, path, message):
+        self.iface.messageBar().pushWarning('Network Logger', 'Could not open the archive {}: {}'.format(path, message))
+        # the archive could have been changed in the mean time
+        if self.archive is not None and self.archive.path == path:
+            self.close_archive()
+            if self.dock:
+                self.dock.set_archive(None)
+
+    def close_archive(self):
+        if self.archive is not None:
+            self.store.requestFinished.disconnect(self.archive.add)
+            self.archive.close()
+            self.archive = None
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+"""
+A small query language to filter the captured Requests with, like:
+
+    wms host:tiles.example.com status:>=400 method:POST time:>500 size:>1MB
+    initiator:QgsWmsProvider header:Authorization -host:osm
+
+A query is a list of terms (separated by spaces) which all have to match:
+- a word without key matches (case insensitive) a part of the url
+- host:, initiator: and header: (request or reply header name) match a
+  (case insensitive) part of the host, initiator class or a header name
+- method: matches the http operation (GET, POST...)
+- status: compares the http status code (status:404, status:>=400) or matches
+  the Status of the Request (status:error, status:timeout, status:pending...)
+- time: compares the duration, in msec or with unit (time:>500, time:<2s)
+- size: compares the received bytes, in bytes or with unit (size:>1MB)
+- text: searches the words in the full text of the Request: url, query
+  items, request and reply headers and POST content (text:typename=roads),
+  using the SearchIndex of the CaptureStore. The index is built (in the
+  background) upon the first text: search, until then it matches nothing
+- a term starting with - is negated (-host:osm)
+
+The query is compiled once into a Query, which is evaluated against the
+(precomputed) fields of the RequestRecord's.
+"""
+
+import operator
+import re
+
+from .store import (
+    PENDING,
+    COMPLETE,
+    ERROR,
+    TIMEOUT,
+    CANCELED
+)
+
+"""
+Comparison operators of the numeric terms (status, time and size)
+"""
+OPERATORS = {
+    '>=': operator.ge,
+    '<=': operator.le,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+    '=': operator.eq,
+    '': operator.eq
+}
+
+COMPARISON = re.compile(r'^(>=|<=|!=|>|<|=)?\s*([0-9.]+)\s*([a-z]*)$')
+
+SIZE_UNITS = {
+    '': 1,
+    'b': 1,
+    'k': 1024,
+    'kb': 1024,
+    'm': 1024 ** 2,
+    'mb': 1024 ** 2,
+    'g': 1024 ** 3,
+    'gb': 1024 ** 3
+}
+
+"""
+The Statuses a status: term can match
+"""
+STATUSES = (PENDING, COMPLETE, ERROR, TIMEOUT, CANCELED)
+
+TIME_UNITS = {
+    '': 1,
+    'ms': 1,
+    's': 1000,
+    'sec': 1000,
+    'm': 60000,
+    'min': 60000
+}
+
+
+class QueryError(ValueError):
+    """
+    Raised when a query cannot be compiled
+    """
+    pass
+
+
+def compile_query(text, index=None):
+    """
+    Compile the query text into a Query
+
+    :param text: string
+    :param index: SearchIndex for the text: terms, or None
+    :return: Query
+    :raises QueryError: when a term is not valid
+    """
+    return Query([Term(word, index) for word in text.split()])
+
+
+def parse_comparison(key, value, units):
+    """
+    Parse a (numeric) comparison like '>=1.5MB' into an operator and a number
+
+    :param key: string key of the term, for the error message
+    :param value: string comparison
+    :param units: dictionary with unit factors
+    :return: (operator function, number) tuple
+    """
+    match = COMPARISON.match(value)
+    if not match or match.group(3) not in units:
+        raise QueryError('Invalid value for {}: "{}"'.format(key, value))
+    try:
+        number = float(match.group(2)) * units[match.group(3)]
+    except ValueError:
+        raise QueryError('Invalid number for {}: "{}"'.format(key, value))
+    return OPERATORS[match.group(1) or ''], number
+
+
+class Query(object):
+    """
+    A compiled query: a list of Terms which all have to match a record
+    """
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    def matches(self, record):
+        """
+        :param record: RequestRecord
+        :return: bool
+        """
+        for term in self.terms:
+            if not term.matches(record):
+                return False
+        return True
+
+    def narrows(self, previous):
+        """
+        Return True if every record matching this query also matches the
+        previous query, so records rejected by the previous query do not have
+        to be checked again. That is the case when the user typed on: the same
+        terms, of which the last one (a part match) got longer, maybe followed
+        by new terms.
+
+        :param previous: Query or None
+        :return: bool
+        """
+        if previous is None or len(self.terms) < len(previous.terms):
+            return False
+        last = len(previous.terms) - 1
+        for i, (old, new) in enumerate(zip(previous.terms, self.terms)):
+            if not old.is_part_match() or new.key != old.key or new.negate != old.negate:
+                return False
+            # only the last of the previous terms may have grown
+            if old.value not in new.value or (i < last and old.value != new.value):
+                return False
+        return True
+
+
+class Term(object):
+    """
+    One term of a Query, like 'status:>=400' or 'wms'
+    """
+
+    # the keys a term can have, a word with another key (like 'https://...')
+    # is just a part of the url to match
+    KEYS = ('host', 'initiator', 'header', 'method', 'status', 'time', 'size', 'text')
+
+    def __init__(self, word, index=None):
+        self.index = index
+        self.negate = word.startswith('-') and len(word) > 1
+        if self.negate:
+            word = word[1:]
+        key, separator, value = word.partition(':')
+        if separator and key.lower() in Term.KEYS:
+            self.key = key.lower()
+            self.value = value.lower()
+        else:
+            self.key = ''
+            self.value = word.lower()
+        self.test = self.create_test()
+
+    def create_test(self):
+        """
+        Create the function testing a record for this term
+        """
+        value = self.value
+        if not value:
+            # still being typed, like 'host:'
+            return lambda record: True
+        if self.key == '':
+            return lambda record: value in record.lower_url()
+        elif self.key == 'host':
+            return lambda record: value in record.lower_host()
+        elif self.key == 'initiator':
+            return lambda record: value in (record.initiator or '').lower()
+        elif self.key == 'header':
+            name = value.encode('utf-8')
+            return lambda record: any(name in header.lower() for header, _ in record.raw_headers) \
+                or any(name in header.lower() for header, _ in record.raw_reply_headers)
+        elif self.key == 'method':
+            method = value.upper()
+            return lambda record: record.operation == method
+        elif self.key == 'status':
+            if value[:1] not in '<>=!' and not value[:1].isdigit():
+                status = value.upper()
+                if status not in STATUSES:
+                    raise QueryError('Unknown status: "{}", use a http status code or one of {}'
+                                     .format(value, ', '.join(status.lower() for status in STATUSES)))
+                return lambda record: record.status == status
+            compare, number = parse_comparison(self.key, value, {'': 1})
+            return lambda record: isinstance(record.http_status, int) and record.http_status > 0 \
+                and compare(record.http_status, number)
+        elif self.key == 'time':
+            compare, number = parse_comparison(self.key, value, TIME_UNITS)
+            return lambda record: record.end_ns is not None and compare(record.time, number)
+        elif self.key == 'size':
+            compare, number = parse_comparison(self.key, value, SIZE_UNITS)
+            return lambda record: compare(record.received_bytes(), number)
+        elif self.key == 'text':
+            index = self.index
+            if index is None:
+                raise QueryError('Full text search is not available')
+
+            def test(record):
+                # the ids are looked up once, then cached in the index
+                ids = index.search(value)
+                return ids is None or record.id in ids
+            return test
+
+    def is_part_match(self):
+        """
+        Return True if this term matches a part of a field, so when its value
+        gets longer, it can only match less records
+        """
+        return not self.negate and self.key in ('', 'host', 'initiator', 'header')
+
+    def matches(self, record):
+        return self.test(record) != self.negate
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+from qgis.core import (
+    QgsSettings
+)
+
+"""
+Prefix of the QgsSettings keys in which the retention policy is kept
+"""
+SETTINGS_KEY = 'qgisnetworklogger/retention/'
+
+"""
+Default limits of the retention policy: the maximum number of Requests to
+keep, the maximum age of a Request (in seconds) and the maximum (estimated)
+size of all captured headers and content (in MB). 0 means: no limit.
+These limits only hold for 'normal' Requests. Failed Requests (errors,
+timeouts, canceled and SSL errors) are kept in their own, larger quota of
+MAX_ERROR_COUNT Requests, as they are the interesting ones when debugging.
+"""
+MAX_COUNT = 1000
+MAX_AGE = 0
+MAX_SIZE = 50
+MAX_ERROR_COUNT = 2000
+
+"""
+Default number of Requests of which the numbers (times, status, bytes,
+host and method) are kept for the exact statistics, when NumPy is
+installed, about 48 bytes per Request. 0 means: no history.
+"""
+STATS_HISTORY = 100000
+
+"""
+Maximum number of Requests to remove in one go, more Requests are evicted
+in following (timer) steps, so eviction never blocks the GUI noticeably
+"""
+EVICT_BATCH = 200
+
+
+class RetentionPolicy(object):
+    """
+    Decides which of the (oldest) Requests should be evicted, based on
+    a maximum count, a maximum age and a maximum estimated memory size for
+    normal Requests, and a separate maximum count for failed Requests.
+    It also holds the size of the history of the statistics (stats_history).
+
+    The limits are persisted in the QgsSettings.
+    """
+
+    def __init__(self):
+        self.max_count = MAX_COUNT
+        self.max_age = MAX_AGE
+        self.max_size = MAX_SIZE
+        self.max_error_count = MAX_ERROR_COUNT
+        self.stats_history = STATS_HISTORY
+        self.load()
+
+    def load(self):
+        """
+        Read the limits from the QgsSettings
+        """
+        settings = QgsSettings()
+        self.max_count = settings.value(SETTINGS_KEY + 'max_count', MAX_COUNT, type=int)
+        self.max_age = settings.value(SETTINGS_KEY + 'max_age', MAX_AGE, type=int)
+        self.max_size = settings.value(SETTINGS_KEY + 'max_size', MAX_SIZE, type=int)
+        self.max_error_count = settings.value(SETTINGS_KEY + 'max_error_count', MAX_ERROR_COUNT, type=int)
+        self.stats_history = settings.value(SETTINGS_KEY + 'stats_history', STATS_HISTORY, type=int)
+
+    def save(self):
+        """
+        Write the limits to the QgsSettings
+        """
+        settings = QgsSettings()
+        settings.setValue(SETTINGS_KEY + 'max_count', self.max_count)
+        settings.setValue(SETTINGS_KEY + 'max_age', self.max_age)
+        settings.setValue(SETTINGS_KEY + 'max_size', self.max_size)
+        settings.setValue(SETTINGS_KEY + 'max_error_count', self.max_error_count)
+        settings.setValue(SETTINGS_KEY + 'stats_history', self.stats_history)
+
+    def max_bytes(self):
+        return self.max_size * 1024 * 1024
+
+    def select_evictions(self, records, normal_bytes, error_count, now, limit=EVICT_BATCH):
+        """
+        Return the Requests from records (oldest first) to evict to satisfy
+        the limits, but never more than 'limit'.
+        Normal Requests are evicted by count, age and size, failed Requests
+        only when there are more than max_error_count of them.
+
+        :param records: collection of RequestRecord's, oldest first
+        :param normal_bytes: int estimated size of all normal Requests
+        :param error_count: int number of failed Requests in records
+        :param now: float time.time() to calculate the age against
+        :param limit: int maximum number of Requests to evict in one go
+        :return: list of RequestRecord's, oldest first
+        """
+        normal_excess = 0
+        if self.max_count > 0:
+            normal_excess = len(records) - error_count - self.max_count
+        error_excess = 0
+        if self.max_error_count > 0:
+            error_excess = error_count - self.max_error_count
+        oldest = now - self.max_age if self.max_age > 0 else None
+        max_bytes = self.max_bytes()
+
+        evicted = []
+        for record in records:
+            too_old = oldest is not None and record.start_time < oldest
+            too_big = max_bytes > 0 and normal_bytes > max_bytes
+            if normal_excess <= 0 and error_excess <= 0 and not too_old and not too_big:
+                # Requests are ordered by age, so nothing newer will be evicted
+                break
+            if len(evicted) >= limit:
+                break
+            if record.is_failed():
+                if error_excess > 0:
+                    evicted.append(record)
+                    error_excess -= 1
+            elif normal_excess > 0 or too_old or too_big:
+                evicted.append(record)
+                normal_excess -= 1
+                normal_bytes -= record.size
+        return evicted
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+import math
+
+from qgis.PyQt.QtCore import (
+    QObject,
+    QTimer,
+    pyqtSignal
+)
+
+from .store import (
+    ERROR,
+    CANCELED
+)
+from .columns import (
+    numpy
+)
+
+"""
+Relative precision of the latency histogram: every bucket is GROWTH times
+as wide as the previous one, so a percentile is off by at most 2.5%
+"""
+GROWTH = 1.05
+LOG_GROWTH = math.log(GROWTH)
+
+"""
+Maximum number of endpoints (host and path) with their own statistics, per
+host. The Requests to more endpoints are counted in one 'other' endpoint,
+so the memory used does not depend on the length of the session.
+"""
+MAX_ENDPOINTS = 100
+OTHER_ENDPOINTS = '(other)'
+
+"""
+Maximum number of hosts with their own statistics. The Requests to more
+hosts are counted in one 'other hosts' host, like the endpoints.
+"""
+MAX_HOSTS = 100
+OTHER_HOSTS = '(other hosts)'
+
+"""
+Upper bounds (msec) of the buckets of the exact latency distribution, the
+last bucket has NO_BOUND
+"""
+DISTRIBUTION_BOUNDS = (10, 100, 1000, 10000)
+NO_BOUND = 1e15
+
+"""
+Interval (in msec) in which the changes in the statistics are collected
+before statsChanged is emitted
+"""
+STATS_INTERVAL = 1000
+
+
+class LatencyHistogram(object):
+    """
+    Mergeable histogram of latencies (msec) with logarithmic buckets, like
+    an HDR histogram: memory is bound by the number of buckets (a few
+    hundred for latencies up to hours), the percentiles have a relative
+    error of at most (GROWTH - 1) / 2.
+    """
+
+    __slots__ = ('buckets', 'count')
+
+    def __init__(self):
+        # bucket index -> count, bucket 0 holds the latencies up to 1 msec
+        self.buckets = {}
+        self.count = 0
+
+    def add(self, value):
+        index = int(math.log(value) / LOG_GROWTH) + 1 if value > 1 else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram to this one
+
+        :param other: LatencyHistogram
+        """
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+
+    def percentile(self, q):
+        """
+        :param q: float percentile (0 - 100)
+        :return: float latency (msec), the middle of its bucket, or None
+        """
+        if self.count == 0:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                if index == 0:
+                    return 1.0
+                return GROWTH ** (index - 0.5)
+        return GROWTH ** (max(self.buckets) - 0.5)
+
+
+class RequestStats(object):
+    """
+    The statistics of a group of Requests (to one host or endpoint). Canceled
+    Requests (mostly by QGIS itself, e.g. when the map is panned) are counted
+    apart from the errors, so they do not count in the error rate.
+    """
+
+    __slots__ = ('count', 'errors', 'canceled', 'timeouts', 'bytes', 'transfer_bytes', 'transfer_ms', 'latency')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.canceled = 0
+        self.timeouts = 0
+        self.bytes = 0
+        # bytes received after the first download progress, and the time
+        # (msec) in which they were received, of the Requests with more than
+        # one download progress (see RequestRecord.download_span), for the
+        # effective throughput
+        self.transfer_bytes = 0
+        self.transfer_ms = 0
+        self.latency = LatencyHistogram()
+
+    def add(self, record):
+        """
+        Count a finished Request
+
+        :param record: RequestRecord
+        """
+        self.count += 1
+        if record.status == ERROR:
+            self.errors += 1
+        elif record.status == CANCELED:
+            self.canceled += 1
+        if record.end_ns is not None:
+            self.latency.add(record.time)
+            span = record.download_span()
+            if span is not None:
+                self.transfer_bytes += span[0]
+                self.transfer_ms += span[1]
+
+    def merge(self, other):
+        """
+        :param other: RequestStats to add to these
+        """
+        self.count += other.count
+        self.errors += other.errors
+        self.canceled += other.canceled
+        self.timeouts += other.timeouts
+        self.bytes += other.bytes
+        self.transfer_bytes += other.transfer_bytes
+        self.transfer_ms += other.transfer_ms
+        self.latency.merge(other.latency)
+
+    def error_rate(self):
+        """
+        :return: float fraction of the Requests that failed with an error
+        (not canceled)
+        """
+        return self.errors / self.count if self.count else 0.0
+
+    def throughput(self):
+        """
+        :return: float bytes per second, while transferring
+        """
+        return self.transfer_bytes * 1000 / self.transfer_ms if self.transfer_ms else 0.0
+
+
+class HostStats(RequestStats):
+    """
+    The statistics of the Requests to one host, and per endpoint (path)
+    """
+
+    __slots__ = ('endpoints',)
+
+    def __init__(self):
+        super().__init__()
+        self.endpoints = {}
+
+    def endpoint(self, path):
+        """
+        :param path: string path of the url
+        :return: RequestStats of this endpoint, or of the 'other' endpoints
+        when there are MAX_ENDPOINTS already
+        """
+        stats = self.endpoints.get(path)
+        if stats is None:
+            if len(self.endpoints) >= MAX_ENDPOINTS:
+                path = OTHER_ENDPOINTS
+                stats = self.endpoints.get(path)
+            if stats is None:
+                stats = self.endpoints[path] = RequestStats()
+        return stats
+
+
+class ExactStats(object):
+    """
+    Exact statistics of (a part of) the Requests of a ColumnSnapshot: the
+    latency percentiles, the median server wait and transfer time, and the
+    number of Requests per latency bucket (see DISTRIBUTION_BOUNDS)
+    """
+
+    __slots__ = ('latencies', 'wait', 'transfer', 'distribution')
+
+    def __init__(self, snapshot, percentiles, mask=None):
+        """
+        :param snapshot: ColumnSnapshot
+        :param percentiles: list of float percentiles (0 - 100)
+        :param mask: numpy boolean array from snapshot.mask(), or None for all
+        """
+        latencies = snapshot.percentiles(percentiles, mask)
+        self.latencies = [None] * len(percentiles) if latencies is None else latencies.tolist()
+        wait, transfer = snapshot.phases_ms(mask)
+        self.wait = float(numpy.median(wait)) if len(wait) else None
+        self.transfer = float(numpy.median(transfer)) if len(transfer) else None
+        counts, _ = snapshot.histogram((0,) + DISTRIBUTION_BOUNDS + (NO_BOUND,), mask)
+        self.distribution = counts.tolist()
+
+
+class StatsEngine(QObject):
+    """
+    Streaming statistics of all captured Requests, per host and per endpoint:
+    counts, error rates, latency percentiles, bytes and throughput.
+
+    It follows the CaptureStore: received bytes are counted upon download
+    progress, time outs and the other statistics when a Request finishes.
+    As it only keeps aggregates (see LatencyHistogram, MAX_HOSTS and
+    MAX_ENDPOINTS), it keeps counting after Requests are evicted, with
+    bounded memory.
+    """
+
+    # emitted at most every STATS_INTERVAL msec when the statistics changed
+    statsChanged = pyqtSignal()
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.hosts = {}
+        # bytes already counted of the Requests that are still downloading
+        self.received = {}
+
+        self.changed_timer = QTimer(self)
+        self.changed_timer.setSingleShot(True)
+        self.changed_timer.timeout.connect(self.statsChanged)
+
+        self.store.requestFinished.connect(self.request_finished)
+        self.store.requestTimedOut.connect(self.request_timed_out)
+        self.store.requestProgress.connect(self.download_progress)
+        self.store.requestsEvicted.connect(self.requests_evicted)
+        self.store.cleared.connect(self.reset)
+
+    def host(self, record):
+        """
+        :param record: RequestRecord
+        :return: HostStats of the host of the Request, or of the 'other hosts'
+        when there are MAX_HOSTS already
+        """
+        name = record.url.host()
+        stats = self.hosts.get(name)
+        if stats is None:
+            if len(self.hosts) >= MAX_HOSTS:
+                name = OTHER_HOSTS
+                stats = self.hosts.get(name)
+            if stats is None:
+                stats = self.hosts[name] = HostStats()
+        return stats
+
+    def changed(self):
+        if not self.changed_timer.isActive():
+            self.changed_timer.start(STATS_INTERVAL)
+
+    # slot for store.requestProgress
+    def download_progress(self, record):
+        received = record.received_bytes()
+        delta = received - self.received.get(record.id, 0)
+        if delta <= 0:
+            return
+        self.received[record.id] = received
+        host = self.host(record)
+        host.bytes += delta
+        host.endpoint(record.url.path()).bytes += delta
+        self.changed()
+
+    # slot for store.requestTimedOut
+    def request_timed_out(self, record):
+        host = self.host(record)
+        host.timeouts += 1
+        host.endpoint(record.url.path()).timeouts += 1
+        self.changed()
+
+    # slot for store.requestFinished
+    def request_finished(self, record):
+        self.received.pop(record.id, None)
+        host = self.host(record)
+        host.add(record)
+        host.endpoint(record.url.path()).add(record)
+        self.changed()
+
+    # slot for store.requestsEvicted
+    def requests_evicted(self, records):
+        # evicted pending Requests never finish (for the store)
+        for record in records:
+            self.received.pop(record.id, None)
+
+    # slot for store.cleared
+    def reset(self):
+        self.hosts = {}
+        self.received = {}
+        self.statsChanged.emit()
+
+    def total(self):
+        """
+        :return: RequestStats of all Requests, merged from all hosts
+        """
+        total = RequestStats()
+        for stats in self.hosts.values():
+            total.merge(stats)
+        return total
+
+    def exact_stats(self, percentiles):
+        """
+        Exact statistics per host, vectorized over the ColumnStore of the
+        CaptureStore (so over its history of Requests), created upon the first
+        call
+
+        :param percentiles: list of float percentiles (0 - 100)
+        :return: dictionary with the ExactStats per host (not of the 'other
+        hosts'), and of all hosts (key None), or None when NumPy is not installed or the history is
+        switched off
+        """
+        columns = self.store.column_store()
+        if columns is None:
+            return None
+        snapshot = columns.snapshot()
+        exact = {None: ExactStats(snapshot, percentiles)}
+        for host in self.hosts:
+            if host == OTHER_HOSTS:
+                continue
+            exact[host] = ExactStats(snapshot, percentiles, snapshot.mask(host=host))
+        return exact
@@ -0,0 +1,622 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+import time
+from collections import deque
+
+from qgis.PyQt.QtCore import (
+    QObject,
+    Qt,
+    QTimer,
+    pyqtSignal
+)
+from qgis.PyQt.QtNetwork import (
+    QNetworkAccessManager,
+    QNetworkRequest,
+    QNetworkReply
+)
+from qgis.core import (
+    QgsNetworkAccessManager,
+    QgsNetworkReplyContent,
+    QgsNetworkRequestParameters
+)
+
+from .retention import (
+    RetentionPolicy,
+    EVICT_BATCH
+)
+from .index import (
+    SearchIndex
+)
+from .columns import (
+    ColumnStore
+)
+
+# get the logger for this QgisNetworkLogger plugin
+import logging
+from . import LOGGER_NAME
+log = logging.getLogger(LOGGER_NAME)
+
+"""
+Constants for the different 'Statuses' a NetworkRequest can be in.
+"""
+PENDING = 'PENDING'
+COMPLETE = 'COMPLETE'
+ERROR = 'ERROR'
+TIMEOUT = 'TIMEOUT'
+CANCELED = 'CANCELED'
+
+"""
+Interval (in msec) after a new Request in which the retention policy is
+applied, so eviction is done for a burst of Requests at once
+"""
+RETENTION_INTERVAL = 100
+
+"""
+Interned raw header names: most requests send and receive the same headers
+(User-Agent, Accept, Content-Type...), so they share one bytes object per name
+"""
+HEADER_NAMES = {}
+
+
+def intern_header(name):
+    """
+    Return the shared copy of this raw header name
+
+    :param name: bytes
+    :return: bytes
+    """
+    return HEADER_NAMES.setdefault(name, name)
+
+
+class CaptureStore(QObject):
+    """
+    Headless store of all captured Requests (and their Replies).
+
+    Is responsible for:
+    - connecting to current QgsNetworkAccessManager, and creating a compact
+    RequestRecord for every Request it fires
+    - retaining those records according to the RetentionPolicy
+    - keeping the SearchIndex of the retained records up to date
+
+    The NAM signals are connected directly (Qt.DirectConnection), so the
+    capture_* slots run as soon as the signal is emitted. They only take a
+    (monotonic, high resolution) timestamp, copy the raw data and put it in
+    the thread safe events queue. The queue is drained in batches, where the
+    records are updated and the views notified, so this work is not done per
+    signal. Note that QGIS relays the signals of the NAM's of other threads
+    (e.g. of map rendering) to the main NAM over a queued connection, so the
+    signals of their Requests are emitted on the GUI thread, and their
+    timings do include the time waiting for a busy GUI thread.
+
+    The records are kept in a dictionary, ordered by age, which acts as a ring
+    buffer: new records are appended, the oldest are evicted. Views (like the
+    ActivityModel) are optional, they are only attached when the dock is shown
+    for the first time, and follow the store via its signals.
+    """
+
+    requestAdded = pyqtSignal(object)
+    requestFinished = pyqtSignal(object)
+    requestTimedOut = pyqtSignal(object)
+    requestProgress = pyqtSignal(object)
+    requestSslErrors = pyqtSignal(object)
+    requestsEvicted = pyqtSignal(list)
+    cleared = pyqtSignal()
+    # emitted (from any thread) when the events queue needs to be drained
+    eventsQueued = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.is_paused = False
+
+        # nam = NAM = NetworkAccessManager is a singleton who is responsible
+        # for all network requests, use of proxy etc etc
+        self.nam = QgsNetworkAccessManager.instance()
+
+        # dictionary with all RequestRecord's, oldest first.
+        # the requestId() of a QgsNetworkRequestParameters is the name/key in
+        # this dictionary. This requestId is just an unique counter from the
+        # NAM
+        self.records = {}
+
+        # (handler, arguments) tuples queued by the capture_* slots, to be
+        # handled on the GUI thread by drain_events()
+        self.events = deque()
+        self.drain_scheduled = False
+        self.eventsQueued.connect(self.drain_events, Qt.QueuedConnection)
+
+        # inverted index of the text of all retained records, for text:
+        # queries, only built upon the first search
+        self.index = SearchIndex(self)
+
+        # columnar copy of the numbers of the last Requests (more than are
+        # retained), for vectorized statistics. Only created upon the first
+        # use, see column_store()
+        self.columns = None
+
+        # the retention policy decides which of the oldest records are
+        # evicted, at most EVICT_BATCH at a time, the evict_timer takes care
+        # of the rest. retained_bytes is the estimated size of all captures,
+        # failed requests are also counted separately as they have their
+        # own quota.
+        self.retention = RetentionPolicy()
+        self.retained_bytes = 0
+        self.failed_count = 0
+        self.failed_bytes = 0
+        self.evict_timer = QTimer(self)
+        self.evict_timer.setSingleShot(True)
+        self.evict_timer.timeout.connect(self.apply_retention)
+        # when there is a maximum age, also evict when no requests come in
+        self.age_timer = QTimer(self)
+        self.age_timer.setInterval(1000)
+        self.age_timer.timeout.connect(self.apply_retention)
+        self.retention_changed()
+
+        # let us connect (directly) to all signals the NAM is throwing so we
+        # can react:
+        self.nam.requestAboutToBeCreated[QgsNetworkRequestParameters]\
+            .connect(self.capture_request, Qt.DirectConnection)
+        self.nam.finished[QgsNetworkReplyContent].connect(self.capture_reply, Qt.DirectConnection)
+        self.nam.requestTimedOut[QgsNetworkRequestParameters]\
+            .connect(self.capture_timeout, Qt.DirectConnection)
+        self.nam.downloadProgress.connect(self.capture_progress, Qt.DirectConnection)
+        self.nam.requestEncounteredSslErrors.connect(self.capture_ssl_errors, Qt.DirectConnection)
+
+    def queue_event(self, handler, *args):
+        """
+        Put an event in the (thread safe) events queue, and make sure it gets
+        drained on the GUI thread. Can be called from any thread.
+
+        :param handler: method to call on the GUI thread
+        :param args: arguments for the handler
+        """
+        self.events.append((handler, args))
+        if not self.drain_scheduled:
+            self.drain_scheduled = True
+            self.eventsQueued.emit()
+
+    def drain_events(self):
+        """
+        Handle all queued events, on the GUI thread
+        """
+        self.drain_scheduled = False
+        while self.events:
+            handler, args = self.events.popleft()
+            handler(*args)
+
+    # direct slot for nam.requestAboutToBeCreated[QgsNetworkRequestParameters]
+    def capture_request(self, request_params):
+        # the record copies everything it needs, as request_params is only
+        # valid during this call
+        record = RequestRecord(request_params, time.perf_counter_ns())
+        columns = self.columns
+        if columns is not None:
+            columns.append(record)
+        self.queue_event(self.request_about_to_be_created, record)
+
+    # direct slot for nam.finished[QgsNetworkReplyContent]
+    def capture_reply(self, reply):
+        self.queue_event(self.request_finished, ReplyCapture(reply, time.perf_counter_ns()))
+
+    # direct slot for nam.requestTimedOut[QgsNetworkRequestParameters]
+    def capture_timeout(self, request_params):
+        self.queue_event(self.request_timed_out, request_params.requestId(), time.perf_counter_ns())
+
+    # direct slot for nam.downloadProgress
+    def capture_progress(self, requestId, received, total):
+        self.queue_event(self.download_progress, requestId, received, total, time.perf_counter_ns())
+
+    # direct slot for nam.requestEncounteredSslErrors
+    def capture_ssl_errors(self, requestId, errors):
+        self.queue_event(self.ssl_errors, requestId, [error.errorString() for error in errors])
+
+    def request_about_to_be_created(self, record):
+        self.records[record.id] = record
+        self.account(record, 1)
+        self.index.add_request(record)
+        if self.columns is not None and record.column_row is None:
+            # captured while the ColumnStore was created
+            self.columns.append(record)
+        self.requestAdded.emit(record)
+        if not self.evict_timer.isActive():
+            self.evict_timer.start(RETENTION_INTERVAL)
+
+    def request_finished(self, reply):
+        record = self.records.get(reply.request_id)
+        if record is None:
+            return
+        self.account(record, -1)
+        record.set_reply(reply)
+        self.account(record, 1)
+        self.index.add_reply(record)
+        if self.columns is not None:
+            self.columns.update(record)
+        self.requestFinished.emit(record)
+
+    def request_timed_out(self, requestId, timestamp):
+        record = self.records.get(requestId)
+        if record is None:
+            return
+        self.account(record, -1)
+        record.set_timed_out(timestamp)
+        self.account(record, 1)
+        self.requestTimedOut.emit(record)
+
+    def ssl_errors(self, requestId, errors):
+        record = self.records.get(requestId)
+        if record is None:
+            return
+        self.account(record, -1)
+        record.set_ssl_errors(errors)
+        self.account(record, 1)
+        self.requestSslErrors.emit(record)
+
+    def download_progress(self, requestId, received, total, timestamp):
+        record = self.records.get(requestId)
+        if record is None:
+            return
+        record.set_progress(received, total, timestamp)
+        if self.columns is not None:
+            self.columns.update(record)
+        self.requestProgress.emit(record)
+
+    def account(self, record, sign):
+        """
+        Add (sign=1) or subtract (sign=-1) the size of this Request to or from
+        the retained totals used by the retention policy
+
+        :param record: RequestRecord in the store
+        :param sign: int 1 or -1
+        """
+        self.retained_bytes += sign * record.size
+        if record.is_failed():
+            self.failed_count += sign
+            self.failed_bytes += sign * record.size
+
+    def apply_retention(self):
+        """
+        Evict the oldest Requests which are over the limits of the retention
+        policy. At most EVICT_BATCH Requests are evicted in one go, if there
+        are more, the next batch is scheduled.
+        """
+        evicted = self.retention.select_evictions(self.records.values(),
+                                                  self.retained_bytes - self.failed_bytes,
+                                                  self.failed_count, time.time())
+        if evicted:
+            self.evict(evicted)
+            if len(evicted) >= EVICT_BATCH:
+                self.evict_timer.start(0)
+
+    def evict(self, records):
+        """
+        Remove these records from the store, and let the views know
+
+        :param records: list of RequestRecord's
+        """
+        for record in records:
+            del self.records[record.id]
+            self.account(record, -1)
+        self.index.remove(records)
+        self.requestsEvicted.emit(records)
+
+    def retention_changed(self):
+        """
+        To be called after the limits of the retention policy are changed
+        """
+        if self.retention.max_age > 0:
+            self.age_timer.start()
+        else:
+            self.age_timer.stop()
+        self.apply_retention()
+        if self.columns is not None and self.columns.capacity != self.retention.stats_history:
+            # recreate it with the new capacity, from the retained Requests
+            self.columns = None
+            self.column_store()
+
+    def column_store(self):
+        """
+        Return the ColumnStore with the numbers of the last
+        retention.stats_history Requests. It is created upon the first call,
+        from the retained Requests.
+
+        :return: ColumnStore, or None when NumPy is not installed or the
+        history is switched off
+        """
+        if self.columns is None and self.retention.stats_history > 0:
+            if not ColumnStore.available():
+                return None
+            # handle what is captured up to now first, so all those Requests
+            # are in the records
+            self.drain_events()
+            columns = ColumnStore(self.retention.stats_history)
+            for record in self.records.values():
+                columns.append(record)
+                columns.update(record)
+            self.columns = columns
+        return self.columns
+
+    def clear(self):
+        """
+        Clear all records so we can start with a clean sheet.
+        """
+        # handle what is captured up to now first, to not get replies of
+        # unknown requests
+        self.drain_events()
+        self.records = {}
+        self.retained_bytes = 0
+        self.failed_count = 0
+        self.failed_bytes = 0
+        self.index.clear()
+        if self.columns is not None:
+            self.columns.clear()
+        self.cleared.emit()
+
+    def pause(self, state):
+        """
+        Toggle the logging by temporary (dis)connecting the
+        requestAboutToBeCreated signal from our
+        request_about_to_be_created slot
+        :param state:
+        """
+        if state == self.is_paused:
+            return
+
+        self.is_paused = state
+        if self.is_paused:
+            self.nam.requestAboutToBeCreated[QgsNetworkRequestParameters].disconnect(
+                self.capture_request)
+        else:
+            self.nam.requestAboutToBeCreated[QgsNetworkRequestParameters].connect(
+                self.capture_request, Qt.DirectConnection)
+
+    def close(self):
+        """
+        Stop capturing: disconnect from the NAM (which outlives the plugin),
+        stop the timers (also of the SearchIndex) and release the ColumnStore
+        """
+        if not self.is_paused:
+            self.nam.requestAboutToBeCreated[QgsNetworkRequestParameters].disconnect(self.capture_request)
+            self.is_paused = True
+        self.nam.finished[QgsNetworkReplyContent].disconnect(self.capture_reply)
+        self.nam.requestTimedOut[QgsNetworkRequestParameters].disconnect(self.capture_timeout)
+        self.nam.downloadProgress.disconnect(self.capture_progress)
+        self.nam.requestEncounteredSslErrors.disconnect(self.capture_ssl_errors)
+        self.evict_timer.stop()
+        self.age_timer.stop()
+        self.index.close()
+        self.events.clear()
+        self.columns = None
+
+
+class RequestRecord(object):
+    """
+    Compact (raw) capture of a Request fired via the NAM and, when finished,
+    of its Reply. Everything that needs decoding or formatting is only done
+    when a view asks for it.
+
+    start_time is the wall clock time (for display and age), start_ns,
+    end_ns (and first_progress_ns, last_progress_ns and timeout_ns) are
+    time.perf_counter_ns() timestamps taken when the (main) NAM emitted its
+    signals, used for all durations. The progress timestamps split a Request in its
+    server wait and transfer phase, see wait_ms and transfer_ms.
+
+    As a record is kept for every retained Request, it uses __slots__, and
+    keeps (only) one raw copy of the headers, with interned header names.
+    """
+
+    __slots__ = ('url', 'id', 'operation', 'start_time', 'start_ns', 'end_ns', 'time', 'thread', 'initiator',
+                 'initiator_id', 'cache_load_control', 'cache_save_control', 'raw_headers', 'raw_data', 'size',
+                 'http_status', 'content_type', 'progress', 'replies', 'replied', 'error_code', 'error_string',
+                 'from_cache', 'raw_reply_headers', 'status', 'ssl_errors', 'url_lower', 'host_lower',
+                 'first_progress_ns', 'first_progress_bytes', 'last_progress_ns', 'timeout_ns', 'column_row',
+                 '__weakref__')
+
+    def __init__(self, request, timestamp):
+        self.url = request.request().url()
+        self.id = request.requestId()
+        self.operation = operation2string(request.operation())
+        self.start_time = time.time()
+        self.start_ns = timestamp
+        self.end_ns = None
+        # timestamps of the first download progress (approximately the first
+        # byte), of the last download progress and of the time out, if any
+        self.first_progress_ns = None
+        self.last_progress_ns = None
+        self.timeout_ns = None
+        # bytes received with the first download progress, those did not
+        # take (measurable) transfer time
+        self.first_progress_bytes = 0
+        # absolute position in the ColumnStore, if any
+        self.column_row = None
+        self.time = self.start_time
+        self.thread = request.originatingThreadId()
+        self.initiator = request.initiatorClassName()
+        self.initiator_id = request.initiatorRequestId()
+        self.cache_load_control = request.request().attribute(QNetworkRequest.CacheLoadControlAttribute)
+        self.cache_save_control = request.request().attribute(QNetworkRequest.CacheSaveControlAttribute)
+        self.raw_headers = tuple((intern_header(header.data()), request.request().rawHeader(header).data())
+                                 for header in request.request().rawHeaderList())
+        self.raw_data = request.content().data()
+        # estimated size (in bytes) of the captured url, headers and content
+        self.size = len(self.url.url()) + len(self.raw_data) + \
+            sum(len(header) + len(value) for header, value in self.raw_headers)
+        self.http_status = -1
+        self.content_type = ''
+        self.progress = None
+        self.replies = 0
+
+        # raw capture of the reply, set in set_reply()
+        self.replied = False
+        self.error_code = QNetworkReply.NoError
+        self.error_string = ''
+        self.from_cache = False
+        self.raw_reply_headers = ()
+
+        self.status = PENDING
+        self.ssl_errors = False
+        self.url_lower = None
+        self.host_lower = None
+
+    def lower_url(self):
+        """Lowercase url (string), to filter on. Only created when needed,
+        but then cached"""
+        if self.url_lower is None:
+            self.url_lower = self.url.url().lower()
+        return self.url_lower
+
+    def lower_host(self):
+        """Lowercase host (string), to filter on. Cached like lower_url"""
+        if self.host_lower is None:
+            self.host_lower = self.url.host().lower()
+        return self.host_lower
+
+    def received_bytes(self):
+        """Number of bytes received so far (from the download progress)"""
+        return self.progress[0] if self.progress else 0
+
+    def wait_ms(self):
+        """Server wait (msec): from the start up to the first download
+        progress, approximately the time to first byte. None without progress"""
+        if self.first_progress_ns is None:
+            return None
+        return (self.first_progress_ns - self.start_ns) / 1000000
+
+    def transfer_ms(self):
+        """Transfer time (msec): from the first download progress up to the
+        finish, or up to the last progress while pending. None without progress"""
+        if self.first_progress_ns is None:
+            return None
+        end_ns = self.end_ns if self.end_ns is not None else self.last_progress_ns
+        return max(end_ns - self.first_progress_ns, 0) / 1000000
+
+    def download_span(self):
+        """(bytes, msec) tuple of the bytes received after the first download
+        progress, and the time between the first and the last progress. None
+        when there was only one progress event: the time in which the bytes of
+        the first event arrived is unknown"""
+        if self.first_progress_ns is None or self.replies < 2 or \
+                self.last_progress_ns <= self.first_progress_ns:
+            return None
+        return (self.received_bytes() - self.first_progress_bytes,
+                (self.last_progress_ns - self.first_progress_ns) / 1000000)
+
+    def download_rate(self):
+        """Download rate (bytes per second) during the transfer, or None when
+        it cannot be measured (see download_span)"""
+        span = self.download_span()
+        if span is None:
+            return None
+        received, span_ms = span
+        return received * 1000 / span_ms
+
+    @property
+    def headers(self):
+        """Request headers as list of decoded (header, value) tuples"""
+        return [(header.decode('utf-8'), value.decode('utf-8')) for header, value in self.raw_headers]
+
+    @property
+    def reply_headers(self):
+        """Reply headers as list of decoded (header, value) tuples"""
+        return [(header.decode('utf-8'), value.decode('utf-8')) for header, value in self.raw_reply_headers]
+
+    @property
+    def data(self):
+        """Decoded content (data) of the request"""
+        return self.raw_data.decode('utf-8')
+
+    def set_reply(self, reply):
+        """
+        :param reply: ReplyCapture
+        """
+        if reply.error_code == QNetworkReply.OperationCanceledError:
+            self.status = CANCELED
+        elif reply.error_code != QNetworkReply.NoError:
+            self.status = ERROR
+        else:
+            self.status = COMPLETE
+        self.end_ns = reply.timestamp
+        self.time = (self.end_ns - self.start_ns) // 1000000
+        self.http_status = reply.http_status
+        self.content_type = reply.content_type
+        self.error_code = reply.error_code
+        self.error_string = reply.error_string
+        self.from_cache = reply.from_cache
+        self.raw_reply_headers = reply.raw_headers
+        self.size += sum(len(header) + len(value) for header, value in self.raw_reply_headers)
+        self.replied = True
+
+    def set_timed_out(self, timestamp):
+        self.status = TIMEOUT
+        self.timeout_ns = timestamp
+
+    def set_progress(self, received, total, timestamp):
+        if self.first_progress_ns is None:
+            self.first_progress_ns = timestamp
+            self.first_progress_bytes = received
+        self.last_progress_ns = timestamp
+        self.replies += 1
+        self.progress = (received, total)
+
+    def set_ssl_errors(self, errors):
+        """
+        :param errors: list of error strings
+        """
+        self.ssl_errors = errors
+
+    def is_failed(self):
+        """
+        Return True if this Request did not succeed (error, timeout, canceled
+        or SSL errors), those are retained longer by the RetentionPolicy
+        """
+        return self.status in (ERROR, TIMEOUT, CANCELED) or bool(self.ssl_errors)
+
+
+class ReplyCapture(object):
+    """
+    Raw capture of a QgsNetworkReplyContent, copied in the (direct) slot as
+    the reply content is only valid during the signal emission
+    """
+
+    __slots__ = ('request_id', 'timestamp', 'error_code', 'error_string', 'http_status', 'from_cache',
+                 'content_type', 'raw_headers')
+
+    def __init__(self, reply, timestamp):
+        self.request_id = reply.requestId()
+        self.timestamp = timestamp
+        self.error_code = reply.error()
+        self.error_string = reply.errorString()
+        self.http_status = reply.attribute(QNetworkRequest.HttpStatusCodeAttribute)
+        self.from_cache = reply.attribute(QNetworkRequest.SourceIsFromCacheAttribute)
+        self.content_type = reply.rawHeader(b'Content-Type').data().decode('utf-8')
+        self.raw_headers = tuple((intern_header(header.data()), reply.rawHeader(header).data())
+                                 for header in reply.rawHeaderList())
+
+
+def operation2string(operation):
+    """ Create http-operation String from Operation
+
+    :param operation: QNetworkAccessManager.Operation
+    :return: string
+    """
+    op = "Custom"
+    if operation == QNetworkAccessManager.HeadOperation:
+        op = "HEAD"
+    elif operation == QNetworkAccessManager.GetOperation:
+        op = "GET"
+    elif operation == QNetworkAccessManager.PutOperation:
+        op = "PUT"
+    elif operation == QNetworkAccessManager.PostOperation:
+        op = "POST"
+    elif operation == QNetworkAccessManager.DeleteOperation:
+        op = "DELETE"
+    return op
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+"""
+Benchmark of the CaptureStore and the ActivityModel with synthetic requests:
+the memory used per request (with tracemalloc), the pauses of the cyclic
+garbage collector under sustained load (with gc.callbacks), and the work left
+to that collector when the requests are cleared.
+
+Runs without QGIS (see qgis_stubs), on this plugin or on a checkout of
+another version of it, to compare before and after a change:
+
+    python test/benchmark.py [plugin_dir]
+"""
+
+import gc
+import logging
+import sys
+import time
+import tracemalloc
+
+import qgis_stubs
+from qgis_stubs import (
+    FakeReplyContent,
+    fake_request
+)
+
+"""
+Number of requests kept in memory to measure the bytes per request
+"""
+MEMORY_REQUESTS = 10000
+
+"""
+Number of requests of the sustained load, the number of retained requests
+(the older ones are evicted), the number of requests between two (stubbed)
+timer rounds, and every how many requests one is expanded in the view
+"""
+LOAD_REQUESTS = 200000
+LOAD_MAX_COUNT = 10000
+BURST = 100
+EXPAND_EVERY = 10
+
+
+class Benchmark(object):
+
+    def __init__(self, plugin, max_count):
+        from qgisnetworklogger.model import ActivityModel
+        from qgisnetworklogger.store import CaptureStore
+
+        # the debug messages of the plugin are not part of the measurement
+        logging.getLogger(plugin.LOGGER_NAME).setLevel(logging.WARNING)
+        qgis_stubs.QgsNetworkAccessManager.reset()
+        self.nam = qgis_stubs.QgsNetworkAccessManager.instance()
+        self.store = CaptureStore()
+        self.store.retention.max_count = max_count
+        self.store.retention.max_age = 0
+        self.store.retention.max_size = 0
+        self.model = ActivityModel(self.store)
+        self.fired = 0
+
+    def fire(self, count, expand_every=0):
+        """
+        Let the NAM fire (and finish) count requests, then run what the
+        timers of the store and the model would do
+
+        :param count: int number of requests
+        :param expand_every: int, expand (fetch the details of) every so many
+        requests, like a user looking at them, or 0 for none
+        """
+        first = self.fired
+        self.fired += count
+        for request_id in range(first, self.fired):
+            self.nam.requestAboutToBeCreated.emit(fake_request(request_id))
+            self.nam.downloadProgress.emit(request_id, 500, 1000)
+            self.nam.downloadProgress.emit(request_id, 1000, 1000)
+            self.nam.finished.emit(FakeReplyContent(request_id))
+        self.store.drain_events()
+        self.model.flush_inserts()
+        self.model.flush_progress()
+        if expand_every:
+            for item in self.model.root_item.children[-count::expand_every]:
+                if item.can_fetch_more():
+                    item.fetch_more()
+        while self.store.evict_timer.isActive():
+            self.store.evict_timer.stop()
+            self.store.apply_retention()
+
+
+def measure_memory(plugin):
+    """
+    :return: tuple with the bytes per request, with the requests collapsed
+    and with all requests expanded
+    """
+    benchmark = Benchmark(plugin, MEMORY_REQUESTS)
+    # warm up, so the interned strings and caches are not counted
+    benchmark.fire(BURST, 1)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for _ in range(0, MEMORY_REQUESTS - BURST, BURST):
+            benchmark.fire(BURST)
+        gc.collect()
+        collapsed = tracemalloc.get_traced_memory()[0] - start
+        for item in benchmark.model.root_item.children:
+            if item.can_fetch_more():
+                item.fetch_more()
+        gc.collect()
+        expanded = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    requests = MEMORY_REQUESTS - BURST
+    return collapsed / requests, expanded / requests
+
+
+def measure_gc(plugin):
+    """
+    :return: tuple with the number of collections, the number of generation 2
+    collections, the longest pause and the total pause (in msec), and the
+    number of objects the collector had to free
+    """
+    benchmark = Benchmark(plugin, LOAD_MAX_COUNT)
+    benchmark.fire(LOAD_MAX_COUNT, EXPAND_EVERY)
+    gc.collect()
+    pauses = []
+    started = []
+
+    def callback(phase, info):
+        if phase == 'start':
+            started.append(time.perf_counter())
+        elif started:
+            pauses.append((info['generation'], (time.perf_counter() - started.pop()) * 1000, info['collected']))
+
+    gc.callbacks.append(callback)
+    try:
+        for _ in range(0, LOAD_REQUESTS, BURST):
+            benchmark.fire(BURST, EXPAND_EVERY)
+    finally:
+        gc.callbacks.remove(callback)
+    return (len(pauses),
+            sum(1 for generation, _, _ in pauses if generation == 2),
+            max((pause for _, pause, _ in pauses), default=0.0),
+            sum(pause for _, pause, _ in pauses),
+            sum(collected for _, _, collected in pauses))
+
+
+def measure_clear(plugin):
+    """
+    :return: tuple with the number of objects of the cleared requests that
+    only the cyclic garbage collector could free, and the time (in msec) of
+    that collection
+    """
+    benchmark = Benchmark(plugin, LOAD_MAX_COUNT)
+    benchmark.fire(LOAD_MAX_COUNT, EXPAND_EVERY)
+    gc.collect()
+    benchmark.model.clear()
+    start = time.perf_counter()
+    collected = gc.collect()
+    return collected, (time.perf_counter() - start) * 1000
+
+
+def main(plugin_dir=qgis_stubs.PLUGIN_DIR):
+    plugin = qgis_stubs.load_plugin(plugin_dir)
+    print('plugin: {}'.format(plugin_dir))
+    collapsed, expanded = measure_memory(plugin)
+    print('memory per request: {:.0f} bytes, {:.0f} bytes expanded'.format(collapsed, expanded))
+    collections, full_collections, longest, total, collected = measure_gc(plugin)
+    print('gc under load of {} requests ({} retained): {} collections ({} of generation 2), '
+          'longest pause {:.1f} msec, total {:.1f} msec, {} objects collected'.format(
+              LOAD_REQUESTS, LOAD_MAX_COUNT, collections, full_collections, longest, total, collected))
+    collected, pause = measure_clear(plugin)
+    print('gc after clearing {} requests: {} objects collected in {:.1f} msec'.format(
+        LOAD_MAX_COUNT, collected, pause))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+"""
+Minimal stand-ins for the qgis (and qgis.PyQt) modules, so the capture,
+retention and model logic of the plugin can be tested (and measured) with
+plain Python, without a QGIS installation.
+
+Signals are called synchronously, timers never fire by themselves (a test
+calls the handlers, like apply_retention or flush_inserts, itself) and the
+item models do not notify any view.
+
+Call install() before importing the plugin with load_plugin().
+"""
+
+import importlib.util
+import os
+import sys
+import types
+
+PLUGIN_NAME = 'qgisnetworklogger'
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+"""
+Raw headers of the fake requests and replies, like QGIS sends and receives
+them for a WMS GetMap request
+"""
+REQUEST_HEADERS = (
+    (b'User-Agent', b'Mozilla/5.0 QGIS/31000'),
+    (b'Accept', b'*/*'),
+    (b'Accept-Encoding', b'gzip, deflate'),
+    (b'Accept-Language', b'en-US,*'),
+    (b'Connection', b'Keep-Alive')
+)
+REPLY_HEADERS = (
+    (b'Content-Type', b'image/png'),
+    (b'Content-Length', b'1000'),
+    (b'Cache-Control', b'max-age=3600'),
+    (b'Server', b'nginx'),
+    (b'Date', b'Thu, 01 Oct 2019 12:00:00 GMT')
+)
+
+
+class BoundSignal(object):
+
+    def __init__(self):
+        self.slots = []
+
+    def __getitem__(self, types):
+        # overloaded signals, like finished[QgsNetworkReplyContent]
+        return self
+
+    def connect(self, slot, connection_type=None):
+        self.slots.append(slot)
+
+    def disconnect(self, slot=None):
+        if slot is None:
+            self.slots = []
+        else:
+            self.slots.remove(slot)
+
+    def emit(self, *args):
+        for slot in list(self.slots):
+            slot(*args)
+
+    # a signal can be connected to another signal
+    __call__ = emit
+
+
+class pyqtSignal(object):
+
+    def __init__(self, *types):
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        signal = instance.__dict__.get(self.name)
+        if signal is None:
+            signal = instance.__dict__[self.name] = BoundSignal()
+        return signal
+
+
+class QObject(object):
+
+    def __init__(self, parent=None):
+        self._parent = parent
+
+
+class QTimer(QObject):
+
+    timeout = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.active = False
+        self.interval = 0
+
+    def setSingleShot(self, single_shot):
+        pass
+
+    def setInterval(self, interval):
+        self.interval = interval
+
+    def start(self, interval=None):
+        self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def isActive(self):
+        return self.active
+
+
+class Enum(object):
+    """Any attribute is a distinct int, like the Qt enums"""
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+    def __getattr__(self, name):
+        value = 1000 + len(self.__dict__)
+        setattr(self, name, value)
+        return value
+
+
+class QModelIndex(object):
+
+    def __init__(self, row=-1, column=-1, pointer=None):
+        self._row = row
+        self._column = column
+        self._pointer = pointer
+
+    def isValid(self):
+        return self._row >= 0
+
+    def row(self):
+        return self._row
+
+    def column(self):
+        return self._column
+
+    def internalPointer(self):
+        return self._pointer
+
+    def parent(self):
+        return QModelIndex()
+
+
+class QAbstractItemModel(QObject):
+
+    dataChanged = pyqtSignal()
+    rowsInserted = pyqtSignal()
+    rowsRemoved = pyqtSignal()
+    modelReset = pyqtSignal()
+    layoutChanged = pyqtSignal()
+
+    def createIndex(self, row, column, pointer=None):
+        return QModelIndex(row, column, pointer)
+
+    def index(self, row, column, parent=QModelIndex()):
+        return QModelIndex(row, column)
+
+    def beginInsertRows(self, parent, first, last):
+        pass
+
+    def endInsertRows(self):
+        pass
+
+    def beginRemoveRows(self, parent, first, last):
+        pass
+
+    def endRemoveRows(self):
+        pass
+
+    def beginResetModel(self):
+        pass
+
+    def endResetModel(self):
+        pass
+
+    def headerDataChanged(self, *args):
+        pass
+
+
+class QAbstractTableModel(QAbstractItemModel):
+    pass
+
+
+class QSortFilterProxyModel(QAbstractItemModel):
+
+    def setSourceModel(self, model):
+        pass
+
+    def setSortRole(self, role):
+        pass
+
+    def invalidateFilter(self):
+        pass
+
+
+class Anything(object):
+    """Accepts any constructor arguments and method calls"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class QgsSettings(object):
+
+    def value(self, key, default=None, type=None):
+        return default
+
+    def setValue(self, key, value):
+        pass
+
+
+class QgsNetworkAccessManager(QObject):
+
+    requestAboutToBeCreated = pyqtSignal()
+    finished = pyqtSignal()
+    requestTimedOut = pyqtSignal()
+    downloadProgress = pyqtSignal()
+    requestEncounteredSslErrors = pyqtSignal()
+
+    manager = None
+
+    @classmethod
+    def instance(cls):
+        if cls.manager is None:
+            cls.manager = cls()
+        return cls.manager
+
+    @classmethod
+    def reset(cls):
+        """
+        Let instance() create a new NAM, so the stores connected to the
+        current one no longer capture anything
+        """
+        cls.manager = None
+
+
+def module(name, **attributes):
+    stub = types.ModuleType(name)
+    stub.__dict__.update(attributes)
+    sys.modules[name] = stub
+    return stub
+
+
+def install():
+    """
+    Put the stubs in sys.modules, as the qgis (and qgis.PyQt) modules
+    """
+    if 'qgis' in sys.modules:
+        return
+    qt = Enum(UserRole=256, DisplayRole=0, ToolTipRole=3)
+    module('qgis')
+    module('qgis.PyQt')
+    module('qgis.PyQt.QtCore', QObject=QObject, QTimer=QTimer, pyqtSignal=pyqtSignal, Qt=qt,
+           QModelIndex=QModelIndex, QAbstractItemModel=QAbstractItemModel,
+           QAbstractTableModel=QAbstractTableModel, QSortFilterProxyModel=QSortFilterProxyModel,
+           QUrl=Anything, QUrlQuery=Anything, QCoreApplication=Anything, QRectF=Anything)
+    module('qgis.PyQt.QtNetwork', QNetworkAccessManager=Enum(), QNetworkRequest=Enum(),
+           QNetworkReply=Enum(NoError=0, OperationCanceledError=5))
+    module('qgis.PyQt.QtGui', QBrush=Anything, QFont=Anything, QColor=Anything, QDesktopServices=Anything)
+    module('qgis.PyQt.QtWidgets', QApplication=Anything)
+    module('qgis.core', Qgis=Enum(), QgsMessageLog=Anything(), QgsSettings=QgsSettings,
+           QgsNetworkAccessManager=QgsNetworkAccessManager, QgsNetworkReplyContent=Anything,
+           QgsNetworkRequestParameters=Anything, QgsApplication=Anything)
+
+
+def load_plugin(plugin_dir=PLUGIN_DIR):
+    """
+    Import the plugin as the PLUGIN_NAME package
+
+    :param plugin_dir: directory of the plugin, by default the parent of
+    this directory (a checkout of another version can be measured too)
+    :return: module
+    """
+    install()
+    if PLUGIN_NAME not in sys.modules:
+        spec = importlib.util.spec_from_file_location(PLUGIN_NAME, os.path.join(plugin_dir, '__init__.py'),
+                                                      submodule_search_locations=[plugin_dir])
+        plugin = importlib.util.module_from_spec(spec)
+        sys.modules[PLUGIN_NAME] = plugin
+        spec.loader.exec_module(plugin)
+    return sys.modules[PLUGIN_NAME]
+
+
+class FakeUrl(object):
+
+    def __init__(self, url, host, path):
+        self._url = url
+        self._host = host
+        self._path = path
+
+    def url(self):
+        return self._url
+
+    def host(self):
+        return self._host
+
+    def path(self):
+        return self._path
+
+
+class FakeRequest(object):
+
+    def __init__(self, url):
+        self._url = url
+
+    def url(self):
+        return self._url
+
+    def attribute(self, attribute):
+        return None
+
+    def rawHeader(self, header):
+        return FakeBytes(dict(REQUEST_HEADERS).get(bytes(header), b''))
+
+    def rawHeaderList(self):
+        # a new copy of the names for every call, like Qt returns them
+        return [FakeBytes(header) for header, _ in REQUEST_HEADERS]
+
+
+class FakeBytes(bytes):
+    """A QByteArray: bytes with data()"""
+
+    def data(self):
+        return bytes(self)
+
+
+class FakeRequestParameters(object):
+    """A QgsNetworkRequestParameters of a GET request"""
+
+    def __init__(self, request_id, url):
+        self.request_id = request_id
+        self._request = FakeRequest(url)
+
+    def request(self):
+        return self._request
+
+    def requestId(self):
+        return self.request_id
+
+    def operation(self):
+        return sys.modules['qgis.PyQt.QtNetwork'].QNetworkAccessManager.GetOperation
+
+    def originatingThreadId(self):
+        return 'thread'
+
+    def initiatorClassName(self):
+        return 'QgsWmsProvider'
+
+    def initiatorRequestId(self):
+        return None
+
+    def content(self):
+        return FakeBytes()
+
+
+class FakeReplyContent(object):
+    """A QgsNetworkReplyContent of a successful reply, or of a failed one"""
+
+    def __init__(self, request_id, error=0):
+        """
+        :param request_id: int
+        :param error: int QNetworkReply error code, 0 (NoError) for success
+        """
+        self.request_id = request_id
+        self.error_code = error
+
+    def requestId(self):
+        return self.request_id
+
+    def error(self):
+        return self.error_code
+
+    def errorString(self):
+        return 'Error {}'.format(self.error_code) if self.error_code else ''
+
+    def attribute(self, attribute):
+        return 200
+
+    def rawHeader(self, header):
+        return FakeBytes(dict(REPLY_HEADERS).get(bytes(header), b''))
+
+    def rawHeaderList(self):
+        return [FakeBytes(header) for header, _ in REPLY_HEADERS]
+
+
+def fake_request(request_id, host='example.com'):
+    """
+    :param request_id: int
+    :param host: string host of the url
+    :return: FakeRequestParameters of a WMS GetMap request
+    """
+    path = '/wms'
+    url = 'https://{}{}?SERVICE=WMS&REQUEST=GetMap&LAYERS=layer{}'.format(host, path, request_id % 100)
+    return FakeRequestParameters(request_id, FakeUrl(url, host, path))
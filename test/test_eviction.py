@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+"""
+Memory of the CaptureStore and the ActivityModel stays flat over a million
+(synthetic) requests, as evicted requests are released. Runs without QGIS,
+see qgis_stubs:
+
+    python -m unittest discover -s test
+"""
+
+import gc
+import logging
+import tracemalloc
+import unittest
+
+import qgis_stubs
+from qgis_stubs import (
+    FakeReplyContent,
+    fake_request
+)
+
+plugin = qgis_stubs.load_plugin()
+
+from qgisnetworklogger.model import ActivityModel  # noqa: E402
+from qgisnetworklogger.store import CaptureStore  # noqa: E402
+
+"""
+Number of synthetic requests, the maximum number of retained requests, and
+the number of requests between two (stubbed) timer rounds
+"""
+REQUESTS = 1000000
+MAX_COUNT = 1000
+BURST = 100
+
+"""
+Maximum growth (in bytes) of the traced memory between the first and the
+last quarter of the requests, a leak of even 8 bytes per request would
+exceed it
+"""
+MAX_GROWTH = 1024 * 1024
+
+
+class EvictionTest(unittest.TestCase):
+
+    def setUp(self):
+        # the debug messages would be kept by the test runner (and measured)
+        self.log = logging.getLogger(plugin.LOGGER_NAME)
+        self.log_level = self.log.level
+        self.log.setLevel(logging.WARNING)
+        self.nam = qgis_stubs.QgsNetworkAccessManager.instance()
+        self.store = CaptureStore()
+        self.store.retention.max_count = MAX_COUNT
+        self.store.retention.max_age = 0
+        self.store.retention.max_size = 0
+        self.model = ActivityModel(self.store)
+
+    def tearDown(self):
+        self.store.close()
+        self.log.setLevel(self.log_level)
+
+    def fire(self, first, count):
+        """
+        Let the NAM fire (and finish) count requests, then run what the
+        timers of the store and the model would do
+        """
+        for request_id in range(first, first + count):
+            self.nam.requestAboutToBeCreated.emit(fake_request(request_id))
+            self.nam.downloadProgress.emit(request_id, 1000, 1000)
+            self.nam.finished.emit(FakeReplyContent(request_id))
+        self.store.drain_events()
+        self.model.flush_inserts()
+        self.model.flush_progress()
+        # eviction goes in batches, until the evict_timer is not restarted
+        while self.store.evict_timer.isActive():
+            self.store.evict_timer.stop()
+            self.store.apply_retention()
+
+    def test_memory_stays_flat(self):
+        # warm up: fill the store up to its limits
+        self.fire(0, 4 * MAX_COUNT)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            request_id = 4 * MAX_COUNT
+            baseline = None
+            while request_id < REQUESTS:
+                self.fire(request_id, BURST)
+                request_id += BURST
+                self.assertLessEqual(len(self.store.records), MAX_COUNT + BURST)
+                self.assertLessEqual(len(self.model.requests_items), MAX_COUNT + BURST)
+                if baseline is None and request_id >= REQUESTS // 4:
+                    gc.collect()
+                    baseline = tracemalloc.get_traced_memory()[0]
+            gc.collect()
+            growth = tracemalloc.get_traced_memory()[0] - baseline
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(len(self.model.root_item.children), len(self.store.records))
+        self.assertLess(growth, MAX_GROWTH)
+
+
+if __name__ == '__main__':
+    unittest.main()
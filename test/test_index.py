@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+"""
+The SearchIndex of the CaptureStore: built in steps upon the first search,
+and kept up to date while and after building. Runs without QGIS, see
+qgis_stubs.
+"""
+
+import unittest
+
+import qgis_stubs
+from qgis_stubs import (
+    FakeReplyContent,
+    fake_request
+)
+
+qgis_stubs.load_plugin()
+
+from qgisnetworklogger.store import CaptureStore  # noqa: E402
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        qgis_stubs.QgsNetworkAccessManager.reset()
+        self.nam = qgis_stubs.QgsNetworkAccessManager.instance()
+        self.store = CaptureStore()
+        self.store.retention.max_count = 0
+        self.store.retention.max_age = 0
+        self.store.retention.max_size = 0
+        self.index = self.store.index
+        self.built = []
+        self.index.indexBuilt.connect(lambda: self.built.append(True))
+        self.fire(0, 300)
+
+    def tearDown(self):
+        self.store.close()
+
+    def fire(self, first, count):
+        # the urls have LAYERS=layer<id % 100>
+        for request_id in range(first, first + count):
+            self.nam.requestAboutToBeCreated.emit(fake_request(request_id))
+            self.nam.finished.emit(FakeReplyContent(request_id))
+        self.store.drain_events()
+
+    def layer_ids(self, layer):
+        return {request_id for request_id in self.store.records if request_id % 100 == layer}
+
+    def build(self):
+        # what the build_timer would do
+        steps = 0
+        while self.index.build_timer.isActive():
+            self.index.build_timer.stop()
+            self.index.build_step()
+            steps += 1
+        return steps
+
+    def test_no_results_until_built(self):
+        self.assertEqual(self.index.search('layer12'), set())
+        self.assertTrue(self.index.is_building())
+        self.assertEqual(self.built, [])
+        self.assertGreaterEqual(self.build(), 1)
+        self.assertEqual(self.built, [True])
+        self.assertEqual(self.index.search('layer12'), self.layer_ids(12))
+
+    def test_text_without_words(self):
+        self.assertIsNone(self.index.search('='))
+
+    def test_changes_while_building(self):
+        self.index.search('layer12')
+        self.store.evict([self.store.records[112], self.store.records[212]])
+        self.fire(300, 200)
+        self.build()
+        self.assertEqual(self.index.search('layer12'), self.layer_ids(12))
+        self.assertNotIn(112, self.index.search('layer12'))
+        self.assertIn(412, self.index.search('layer12'))
+
+    def test_changes_after_building(self):
+        self.index.search('layer12')
+        self.build()
+        self.assertEqual(self.index.search('layer12'), self.layer_ids(12))
+        self.store.evict([self.store.records[12]])
+        self.fire(300, 100)
+        self.assertEqual(self.index.search('layer12'), self.layer_ids(12))
+        self.assertEqual(self.index.search('layer1'), {request_id for request_id in self.store.records
+                                                       if str(request_id % 100).startswith('1')})
+
+    def test_prefix_and_all_words(self):
+        self.index.search('x')
+        self.build()
+        self.assertEqual(self.index.search('getm LAYER5'), {request_id for request_id in self.store.records
+                                                             if str(request_id % 100).startswith('5')})
+        self.assertEqual(self.index.search('layer5 layer50'), self.layer_ids(50))
+        self.assertEqual(self.index.search('nomatch'), set())
+
+    def test_clear_while_building(self):
+        self.index.search('layer12')
+        self.store.clear()
+        self.build()
+        self.assertEqual(self.built, [True])
+        self.assertEqual(self.index.search('layer12'), set())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+"""
+The query language of the request filter (query.py), and how the
+ActivityProxyModel reports invalid queries. Runs without QGIS, see
+qgis_stubs.
+"""
+
+import unittest
+
+import qgis_stubs
+
+qgis_stubs.load_plugin()
+
+from qgisnetworklogger.index import SearchIndex  # noqa: E402
+from qgisnetworklogger.model import ActivityProxyModel  # noqa: E402
+from qgisnetworklogger.query import (  # noqa: E402
+    QueryError,
+    Term,
+    compile_query
+)
+from qgisnetworklogger.store import (  # noqa: E402
+    COMPLETE,
+    ERROR,
+    PENDING
+)
+
+
+class FakeRecord(object):
+    """The fields of a RequestRecord a Query looks at"""
+
+    def __init__(self, url='https://example.com/wms?SERVICE=WMS', host='example.com', operation='GET',
+                 status=COMPLETE, http_status=200, time=100, received=1000, initiator='QgsWmsProvider',
+                 headers=(), reply_headers=()):
+        self.url = url
+        self.host = host
+        self.operation = operation
+        self.status = status
+        self.http_status = http_status
+        self.end_ns = None if status == PENDING else 1
+        self.time = time
+        self.received = received
+        self.initiator = initiator
+        self.raw_headers = headers
+        self.raw_reply_headers = reply_headers
+
+    def lower_url(self):
+        return self.url.lower()
+
+    def lower_host(self):
+        return self.host.lower()
+
+    def received_bytes(self):
+        return self.received
+
+
+class FakeIndex(object):
+    """A SearchIndex with one word"""
+
+    def __init__(self, word, ids):
+        self.word = word
+        self.ids = ids
+
+    def search(self, word):
+        return self.ids if word == self.word else set()
+
+
+def matches(text, record, index=None):
+    return compile_query(text, index).matches(record)
+
+
+class QueryTest(unittest.TestCase):
+
+    def test_empty_query_matches_all(self):
+        self.assertTrue(matches('', FakeRecord()))
+        self.assertTrue(matches('   ', FakeRecord()))
+
+    def test_url_part(self):
+        self.assertTrue(matches('WMS', FakeRecord()))
+        self.assertFalse(matches('wfs', FakeRecord()))
+
+    def test_all_terms_match(self):
+        self.assertTrue(matches('wms host:example', FakeRecord()))
+        self.assertFalse(matches('wms host:osm', FakeRecord()))
+
+    def test_negation(self):
+        self.assertFalse(matches('-host:example', FakeRecord()))
+        self.assertTrue(matches('-host:osm', FakeRecord()))
+        self.assertTrue(matches('-status:>=400', FakeRecord()))
+        # a single - is just a part of the url
+        self.assertFalse(matches('-', FakeRecord()))
+
+    def test_unknown_key_is_url_part(self):
+        self.assertTrue(matches('https://example.com', FakeRecord()))
+
+    def test_key_is_case_insensitive(self):
+        self.assertTrue(matches('HOST:Example', FakeRecord()))
+
+    def test_value_being_typed_matches_all(self):
+        self.assertTrue(matches('host:', FakeRecord()))
+        self.assertTrue(matches('time:', FakeRecord()))
+
+    def test_initiator_and_method(self):
+        self.assertTrue(matches('initiator:wms', FakeRecord()))
+        self.assertTrue(matches('initiator:wms', FakeRecord(initiator='QgsWmsProvider')))
+        self.assertFalse(matches('initiator:wfs', FakeRecord(initiator=None)))
+        self.assertTrue(matches('method:get', FakeRecord()))
+        self.assertFalse(matches('method:post', FakeRecord()))
+
+    def test_header(self):
+        record = FakeRecord(headers=((b'User-Agent', b'QGIS'),), reply_headers=((b'Content-Type', b'image/png'),))
+        self.assertTrue(matches('header:user-agent', record))
+        self.assertTrue(matches('header:content', record))
+        self.assertFalse(matches('header:authorization', record))
+
+    def test_status(self):
+        self.assertTrue(matches('status:200', FakeRecord()))
+        self.assertFalse(matches('status:404', FakeRecord()))
+        self.assertTrue(matches('status:>=400', FakeRecord(status=ERROR, http_status=404)))
+        self.assertTrue(matches('status:!=200', FakeRecord(http_status=304)))
+        self.assertTrue(matches('status:error', FakeRecord(status=ERROR)))
+        self.assertTrue(matches('status:Pending', FakeRecord(status=PENDING, http_status=-1)))
+        # without a http status, no comparison matches
+        self.assertFalse(matches('status:<400', FakeRecord(status=PENDING, http_status=-1)))
+
+    def test_invalid_status(self):
+        for text in ('status:foo', 'status:>=', 'status:404x', 'status:>=4x'):
+            with self.assertRaises(QueryError, msg=text):
+                compile_query(text)
+
+    def test_time_units(self):
+        record = FakeRecord(time=1500)
+        self.assertTrue(matches('time:>1s', record))
+        self.assertTrue(matches('time:<2sec', record))
+        self.assertTrue(matches('time:>=1500ms', record))
+        self.assertTrue(matches('time:=1500', record))
+        self.assertFalse(matches('time:<0.02m', record))
+        # a pending Request has no duration yet
+        self.assertFalse(matches('time:>=0', FakeRecord(status=PENDING)))
+
+    def test_size_units(self):
+        record = FakeRecord(received=1536)
+        self.assertTrue(matches('size:>1kb', record))
+        self.assertTrue(matches('size:=1.5k', record))
+        self.assertTrue(matches('size:<1MB', record))
+        self.assertTrue(matches('size:<=1536b', record))
+        self.assertFalse(matches('size:>1g', record))
+
+    def test_invalid_comparisons(self):
+        for text in ('time:>5x', 'time:fast', 'size:>1tb', 'size:1.2.3', 'time:>=', 'size:<'):
+            with self.assertRaises(QueryError, msg=text):
+                compile_query(text)
+
+    def test_text(self):
+        index = FakeIndex('roads', {1, 2})
+        record = FakeRecord()
+        record.id = 2
+        self.assertTrue(matches('text:roads', record, index))
+        self.assertFalse(matches('text:rivers', record, index))
+        with self.assertRaises(QueryError):
+            compile_query('text:roads')
+
+
+class NarrowsTest(unittest.TestCase):
+
+    def narrows(self, previous, text):
+        return compile_query(text).narrows(None if previous is None else compile_query(previous))
+
+    def test_typing_on(self):
+        self.assertTrue(self.narrows('', 'w'))
+        self.assertTrue(self.narrows('w', 'wm'))
+        self.assertTrue(self.narrows('wms', 'wms'))
+        self.assertTrue(self.narrows('host:ex', 'host:exa'))
+        self.assertTrue(self.narrows('wms', 'wms host:example'))
+        self.assertTrue(self.narrows('wms host:', 'wms host:e'))
+
+    def test_not_narrowing(self):
+        self.assertFalse(self.narrows(None, 'wms'))
+        # shorter
+        self.assertFalse(self.narrows('wms', 'wm'))
+        self.assertFalse(self.narrows('wms host:a', 'wms'))
+        # another than the last term changed
+        self.assertFalse(self.narrows('wm host:a', 'wms host:a'))
+        # another key or negation
+        self.assertFalse(self.narrows('ex', 'host:ex'))
+        self.assertFalse(self.narrows('-osm', '-osmx'))
+        self.assertFalse(self.narrows('osm', '-osm'))
+        # not a part match
+        self.assertFalse(self.narrows('status:40', 'status:404'))
+        self.assertFalse(self.narrows('time:>5', 'time:>50'))
+        self.assertFalse(self.narrows('method:g', 'method:ge'))
+
+    def test_part_match(self):
+        self.assertTrue(Term('host:osm').is_part_match())
+        self.assertTrue(Term('wms').is_part_match())
+        self.assertFalse(Term('-wms').is_part_match())
+        self.assertFalse(Term('size:>1').is_part_match())
+
+
+class FakeStore(object):
+
+    def __init__(self):
+        self.records = {}
+        self.index = SearchIndex(self)
+
+
+class FakeSourceModel(object):
+
+    def __init__(self):
+        self.store = FakeStore()
+
+
+class FilterErrorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.proxy_model = ActivityProxyModel(FakeSourceModel())
+        self.errors = []
+        self.proxy_model.filterError.connect(self.errors.append)
+
+    def apply(self, string):
+        self.proxy_model.set_filter_string(string)
+        self.proxy_model.apply_filter_string()
+
+    def test_invalid_query_keeps_previous(self):
+        self.apply('status:404')
+        self.apply('status:404x')
+        self.assertEqual(self.errors, ['', 'Invalid value for status: "404x"'])
+        self.assertEqual(self.proxy_model.filter_string, 'status:404')
+
+    def test_back_to_current_query_clears_error(self):
+        self.apply('status:404')
+        self.apply('status:404x')
+        self.apply('status:404')
+        self.assertEqual(self.errors[-1], '')
+        self.assertEqual(self.proxy_model.filter_string, 'status:404')
+
+
+if __name__ == '__main__':
+    unittest.main()
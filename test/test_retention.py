@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+"""
+The RetentionPolicy, and the removal of evicted requests from the models
+when failed requests (which are retained longer) are mixed in, so rows are
+removed from the middle. Runs without QGIS, see qgis_stubs.
+"""
+
+import logging
+import unittest
+
+import qgis_stubs
+from qgis_stubs import (
+    FakeReplyContent,
+    fake_request
+)
+
+plugin = qgis_stubs.load_plugin()
+
+from qgisnetworklogger.model import (  # noqa: E402
+    ActivityModel,
+    ActivityTreeItem,
+    RequestListModel
+)
+from qgisnetworklogger.retention import RetentionPolicy  # noqa: E402
+from qgisnetworklogger.store import CaptureStore  # noqa: E402
+
+"""
+QNetworkReply.HostNotFoundError
+"""
+HOST_NOT_FOUND = 3
+
+
+class FakeRecord(object):
+    """The part of a RequestRecord the RetentionPolicy looks at"""
+
+    def __init__(self, start_time, failed=False, size=100):
+        self.start_time = start_time
+        self.failed = failed
+        self.size = size
+
+    def is_failed(self):
+        return self.failed
+
+
+class SelectEvictionsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = RetentionPolicy()
+        self.policy.max_count = 0
+        self.policy.max_age = 0
+        self.policy.max_size = 0
+        self.policy.max_error_count = 0
+        # every third record failed
+        self.records = [FakeRecord(start_time=index, failed=index % 3 == 0) for index in range(30)]
+        self.failed = [record for record in self.records if record.failed]
+        self.normal = [record for record in self.records if not record.failed]
+
+    def select(self, now=100, limit=200):
+        return self.policy.select_evictions(self.records, sum(record.size for record in self.normal),
+                                            len(self.failed), now, limit)
+
+    def test_nothing_without_limits(self):
+        self.assertEqual(self.select(), [])
+
+    def test_max_count_evicts_oldest_normal(self):
+        self.policy.max_count = 5
+        self.assertEqual(self.select(), self.normal[:-5])
+
+    def test_max_error_count_evicts_oldest_failed(self):
+        self.policy.max_error_count = 4
+        self.assertEqual(self.select(), self.failed[:-4])
+
+    def test_both_quotas_oldest_first(self):
+        self.policy.max_count = 15
+        self.policy.max_error_count = 8
+        evicted = self.select()
+        self.assertEqual(evicted, [self.failed[0], self.normal[0], self.normal[1], self.failed[1], self.normal[2],
+                                   self.normal[3], self.normal[4]])
+
+    def test_max_age_keeps_failed(self):
+        self.policy.max_age = 80
+        # now=100: the records started before 20 are too old
+        self.assertEqual(self.select(), [record for record in self.normal if record.start_time < 20])
+
+    def test_max_size(self):
+        self.policy.max_size = 1
+        self.normal[0].size = 1024 * 1024
+        self.assertEqual(self.select(), [self.normal[0]])
+
+    def test_limit(self):
+        self.policy.max_count = 1
+        self.policy.max_error_count = 1
+        # both quotas are exceeded, so the oldest are evicted, up to the limit
+        self.assertEqual(self.select(limit=7), self.records[:7])
+
+
+class RemoveChildrenTest(unittest.TestCase):
+
+    def assert_positions(self, root):
+        for row, child in enumerate(root.children):
+            self.assertEqual(child.position(), row)
+
+    def test_ranges_then_partial_renumbering(self):
+        root = ActivityTreeItem()
+        children = [ActivityTreeItem(root) for _ in range(40)]
+        # the last range first, like ActivityModel.remove_rows
+        for first, count in ((30, 2), (20, 5), (10, 1), (0, 3)):
+            removed = root.remove_children(first, count)
+            self.assertEqual(len(removed), count)
+            self.assert_positions(root)
+        self.assertEqual(root.children, children[3:10] + children[11:20] + children[25:30] + children[32:])
+        # new children while outdated rows remain
+        ActivityTreeItem(root)
+        self.assert_positions(root)
+        while root.renumber_from is not None:
+            root.renumber(limit=4)
+            self.assert_positions(root)
+        for child in root.children:
+            self.assertEqual(child.row - root.row_offset, child.position())
+
+
+class MixedFailuresTest(unittest.TestCase):
+    """
+    Evict with every third request failed, retaining more requests after
+    the oldest normal one than RENUMBER_BATCH, so the rows are only
+    renumbered in part per eviction
+    """
+
+    MAX_COUNT = 4000
+    MAX_ERROR_COUNT = 4000
+
+    def setUp(self):
+        self.log = logging.getLogger(plugin.LOGGER_NAME)
+        self.log_level = self.log.level
+        self.log.setLevel(logging.WARNING)
+        qgis_stubs.QgsNetworkAccessManager.reset()
+        self.nam = qgis_stubs.QgsNetworkAccessManager.instance()
+        self.store = CaptureStore()
+        self.store.retention.max_count = self.MAX_COUNT
+        self.store.retention.max_age = 0
+        self.store.retention.max_size = 0
+        self.store.retention.max_error_count = self.MAX_ERROR_COUNT
+        self.activity_model = ActivityModel(self.store)
+        self.list_model = RequestListModel(self.store)
+        self.fired = 0
+
+    def tearDown(self):
+        self.store.close()
+        self.log.setLevel(self.log_level)
+
+    def fire(self, count):
+        for request_id in range(self.fired, self.fired + count):
+            self.nam.requestAboutToBeCreated.emit(fake_request(request_id))
+            error = HOST_NOT_FOUND if request_id % 3 == 0 else 0
+            self.nam.finished.emit(FakeReplyContent(request_id, error))
+        self.fired += count
+        self.store.drain_events()
+        self.activity_model.flush_inserts()
+        self.list_model.flush_inserts()
+        while self.store.evict_timer.isActive():
+            self.store.evict_timer.stop()
+            self.store.apply_retention()
+
+    def assert_models_follow_store(self):
+        records = list(self.store.records.values())
+        children = self.activity_model.root_item.children
+        self.assertEqual([child.record for child in children], records)
+        self.assertEqual(self.list_model.records, records)
+        for row, record in enumerate(records):
+            self.assertEqual(children[row].position(), row)
+            self.assertEqual(self.list_model.row(record), row)
+
+    def test_evict_with_failed_requests(self):
+        outdated = False
+        while self.fired < 3 * (self.MAX_COUNT + self.MAX_ERROR_COUNT):
+            self.fire(500)
+            self.assert_models_follow_store()
+            # rows are renumbered in part per eviction, the others are found
+            outdated = outdated or self.activity_model.root_item.renumber_from is not None
+        self.assertTrue(outdated)
+        self.assertEqual(self.store.failed_count, self.MAX_ERROR_COUNT)
+        self.assertEqual(len(self.store.records), self.MAX_COUNT + self.MAX_ERROR_COUNT)
+
+
+if __name__ == '__main__':
+    unittest.main()
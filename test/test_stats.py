@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+"""
+The StatsEngine: the error rate without the canceled Requests, and the
+bounded number of hosts. Runs without QGIS, see qgis_stubs.
+"""
+
+import unittest
+
+import qgis_stubs
+from qgis_stubs import (
+    FakeReplyContent,
+    fake_request
+)
+
+qgis_stubs.load_plugin()
+
+from qgisnetworklogger.stats import (  # noqa: E402
+    MAX_HOSTS,
+    OTHER_HOSTS,
+    StatsEngine
+)
+from qgisnetworklogger.store import CaptureStore  # noqa: E402
+
+"""
+QNetworkReply.HostNotFoundError and QNetworkReply.OperationCanceledError
+"""
+HOST_NOT_FOUND = 3
+OPERATION_CANCELED = 5
+
+
+class StatsEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        qgis_stubs.QgsNetworkAccessManager.reset()
+        self.nam = qgis_stubs.QgsNetworkAccessManager.instance()
+        self.store = CaptureStore()
+        self.engine = StatsEngine(self.store)
+        self.fired = 0
+
+    def tearDown(self):
+        self.store.close()
+
+    def fire(self, host='example.com', error=0):
+        self.nam.requestAboutToBeCreated.emit(fake_request(self.fired, host))
+        self.nam.finished.emit(FakeReplyContent(self.fired, error))
+        self.fired += 1
+        self.store.drain_events()
+
+    def test_canceled_are_no_errors(self):
+        for error in (0, 0, HOST_NOT_FOUND, OPERATION_CANCELED):
+            self.fire(error=error)
+        for stats in (self.engine.hosts['example.com'], self.engine.hosts['example.com'].endpoints['/wms'],
+                      self.engine.total()):
+            self.assertEqual(stats.count, 4)
+            self.assertEqual(stats.errors, 1)
+            self.assertEqual(stats.canceled, 1)
+            self.assertEqual(stats.error_rate(), 0.25)
+
+    def test_other_hosts(self):
+        for host in range(MAX_HOSTS + 10):
+            self.fire('host{}.example.com'.format(host))
+        # a known host keeps its own statistics
+        self.fire('host0.example.com')
+        self.assertEqual(len(self.engine.hosts), MAX_HOSTS + 1)
+        self.assertEqual(self.engine.hosts['host0.example.com'].count, 2)
+        self.assertEqual(self.engine.hosts[OTHER_HOSTS].count, 10)
+        self.assertNotIn('host{}.example.com'.format(MAX_HOSTS), self.engine.hosts)
+        self.assertEqual(self.engine.total().count, MAX_HOSTS + 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+"""
+Export of the captured Requests in the Chrome trace event format (JSON), to
+be loaded in Perfetto (ui.perfetto.dev) or chrome://tracing, to see the
+concurrency of the Requests: how many were in flight, which ones were
+serialized, and where the gaps are.
+
+Every Request is shown twice: on the tracks of its host, and on the tracks
+of the thread it originated from. As the events on one track may not
+overlap, every host or thread gets as many tracks ('lanes') as it had
+Requests in flight at the same time. A Request is split into a 'waiting'
+phase (up to the first download progress, about the first byte) and a
+'receiving' phase. A counter shows the number of Requests in flight.
+"""
+
+import heapq
+import json
+import time
+
+"""
+Process ids of the groups of tracks
+"""
+SESSION_PID = 0
+HOSTS_PID = 1
+THREADS_PID = 2
+
+
+def request_end(record, now):
+    """
+    :param record: RequestRecord
+    :param now: int perf_counter_ns() timestamp of the export
+    :return: int timestamp (ns) the Request finished or timed out, or now
+    """
+    if record.end_ns is not None:
+        return record.end_ns
+    if record.timeout_ns is not None:
+        return record.timeout_ns
+    return now
+
+
+def assign_lanes(intervals):
+    """
+    Assign every interval to the first lane which is free at its start, so
+    intervals in one lane do not overlap
+
+    :param intervals: list of (start, end, record) tuples, sorted by start
+    :return: list of (lane, (start, end, record)) tuples
+    """
+    # (end of the last interval in the lane, lane) of all lanes
+    ends = []
+    lane_count = 0
+    assigned = []
+    for interval in intervals:
+        start, end, _ = interval
+        if ends and ends[0][0] <= start:
+            _, lane = heapq.heapreplace(ends, (end, ends[0][1]))
+        else:
+            lane = lane_count
+            lane_count += 1
+            heapq.heappush(ends, (end, lane))
+        assigned.append((lane, interval))
+    return assigned
+
+
+def trace_events(records):
+    """
+    Create the trace events of these Requests
+
+    :param records: list of RequestRecord's
+    :return: list of trace event dictionaries
+    """
+    now = time.perf_counter_ns()
+    intervals = sorted(((record.start_ns, request_end(record, now), record) for record in records),
+                       key=lambda interval: interval[0])
+    if not intervals:
+        return []
+    origin = intervals[0][0]
+
+    def us(timestamp):
+        # trace timestamps are in microseconds
+        return (timestamp - origin) / 1000
+
+    events = [
+        {'ph': 'M', 'pid': SESSION_PID, 'name': 'process_name', 'args': {'name': 'Session'}},
+        {'ph': 'M', 'pid': HOSTS_PID, 'name': 'process_name', 'args': {'name': 'Requests by host'}},
+        {'ph': 'M', 'pid': THREADS_PID, 'name': 'process_name', 'args': {'name': 'Requests by thread'}}
+    ]
+
+    # the number of Requests in flight
+    changes = sorted([(start, 1) for start, _, _ in intervals] + [(end, -1) for _, end, _ in intervals])
+    in_flight = 0
+    for timestamp, change in changes:
+        in_flight += change
+        events.append({'ph': 'C', 'pid': SESSION_PID, 'name': 'In flight', 'ts': us(timestamp),
+                       'args': {'requests': in_flight}})
+
+    tid = 0
+    for pid, group_key in ((HOSTS_PID, lambda record: record.url.host()),
+                           (THREADS_PID, lambda record: str(record.thread))):
+        groups = {}
+        for interval in intervals:
+            groups.setdefault(group_key(interval[2]), []).append(interval)
+        for name in sorted(groups):
+            lanes = {}
+            for lane, (start, end, record) in assign_lanes(groups[name]):
+                if lane not in lanes:
+                    tid += 1
+                    lanes[lane] = tid
+                    events.append({'ph': 'M', 'pid': pid, 'tid': tid, 'name': 'thread_name',
+                                   'args': {'name': '{} #{}'.format(name, lane + 1)}})
+                    events.append({'ph': 'M', 'pid': pid, 'tid': tid, 'name': 'thread_sort_index',
+                                   'args': {'sort_index': tid}})
+                events.extend(request_events(record, pid, lanes[lane], us(start), us(end)))
+    return events
+
+
+def request_events(record, pid, tid, start, end):
+    """
+    :param record: RequestRecord
+    :param pid: int process id (group of tracks)
+    :param tid: int thread id (track)
+    :param start: float start (in microseconds)
+    :param end: float end (in microseconds)
+    :return: list of (complete) trace events of this Request and its phases
+    """
+    args = {
+        'id': record.id,
+        'url': record.url.url(),
+        'status': record.status,
+        'http_status': record.http_status,
+        'bytes': record.received_bytes(),
+        'initiator': record.initiator or '',
+        'thread': str(record.thread)
+    }
+    events = [{'ph': 'X', 'pid': pid, 'tid': tid, 'cat': 'request', 'ts': start, 'dur': end - start,
+               'name': '{} {}'.format(record.operation, record.url.path() or '/'), 'args': args}]
+    if record.first_progress_ns is not None:
+        first_byte = min(max((record.first_progress_ns - record.start_ns) / 1000 + start, start), end)
+        events.append({'ph': 'X', 'pid': pid, 'tid': tid, 'cat': 'phase', 'ts': start, 'dur': first_byte - start,
+                       'name': 'waiting'})
+        events.append({'ph': 'X', 'pid': pid, 'tid': tid, 'cat': 'phase', 'ts': first_byte, 'dur': end - first_byte,
+                       'name': 'receiving'})
+    return events
+
+
+def write_trace(records, path):
+    """
+    Write the trace (JSON) of these Requests to a file
+
+    :param records: list of RequestRecord's
+    :param path: string path of the trace file
+    :raises OSError: when the file cannot be written
+    """
+    with open(path, 'w', encoding='utf-8') as trace_file:
+        json.dump({'traceEvents': trace_events(records), 'displayTimeUnit': 'ms'}, trace_file)
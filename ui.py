@@ -9,9 +9,14 @@
 # (at your option) any later version.
 # ---------------------------------------------------------------------
 
+import html
+
 from qgis.PyQt.QtCore import (
     QModelIndex,
-    Qt
+    Qt,
+    QUrl,
+    QUrlQuery,
+    pyqtSignal
 )
 from qgis.PyQt.QtWidgets import (
     QTreeView,
@@ -19,27 +24,131 @@ from qgis.PyQt.QtWidgets import (
     QVBoxLayout,
     QWidget,
     QAction,
-    QMenu
+    QMenu,
+    QDialog,
+    QDialogButtonBox,
+    QFormLayout,
+    QSpinBox,
+    QHeaderView,
+    QSplitter,
+    QStackedWidget,
+    QTextBrowser,
+    QCheckBox,
+    QFileDialog,
+    QProgressDialog,
+    QTreeWidget,
+    QTreeWidgetItem
 )
 from qgis.PyQt.QtGui import (
     QFont
 )
 from qgis.gui import (
     QgsDockWidget,
+    QgsFileWidget,
     QgsFilterLineEdit
 )
 from qgis.utils import (
     iface
 )
 
-from .model import ActivityProxyModel
+from .archive import (
+    ArchiveSettings
+)
+from .har import (
+    HarExporter
+)
+from .tracing import (
+    write_trace
+)
+from .stats import (
+    DISTRIBUTION_BOUNDS
+)
+from .model import (
+    ActivityProxyModel,
+    ArchiveModel,
+    RequestListModel,
+    RequestParentItem,
+    format_msec,
+    format_rate,
+    open_url,
+    copy_as_curl
+)
 
 # get the logger for this QgisNetworkLogger plugin
 import logging
 from . import LOGGER_NAME
 log = logging.getLogger(LOGGER_NAME)
 
-class ActivityView(QTreeView):
+"""
+Tooltip of the filter line edit, explaining the query syntax (see query.py)
+"""
+FILTER_TOOLTIP = '''Filter the requests, all terms have to match:
+  wms  a part of the url
+  host:example.com  a part of the host
+  initiator:QgsWms  a part of the initiator class name
+  header:Authorization  a part of a request or reply header name
+  method:POST  the http method
+  status:404, status:>=400  the http status code
+  status:error, status:timeout, status:pending  the request status
+  time:>500, time:<2s  the duration (msec)
+  size:>1MB  the received size (bytes)
+  text:typename  words in the url, headers and POST content
+    (the first text: search indexes the requests first)
+  -host:osm  a term starting with - excludes the requests'''
+
+"""
+Maximum number of characters of the (POST) content shown in the details pane
+"""
+MAX_DETAILS_CONTENT = 65536
+
+
+class RequestViewMixin(object):
+    """
+    What the views of the Requests (ActivityView and RequestListView) share.
+    The view has a 'model' (with record() and record_index()), wrapped in an
+    ActivityProxyModel 'proxy_model', and open_url and copy_as_curl slots.
+    """
+
+    def create_actions(self):
+        """
+        Create the actions for the context menu, they are shared by all
+        requests and work on the request the menu was last opened for
+        """
+        self.open_url_action = QAction('Open URL')
+        self.open_url_action.triggered.connect(self.open_url)
+        self.copy_as_curl_action = QAction('Copy as cURL')
+        self.copy_as_curl_action.triggered.connect(self.copy_as_curl)
+
+    def set_filter_string(self, string):
+        self.proxy_model.set_filter_string(string)
+
+    def show_successful(self, show):
+        self.proxy_model.set_show_successful(show)
+
+    def show_timeouts(self, show):
+        self.proxy_model.set_show_timeouts(show)
+
+    def visible_records(self):
+        """
+        :return: list of the RequestRecord's of the (filtered, sorted)
+        Requests in this view
+        """
+        return [self.model.record(self.proxy_model.mapToSource(self.proxy_model.index(row, 0)).row())
+                for row in range(self.proxy_model.rowCount())]
+
+    def select_record(self, record):
+        """
+        Select (and show) the row of this Request, if it is shown
+
+        :param record: RequestRecord
+        """
+        index = self.proxy_model.mapFromSource(self.model.record_index(record))
+        if index.isValid():
+            self.setCurrentIndex(index)
+            self.scrollTo(index)
+
+
+class ActivityView(RequestViewMixin, QTreeView):
     """
     The actual 'view' of all Request is this QTreeView, backed by
     the ActivityModel(a QAbstractItemModel).
@@ -55,10 +164,17 @@ class ActivityView(QTreeView):
         self.expanded.connect(self.item_expanded)
 
         self.model.rowsInserted.connect(self.rows_inserted)
+        self.proxy_model.rowsInserted.connect(self.details_inserted)
 
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.context_menu)
 
+        # the request item the context menu was last opened for
+        self.context_item = None
+        self.create_actions()
+        self.clear_action = QAction('Clear')
+        self.clear_action.triggered.connect(self.clear)
+
     def item_expanded(self, index):
         """Slot to be called after expanding an ActivityView item.
         If the item is a Request item, open all children (show ALL info of it)
@@ -67,6 +183,7 @@ class ActivityView(QTreeView):
         :param index:
         """
         # only expand all children on Request Nodes (which NOT have a valid parent)
+        self.span_details(index, 0, self.proxy_model.rowCount(index) - 1)
         if not index.parent().isValid():
             self.expand_children(index)
             # upon expanding a request row, resize first column to fully readable size:
@@ -82,6 +199,9 @@ class ActivityView(QTreeView):
         """
         if not index.isValid():
             return
+        # make sure the (lazily created) children of this item are there
+        if index.model().canFetchMore(index):
+            index.model().fetchMore(index)
         count = index.model().rowCount(index)
         for i in range(0, count):
             child_index = index.child(i, 0)
@@ -90,23 +210,58 @@ class ActivityView(QTreeView):
             self.expand(index)
 
     def rows_inserted(self, parent, first, last):
-        # always make the last line visible
-        self.scrollToBottom()
+        # always make the last line visible, but only for new requests, not
+        # when the details of a request are inserted, and not when sorted
+        if not parent.isValid() and self.proxy_model.sortColumn() < 0:
+            self.scrollToBottom()
+
+    # slot for proxy_model.rowsInserted
+    def details_inserted(self, parent, first, last):
+        if parent.isValid():
+            self.span_details(parent, first, last)
+
+    def span_details(self, parent, first, last):
+        """
+        Let the detail rows of a Request span all columns (in column mode)
+
+        :param parent: QModelIndex (of the proxy model) of the parent row
+        :param first: int first row to span
+        :param last: int last row to span
+        """
+        for row in range(first, last + 1):
+            self.setFirstColumnSpanned(row, parent, True)
+
+    def set_column_mode(self, column_mode):
+        """
+        Show the Requests in columns (sortable by clicking the header), or
+        in one column, in the order they were fired
+
+        :param column_mode: bool
+        """
+        self.model.set_column_mode(column_mode)
+        if column_mode:
+            # start unsorted, sort when the user clicks a column header
+            self.header().setSortIndicator(-1, Qt.AscendingOrder)
+            self.setSortingEnabled(True)
+            self.header().resizeSections(QHeaderView.ResizeToContents)
+        else:
+            self.setSortingEnabled(False)
+            self.proxy_model.sort(-1)
 
     def clear(self):
+        self.context_item = None
         self.model.clear()
 
-    def pause(self, state):
-        self.model.pause(state)
+    def open_url(self):
+        if self.context_item:
+            self.context_item.open_url()
 
-    def set_filter_string(self, string):
-        self.proxy_model.set_filter_string(string)
+    def copy_as_curl(self):
+        if self.context_item:
+            self.context_item.copy_as_curl()
 
-    def show_successful(self, show):
-        self.proxy_model.set_show_successful(show)
-
-    def show_timeouts(self, show):
-        self.proxy_model.set_show_timeouts(show)
+    def pause(self, state):
+        self.model.pause(state)
 
     # do we actually want a 'Clear' context menu item in EVERY node???
     def context_menu(self, point):
@@ -117,25 +272,179 @@ class ActivityView(QTreeView):
             index = proxy_model_index
         if index.isValid():
             menu = QMenu()
-            populated = False
-            for a in index.internalPointer().actions():
-                menu.addAction(a)
-                populated = True
-            if populated:
+            item = index.internalPointer()
+            if isinstance(item, RequestParentItem):
+                # bind the shared actions to the clicked request
+                self.context_item = item
+                menu.addAction(self.open_url_action)
+                menu.addAction(self.copy_as_curl_action)
                 menu.addSeparator()
 
-            clear_action = QAction('Clear')
-            clear_action.triggered.connect(self.clear)
-            menu.addAction(clear_action)
+            menu.addAction(self.clear_action)
             menu.exec(self.viewport().mapToGlobal(point))
 
 
+class RequestListView(RequestViewMixin, QTreeView):
+    """
+    Flat view of the Requests: one row per Request (and no details), backed
+    by a RequestListModel. With uniform row heights, so scrolling stays
+    smooth with a lot of Requests. The details of the selected Request are
+    shown in a RequestDetailsPane.
+    """
+
+    # signal with the RequestRecord of the selected Request, or None
+    requestSelected = pyqtSignal(object)
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.proxy_model = ActivityProxyModel(self.model, self)
+        self.setModel(self.proxy_model)
+        self.setRootIsDecorated(False)
+        self.setItemsExpandable(False)
+        self.setUniformRowHeights(True)
+        self.setAllColumnsShowFocus(True)
+        # start unsorted, sort when the user clicks a column header
+        self.header().setSortIndicator(-1, Qt.AscendingOrder)
+        self.setSortingEnabled(True)
+
+        self.model.rowsInserted.connect(self.rows_inserted)
+        self.selectionModel().currentRowChanged.connect(self.current_row_changed)
+
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self.context_menu)
+
+        self.context_record = None
+        self.create_actions()
+
+    def rows_inserted(self, parent, first, last):
+        # make the last line visible, when not sorted
+        if self.proxy_model.sortColumn() < 0:
+            self.scrollToBottom()
+
+    # slot for selectionModel().currentRowChanged
+    def current_row_changed(self, current, previous):
+        if current.isValid():
+            self.requestSelected.emit(self.model.record(self.proxy_model.mapToSource(current).row()))
+        else:
+            self.requestSelected.emit(None)
+
+    def open_url(self):
+        if self.context_record:
+            open_url(self.context_record)
+
+    def copy_as_curl(self):
+        if self.context_record:
+            copy_as_curl(self.context_record)
+
+    def context_menu(self, point):
+        index = self.indexAt(point)
+        if index.isValid():
+            self.context_record = self.model.record(self.proxy_model.mapToSource(index).row())
+            menu = QMenu()
+            menu.addAction(self.open_url_action)
+            menu.addAction(self.copy_as_curl_action)
+            menu.exec(self.viewport().mapToGlobal(point))
+
+
+class RequestDetailsPane(QTextBrowser):
+    """
+    Shows the details (request, reply and headers) of one Request, the one
+    selected in the RequestListView. Updated when its Request gets a reply
+    (when following a store, archived Requests do not change).
+    """
+
+    def __init__(self, store=None, parent=None):
+        super().__init__(parent)
+        self.record = None
+        if store is not None:
+            store.requestFinished.connect(self.request_changed)
+            store.requestTimedOut.connect(self.request_changed)
+            store.requestSslErrors.connect(self.request_changed)
+            store.cleared.connect(self.store_cleared)
+
+    def show_record(self, record):
+        """
+        :param record: RequestRecord to show the details of, or None
+        """
+        self.record = record
+        if record is None:
+            self.clear()
+        else:
+            self.setHtml(self.details_html(record))
+
+    # slot for store.requestFinished, requestTimedOut and requestSslErrors
+    def request_changed(self, record):
+        if record is self.record:
+            self.show_record(record)
+
+    # slot for store.cleared
+    def store_cleared(self):
+        self.show_record(None)
+
+    @staticmethod
+    def table_html(title, rows):
+        """
+        :param title: string
+        :param rows: list of (name, value) tuples
+        :return: string html table
+        """
+        cells = ''.join('<tr><td><b>{}</b></td><td>{}</td></tr>'.format(html.escape(str(name)),
+                                                                       html.escape(str(value)))
+                        for name, value in rows)
+        return '<h3>{}</h3><table>{}</table>'.format(title, cells)
+
+    def details_html(self, record):
+        """
+        :param record: RequestRecord
+        :return: string html with the details of the Request
+        """
+        parts = [self.table_html('Request', [
+            ('Id', record.id),
+            ('Operation', record.operation),
+            ('Url', record.url.url()),
+            ('Thread', record.thread),
+            ('Initiator', record.initiator or ''),
+            ('Request id', record.initiator_id)
+        ])]
+        query = QUrlQuery(record.url)
+        if not query.isEmpty():
+            parts.append(self.table_html('Query', query.queryItems(QUrl.FullyDecoded)))
+        parts.append(self.table_html('Request headers', record.headers))
+        if record.raw_data:
+            content = record.raw_data[:MAX_DETAILS_CONTENT].decode('utf-8', errors='replace')
+            parts.append('<h3>Content</h3><pre>{}</pre>'.format(html.escape(content)))
+        if record.ssl_errors:
+            parts.append(self.table_html('SSL errors', [('', error) for error in record.ssl_errors]))
+        if record.replied:
+            parts.append(self.table_html('Reply', [
+                ('Status', record.status),
+                ('Status code', record.http_status),
+                ('Content type', record.content_type),
+                ('Received bytes', record.received_bytes()),
+                ('Duration', '{} msec'.format(record.time)),
+                ('Wait (first byte)', format_msec(record.wait_ms())),
+                ('Transfer', format_msec(record.transfer_ms())),
+                ('Download rate', format_rate(record.download_rate())),
+                ('From cache', record.from_cache),
+                ('Error', record.error_string)
+            ]))
+            parts.append(self.table_html('Reply headers', record.reply_headers))
+        else:
+            parts.append(self.table_html('Reply', [('Status', record.status)]))
+        return ''.join(parts)
+
+
 class NetworkActivityDock(QgsDockWidget):
     """
-    The Dock holding the actual treeview.
+    The Dock holding the actual treeview, or the flat list of requests with
+    a details pane.
     Also having some buttons to clear/pause and filter the requests.
     """
 
+    # emitted when the archive settings are changed, to (re)open the archive
+    archiveSettingsChanged = pyqtSignal()
+
     def __init__(self, logger):
         super().__init__()
         self.setWindowTitle('Network Activity')
@@ -172,14 +481,372 @@ class NetworkActivityDock(QgsDockWidget):
         self.toolbar.addSeparator()
         self.toolbar.addAction(self.show_success_action)
         self.toolbar.addAction(self.show_timeouts_action)
+        self.column_mode_action = QAction('Columns')
+        self.column_mode_action.setToolTip('Show the requests in sortable columns')
+        self.column_mode_action.setCheckable(True)
+        self.column_mode_action.toggled.connect(self.view.set_column_mode)
+        self.toolbar.addAction(self.column_mode_action)
+        self.flat_mode_action = QAction('Flat list')
+        self.flat_mode_action.setToolTip('Show the requests in a flat list, with the details in a separate pane')
+        self.flat_mode_action.setCheckable(True)
+        self.flat_mode_action.toggled.connect(self.set_flat_mode)
+        self.toolbar.addAction(self.flat_mode_action)
+        self.retention_action = QAction('Retention...')
+        self.retention_action.triggered.connect(self.show_retention_dialog)
+        self.archive_action = QAction('Archive...')
+        self.archive_action.setToolTip('Browse the requests archived in the database')
+        self.archive_action.triggered.connect(self.show_archive_dialog)
+        self.archive = None
+        self.set_archive(None)
+        self.toolbar.addSeparator()
+        self.toolbar.addAction(self.retention_action)
+        self.toolbar.addAction(self.archive_action)
+        self.export_har_action = QAction('Export HAR...')
+        self.export_har_action.setToolTip('Export the shown (filtered) requests to a HAR file')
+        self.export_har_action.triggered.connect(self.export_har)
+        self.toolbar.addAction(self.export_har_action)
+        self.export_trace_action = QAction('Export trace...')
+        self.export_trace_action.setToolTip('Export the shown (filtered) requests as trace events, '
+                                            'to be loaded in Perfetto or chrome://tracing')
+        self.export_trace_action.triggered.connect(self.export_trace)
+        self.toolbar.addAction(self.export_trace_action)
+        self.waterfall_action = QAction('Waterfall')
+        self.waterfall_action.setToolTip('Show the requests on a time axis')
+        self.waterfall_action.setCheckable(True)
+        self.toolbar.addSeparator()
+        self.toolbar.addAction(self.waterfall_action)
+        self.stats_action = QAction('Statistics')
+        self.stats_action.setToolTip('Show the statistics per host and endpoint')
+        self.stats_action.setCheckable(True)
+        self.toolbar.addAction(self.stats_action)
+        self.exporter = None
 
         self.filter_line_edit = QgsFilterLineEdit()
         self.filter_line_edit.setShowSearchIcon(True)
-        self.filter_line_edit.setPlaceholderText('Filter requests')
+        self.filter_line_edit.setPlaceholderText('Filter requests, e.g. host:example.com status:>=400 time:>500')
+        self.filter_line_edit.setToolTip(FILTER_TOOLTIP)
         self.filter_line_edit.textChanged.connect(self.view.set_filter_string)
+        self.view.proxy_model.filterError.connect(self.filter_error)
         self.l.addWidget(self.toolbar)
         self.l.addWidget(self.filter_line_edit)
-        self.l.addWidget(self.view)
+        # the flat list (and details pane) is only created when first shown
+        self.list_view = None
+        self.details_pane = None
+        self.splitter = None
+        self.stack = QStackedWidget()
+        self.stack.addWidget(self.view)
+        self.l.addWidget(self.stack)
         self.w = QWidget()
         self.w.setLayout(self.l)
         self.setWidget(self.w)
+
+    # slot for the filterError signal of the proxy model
+    def filter_error(self, message):
+        if message:
+            self.filter_line_edit.setStyleSheet('QLineEdit {color: red}')
+            self.filter_line_edit.setToolTip(message)
+        else:
+            self.filter_line_edit.setStyleSheet('')
+            self.filter_line_edit.setToolTip(FILTER_TOOLTIP)
+
+    def set_flat_mode(self, flat):
+        """
+        Show the flat list of requests with the details pane, or the tree
+
+        :param flat: bool
+        """
+        if flat and self.list_view is None:
+            self.create_list_view()
+        self.stack.setCurrentWidget(self.splitter if flat else self.view)
+        self.column_mode_action.setEnabled(not flat)
+
+    def create_list_view(self):
+        self.list_view = RequestListView(RequestListModel(self.logger.store, self))
+        self.list_view.setFont(self.view.font())
+        self.details_pane = RequestDetailsPane(self.logger.store)
+        self.list_view.requestSelected.connect(self.details_pane.show_record)
+        self.splitter = QSplitter(Qt.Vertical)
+        self.splitter.addWidget(self.list_view)
+        self.splitter.addWidget(self.details_pane)
+        self.stack.addWidget(self.splitter)
+
+        # filter the list like the tree
+        self.list_view.set_filter_string(self.filter_line_edit.text())
+        self.list_view.show_successful(self.show_success_action.isChecked())
+        self.list_view.show_timeouts(self.show_timeouts_action.isChecked())
+        self.filter_line_edit.textChanged.connect(self.list_view.set_filter_string)
+        self.show_success_action.toggled.connect(self.list_view.show_successful)
+        self.show_timeouts_action.toggled.connect(self.list_view.show_timeouts)
+
+    def set_archive(self, archive):
+        """
+        :param archive: SessionArchive to browse, or None
+        """
+        self.archive = archive
+        self.archive_action.setEnabled(archive is not None)
+
+    def show_archive_dialog(self):
+        if self.archive is not None:
+            dialog = ArchiveDialog(self.archive, self)
+            dialog.setFont(self.view.font())
+            dialog.exec()
+
+    # slot for the requestSelected signal of the waterfall
+    def select_record(self, record):
+        self.current_view().select_record(record)
+
+    def current_view(self):
+        """
+        :return: the shown view: the ActivityView or the RequestListView
+        """
+        return self.list_view if self.stack.currentWidget() is self.splitter else self.view
+
+    def export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Export trace', '', 'Trace files (*.json)')
+        if not path:
+            return
+        try:
+            write_trace(self.current_view().visible_records(), path)
+        except OSError as e:
+            iface.messageBar().pushWarning('Export trace', str(e))
+            return
+        iface.messageBar().pushSuccess('Export trace', 'Exported to {}'.format(path))
+
+    def export_har(self):
+        if self.exporter is not None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, 'Export HAR', '', 'HAR files (*.har)')
+        if not path:
+            return
+        records = self.current_view().visible_records()
+        progress_dialog = QProgressDialog('Exporting {} requests...'.format(len(records)), 'Cancel',
+                                          0, len(records), self)
+        progress_dialog.setWindowTitle('Export HAR')
+        self.exporter = HarExporter(records, path, self)
+        self.exporter.progress.connect(lambda written, total: progress_dialog.setValue(written))
+        progress_dialog.canceled.connect(self.exporter.cancel)
+        self.exporter.finished.connect(progress_dialog.deleteLater)
+        self.exporter.finished.connect(self.har_exported)
+        self.exporter.start()
+
+    # slot for exporter.finished
+    def har_exported(self, message):
+        if message:
+            iface.messageBar().pushWarning('Export HAR', message)
+        else:
+            iface.messageBar().pushSuccess('Export HAR', 'Exported to {}'.format(self.exporter.path))
+        self.exporter.deleteLater()
+        self.exporter = None
+
+    def show_retention_dialog(self):
+        dialog = RetentionDialog(self.logger.store.retention, ArchiveSettings(), self)
+        if dialog.exec():
+            self.logger.store.retention_changed()
+            self.archiveSettingsChanged.emit()
+
+
+class StatsDock(QgsDockWidget):
+    """
+    The Dock with the summary of the statistics of the StatsEngine: per
+    host (and per endpoint below it) the number of requests, the error rate,
+    the number of canceled requests and time outs, the latency percentiles,
+    the bytes and the throughput.
+    With NumPy, the hosts also show the exact percentiles, the median wait
+    and transfer time, and the latency distribution (as tooltip), over the
+    history of the statistics.
+    Updated when the statistics change, while visible.
+    """
+
+    HEADERS = ['Host / endpoint', 'Requests', 'Errors', 'Canceled', 'Timeouts', 'p50', 'p90', 'p99', 'Wait p50',
+               'Transfer p50', 'Bytes', 'Throughput']
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, engine):
+        super().__init__()
+        self.setWindowTitle('Network Statistics')
+        self.engine = engine
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(self.HEADERS)
+        self.tree.setSortingEnabled(True)
+        self.tree.sortByColumn(1, Qt.DescendingOrder)
+        self.setWidget(self.tree)
+        # QTreeWidgetItem's per host, and per (host, endpoint)
+        self.items = {}
+        self.total_item = QTreeWidgetItem(self.tree)
+        self.engine.statsChanged.connect(self.refresh)
+        self.visibilityChanged.connect(self.refresh)
+        self.refresh()
+
+    @staticmethod
+    def distribution_tooltip(distribution):
+        """
+        :param distribution: list of counts per bucket of DISTRIBUTION_BOUNDS
+        :return: string (html) table of the latency distribution
+        """
+        labels = ['< {} ms'.format(DISTRIBUTION_BOUNDS[0])] + \
+            ['{} - {} ms'.format(low, high) for low, high in zip(DISTRIBUTION_BOUNDS, DISTRIBUTION_BOUNDS[1:])] + \
+            ['>= {} ms'.format(DISTRIBUTION_BOUNDS[-1])]
+        return '<table>{}</table>'.format(''.join('<tr><td>{}</td><td align="right">{}</td></tr>'
+                                                  .format(label, count) for label, count in zip(labels, distribution)))
+
+    @staticmethod
+    def set_texts(item, name, stats, exact=None):
+        """
+        :param item: QTreeWidgetItem to show the stats in
+        :param name: string name of the host or endpoint
+        :param stats: RequestStats
+        :param exact: ExactStats, or None to take the latencies from the
+        histogram of the stats
+        """
+        if exact is None:
+            latencies = [stats.latency.percentile(q) for q in StatsDock.PERCENTILES]
+            phases = [None, None]
+        else:
+            latencies = exact.latencies
+            phases = [exact.wait, exact.transfer]
+            tooltip = StatsDock.distribution_tooltip(exact.distribution)
+            for column in range(5, 8):
+                item.setToolTip(column, tooltip)
+        texts = [name, stats.count, '{:.1%}'.format(stats.error_rate()), stats.canceled, stats.timeouts] + \
+            ['{:.0f} ms'.format(latency) if latency is not None else '' for latency in latencies + phases] + \
+            ['{:.1f} kB'.format(stats.bytes / 1024), '{:.1f} kB/s'.format(stats.throughput() / 1024)]
+        for column, text in enumerate(texts):
+            item.setText(column, str(text))
+        # sort numerically on the number of requests
+        item.setData(1, Qt.DisplayRole, stats.count)
+
+    # slot for engine.statsChanged and visibilityChanged
+    def refresh(self, *args):
+        if not self.isVisible():
+            return
+        if not self.engine.hosts and len(self.items) > 0:
+            # the statistics were reset
+            self.tree.clear()
+            self.items = {}
+            self.total_item = QTreeWidgetItem(self.tree)
+        self.tree.setSortingEnabled(False)
+        # None without NumPy
+        exact = self.engine.exact_stats(self.PERCENTILES) or {}
+        self.set_texts(self.total_item, 'All hosts', self.engine.total(), exact.get(None))
+        for host, host_stats in self.engine.hosts.items():
+            host_item = self.items.get(host)
+            if host_item is None:
+                host_item = self.items[host] = QTreeWidgetItem(self.tree)
+            self.set_texts(host_item, host, host_stats, exact.get(host))
+            for path, stats in host_stats.endpoints.items():
+                item = self.items.get((host, path))
+                if item is None:
+                    item = self.items[(host, path)] = QTreeWidgetItem(host_item)
+                self.set_texts(item, path, stats)
+        self.tree.setSortingEnabled(True)
+
+
+class ArchiveDialog(QDialog):
+    """
+    Dialog to browse the Requests archived in a SessionArchive, newest first,
+    with the details of the selected Request. Older Requests are read from the
+    archive when scrolling down.
+    """
+
+    def __init__(self, archive, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Archived requests')
+        self.model = ArchiveModel(archive, self)
+        self.view = QTreeView()
+        self.view.setRootIsDecorated(False)
+        self.view.setItemsExpandable(False)
+        self.view.setUniformRowHeights(True)
+        self.view.setAllColumnsShowFocus(True)
+        self.view.setModel(self.model)
+        self.view.selectionModel().currentRowChanged.connect(self.current_row_changed)
+        self.details_pane = RequestDetailsPane()
+
+        self.splitter = QSplitter(Qt.Vertical)
+        self.splitter.addWidget(self.view)
+        self.splitter.addWidget(self.details_pane)
+        button_box = QDialogButtonBox(QDialogButtonBox.Close)
+        button_box.rejected.connect(self.reject)
+        self.l = QVBoxLayout()
+        self.l.addWidget(self.splitter)
+        self.l.addWidget(button_box)
+        self.setLayout(self.l)
+        self.resize(800, 600)
+
+    # slot for selectionModel().currentRowChanged
+    def current_row_changed(self, current, previous):
+        self.details_pane.show_record(self.model.record(current.row()) if current.isValid() else None)
+
+
+class RetentionDialog(QDialog):
+    """
+    Dialog to edit the limits of the RetentionPolicy of the ActivityModel,
+    and the ArchiveSettings, which are saved in the QgsSettings upon
+    accepting.
+    """
+
+    def __init__(self, retention, archive_settings, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Retention')
+        self.retention = retention
+        self.archive_settings = archive_settings
+
+        self.max_count_spinbox = QSpinBox()
+        self.max_count_spinbox.setRange(0, 10000000)
+        self.max_count_spinbox.setSpecialValueText('No limit')
+        self.max_count_spinbox.setValue(retention.max_count)
+        self.max_age_spinbox = QSpinBox()
+        self.max_age_spinbox.setRange(0, 7 * 24 * 3600)
+        self.max_age_spinbox.setSuffix(' sec')
+        self.max_age_spinbox.setSpecialValueText('No limit')
+        self.max_age_spinbox.setValue(retention.max_age)
+        self.max_size_spinbox = QSpinBox()
+        self.max_size_spinbox.setRange(0, 100000)
+        self.max_size_spinbox.setSuffix(' MB')
+        self.max_size_spinbox.setSpecialValueText('No limit')
+        self.max_size_spinbox.setValue(retention.max_size)
+        self.max_error_count_spinbox = QSpinBox()
+        self.max_error_count_spinbox.setRange(0, 10000000)
+        self.max_error_count_spinbox.setSpecialValueText('No limit')
+        self.max_error_count_spinbox.setValue(retention.max_error_count)
+        self.stats_history_spinbox = QSpinBox()
+        self.stats_history_spinbox.setRange(0, 10000000)
+        self.stats_history_spinbox.setSingleStep(10000)
+        self.stats_history_spinbox.setSpecialValueText('Off')
+        self.stats_history_spinbox.setValue(retention.stats_history)
+        self.stats_history_spinbox.setToolTip('The times, status and bytes of these last requests are kept '
+                                              '(about 48 bytes per request, needs NumPy) for the exact '
+                                              'statistics')
+        self.archive_checkbox = QCheckBox('Archive finished requests in a database')
+        self.archive_checkbox.setChecked(archive_settings.enabled)
+        self.archive_file_widget = QgsFileWidget()
+        self.archive_file_widget.setStorageMode(QgsFileWidget.SaveFile)
+        self.archive_file_widget.setFilter('SQLite database (*.sqlite)')
+        self.archive_file_widget.setFilePath(archive_settings.path)
+
+        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        button_box.accepted.connect(self.accept)
+        button_box.rejected.connect(self.reject)
+
+        self.l = QFormLayout()
+        self.l.addRow('Maximum number of requests', self.max_count_spinbox)
+        self.l.addRow('Maximum age of requests', self.max_age_spinbox)
+        self.l.addRow('Maximum size of headers and content', self.max_size_spinbox)
+        self.l.addRow('Maximum number of failed requests', self.max_error_count_spinbox)
+        self.l.addRow('Requests in the statistics history', self.stats_history_spinbox)
+        self.l.addRow(self.archive_checkbox)
+        self.l.addRow('Archive database', self.archive_file_widget)
+        self.l.addRow(button_box)
+        self.setLayout(self.l)
+
+    def accept(self):
+        self.retention.max_count = self.max_count_spinbox.value()
+        self.retention.max_age = self.max_age_spinbox.value()
+        self.retention.max_size = self.max_size_spinbox.value()
+        self.retention.max_error_count = self.max_error_count_spinbox.value()
+        self.retention.stats_history = self.stats_history_spinbox.value()
+        self.retention.save()
+        self.archive_settings.enabled = self.archive_checkbox.isChecked()
+        self.archive_settings.path = self.archive_file_widget.filePath()
+        self.archive_settings.save()
+        super().accept()
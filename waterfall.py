@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------
+# Copyright (C) 2019 Richard Duivenvoorde, Nyall Dawson
+# -----------------------------------------------------------
+# Licensed under the terms of GNU GPL 2
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+# ---------------------------------------------------------------------
+
+import time
+
+from qgis.PyQt.QtCore import (
+    Qt,
+    QRectF,
+    QTimer,
+    pyqtSignal
+)
+from qgis.PyQt.QtGui import (
+    QColor,
+    QPainter,
+    QPen
+)
+from qgis.PyQt.QtWidgets import (
+    QAbstractScrollArea
+)
+from qgis.gui import (
+    QgsDockWidget
+)
+
+from .store import (
+    PENDING,
+    ERROR,
+    TIMEOUT
+)
+
+"""
+Height (in pixels) of the row of one Request, and of the time axis
+"""
+ROW_HEIGHT = 8
+AXIS_HEIGHT = 20
+
+"""
+Interval (in msec) in which changes of the store are collected before the
+waterfall is repainted, about 60 frames per second
+"""
+UPDATE_INTERVAL = 16
+
+"""
+Interval (in msec) in which the bars of pending Requests grow
+"""
+PENDING_INTERVAL = 100
+
+"""
+Colors of the phases of the Requests
+"""
+WAITING_COLOR = QColor(150, 190, 235)
+RECEIVING_COLOR = QColor(30, 100, 200)
+PENDING_COLOR = QColor(0, 0, 0, 60)
+FAILED_COLOR = QColor(235, 10, 10)
+SSL_ERRORS_COLOR = QColor(180, 65, 210)
+SELECTED_COLOR = QColor(255, 220, 120)
+
+
+def nice_step(span):
+    """
+    Return a 'nice' (1, 2 or 5 times a power of 10) step for the ticks on
+    the time axis, giving about 10 ticks over the span
+
+    :param span: float span (msec) of the axis
+    :return: float step (msec)
+    """
+    step = 1.0
+    while span / step > 10:
+        for factor in (2, 2.5, 2):
+            step *= factor
+            if span / step <= 10:
+                break
+    return step
+
+
+class WaterfallView(QAbstractScrollArea):
+    """
+    Waterfall of the Requests in the CaptureStore: every Request is a bar on
+    a shared time axis, split in its waiting (up to the first byte) and
+    receiving phase. Failed Requests are red, pending Requests grey (up to
+    now).
+
+    Only the visible rows are painted, and changes of the store are collected
+    for UPDATE_INTERVAL msec before repainting, so it keeps up with thousands
+    of Requests. The rows and the time span follow the signals of the store
+    (the store is not copied or scanned upon a change), and nothing is
+    repainted while the view is hidden. Clicking a bar selects its Request
+    (see requestSelected).
+    """
+
+    # signal with the RequestRecord of the clicked bar
+    requestSelected = pyqtSignal(object)
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        # the records in the store, oldest first, the span of their
+        # timestamps and the ids of the pending ones. Taken from the store
+        # once, and then kept up to date with its signals
+        self.records = []
+        self.first_ns = 0
+        self.last_ns = 0
+        self.pending = set()
+        self.selected = None
+
+        self.update_timer = QTimer(self)
+        self.update_timer.setSingleShot(True)
+        self.update_timer.timeout.connect(self.refresh)
+        self.pending_timer = QTimer(self)
+        self.pending_timer.setInterval(PENDING_INTERVAL)
+        self.pending_timer.timeout.connect(self.viewport().update)
+
+        self.store.requestAdded.connect(self.request_added)
+        self.store.requestFinished.connect(self.request_finished)
+        self.store.requestTimedOut.connect(self.request_finished)
+        self.store.requestProgress.connect(self.schedule_update)
+        self.store.requestsEvicted.connect(self.requests_evicted)
+        self.store.cleared.connect(self.reset)
+
+        self.verticalScrollBar().setSingleStep(ROW_HEIGHT)
+        self.reset()
+
+    def schedule_update(self, *args):
+        # a hidden view is refreshed when it is shown again (see showEvent)
+        if self.isVisible() and not self.update_timer.isActive():
+            self.update_timer.start(UPDATE_INTERVAL)
+
+    # slot for store.cleared
+    def reset(self):
+        """
+        Take all records of the store
+        """
+        self.records = list(self.store.records.values())
+        self.pending = {record.id for record in self.records if record.status == PENDING}
+        self.first_ns = self.records[0].start_ns if self.records else 0
+        self.last_ns = self.span_end()
+        if self.selected is not None and self.selected.id not in self.store.records:
+            self.selected = None
+        self.schedule_update()
+
+    def span_end(self):
+        """
+        :return: the last end_ns of the records, or first_ns if none ended
+        """
+        return max((record.end_ns for record in self.records if record.end_ns is not None), default=self.first_ns)
+
+    # slot for store.requestAdded
+    def request_added(self, record):
+        if not self.records:
+            self.first_ns = self.last_ns = record.start_ns
+        self.records.append(record)
+        if record.status == PENDING:
+            self.pending.add(record.id)
+        self.schedule_update()
+
+    # slot for store.requestFinished and store.requestTimedOut
+    def request_finished(self, record):
+        if record.status != PENDING:
+            self.pending.discard(record.id)
+        if record.end_ns is not None and record.end_ns > self.last_ns:
+            self.last_ns = record.end_ns
+        self.schedule_update()
+
+    # slot for store.requestsEvicted
+    def requests_evicted(self, records):
+        evicted = {record.id for record in records}
+        count = len(evicted)
+        if all(record.id in evicted for record in self.records[:count]):
+            # the oldest Requests were evicted: remove them from the front
+            del self.records[:count]
+        else:
+            self.records = [record for record in self.records if record.id not in evicted]
+        self.pending -= evicted
+        if self.selected is not None and self.selected.id in evicted:
+            self.selected = None
+        if self.records:
+            self.first_ns = self.records[0].start_ns
+            # only look for the new end of the span when the last one is gone
+            if any(record.end_ns is not None and record.end_ns >= self.last_ns for record in records):
+                self.last_ns = self.span_end()
+        else:
+            self.first_ns = self.last_ns = 0
+        self.schedule_update()
+
+    def refresh(self):
+        """
+        Repaint after changes of the store
+        """
+        at_bottom = self.verticalScrollBar().value() >= self.verticalScrollBar().maximum()
+        self.update_scrollbar()
+        if at_bottom:
+            # follow the new Requests
+            self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+        self.viewport().update()
+        # let the pending bars grow (up to now)
+        if self.pending and not self.pending_timer.isActive():
+            self.pending_timer.start()
+        elif not self.pending:
+            self.pending_timer.stop()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_timer.stop()
+        self.pending_timer.stop()
+
+    def update_scrollbar(self):
+        height = self.viewport().height() - AXIS_HEIGHT
+        self.verticalScrollBar().setPageStep(max(height, ROW_HEIGHT))
+        self.verticalScrollBar().setRange(0, max(0, len(self.records) * ROW_HEIGHT - height))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scrollbar()
+
+    def end_ns(self, record, now):
+        if record.end_ns is not None:
+            return record.end_ns
+        if record.timeout_ns is not None:
+            return record.timeout_ns
+        return now
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        width = self.viewport().width()
+        height = self.viewport().height()
+        painter.fillRect(0, 0, width, height, self.palette().base())
+        if not self.records:
+            return
+
+        now = time.perf_counter_ns()
+        last_ns = max(self.last_ns, now) if self.pending else self.last_ns
+        span = max(last_ns - self.first_ns, 1)
+        scale = (width - 1) / span
+
+        # the (visible) bars
+        offset = self.verticalScrollBar().value()
+        first_row = offset // ROW_HEIGHT
+        last_row = min(len(self.records), (offset + height - AXIS_HEIGHT) // ROW_HEIGHT + 1)
+        for row in range(first_row, last_row):
+            record = self.records[row]
+            y = AXIS_HEIGHT + row * ROW_HEIGHT - offset
+            if record is self.selected:
+                painter.fillRect(0, y, width, ROW_HEIGHT, SELECTED_COLOR)
+            x0 = (record.start_ns - self.first_ns) * scale
+            x1 = max((self.end_ns(record, now) - self.first_ns) * scale, x0 + 1)
+            if record.status == PENDING:
+                painter.fillRect(QRectF(x0, y + 1, x1 - x0, ROW_HEIGHT - 2), PENDING_COLOR)
+                continue
+            if record.status in (ERROR, TIMEOUT):
+                color = FAILED_COLOR
+            elif record.ssl_errors:
+                color = SSL_ERRORS_COLOR
+            else:
+                color = RECEIVING_COLOR
+            first_byte = x0
+            if record.first_progress_ns is not None:
+                first_byte = min(max((record.first_progress_ns - self.first_ns) * scale, x0), x1)
+                painter.fillRect(QRectF(x0, y + 1, first_byte - x0, ROW_HEIGHT - 2), WAITING_COLOR)
+            painter.fillRect(QRectF(first_byte, y + 1, max(x1 - first_byte, 1), ROW_HEIGHT - 2), color)
+
+        # the time axis, on top of the bars
+        painter.fillRect(0, 0, width, AXIS_HEIGHT, self.palette().window())
+        painter.setPen(QPen(self.palette().windowText().color()))
+        span_ms = span / 1000000
+        step = nice_step(span_ms)
+        tick = 0.0
+        while tick <= span_ms:
+            x = tick * 1000000 * scale
+            painter.drawLine(int(x), AXIS_HEIGHT - 5, int(x), AXIS_HEIGHT)
+            painter.drawText(int(x) + 2, AXIS_HEIGHT - 6, '{:g} ms'.format(tick) if step < 1000
+                             else '{:g} s'.format(tick / 1000))
+            tick += step
+        painter.drawLine(0, AXIS_HEIGHT - 1, width, AXIS_HEIGHT - 1)
+
+    def mousePressEvent(self, event):
+        if event.button() != Qt.LeftButton or event.pos().y() < AXIS_HEIGHT:
+            return super().mousePressEvent(event)
+        row = (event.pos().y() - AXIS_HEIGHT + self.verticalScrollBar().value()) // ROW_HEIGHT
+        if 0 <= row < len(self.records):
+            self.selected = self.records[row]
+            self.viewport().update()
+            self.requestSelected.emit(self.selected)
+
+
+class WaterfallDock(QgsDockWidget):
+    """
+    The Dock holding the WaterfallView of the Requests
+    """
+
+    def __init__(self, store):
+        super().__init__()
+        self.setWindowTitle('Network Waterfall')
+        self.view = WaterfallView(store)
+        self.setWidget(self.view)